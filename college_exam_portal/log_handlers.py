@@ -0,0 +1,62 @@
+"""
+Non-blocking, structured logging.
+
+QueueLogHandler only puts records on an in-memory queue. A background
+thread formats them and writes them to stderr, so a request never waits on
+a slow terminal or log pipe. JSONFormatter writes one JSON object per line,
+with the fields passed through `extra=` as top-level keys.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueueLogHandler(QueueHandler):
+    """Hands records to a listener thread that writes them to stderr as JSON lines."""
+
+    def __init__(self):
+        super().__init__(queue.SimpleQueue())
+        stream = logging.StreamHandler()
+        stream.setFormatter(JSONFormatter())
+        self.listener = QueueListener(self.queue, stream)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+        # Threads do not survive fork (gunicorn --preload): start one in the child
+        os.register_at_fork(after_in_child=self._restart_listener)
+
+    def _restart_listener(self):
+        self.listener._thread = None
+        self.listener.start()
+
+    def prepare(self, record):
+        # Resolve what cannot cross threads (args, tracebacks) but keep the
+        # exception and `extra=` fields separate for the JSON formatter
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = self.listener.handlers[0].formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
@@ -0,0 +1,173 @@
+"""
+Prometheus metrics.
+
+MetricsMiddleware records, per view: request counts by method and status,
+a latency histogram, the database time and query count, and the number of
+requests in flight. The instrumented cache backends count cache hits and
+misses per key prefix (e.g. "exams:paper"). All of it is served in the
+Prometheus text format at /metrics.
+
+Under gunicorn every worker process has its own counters. Set
+PROMETHEUS_MULTIPROC_DIR to an empty directory before starting gunicorn,
+and prometheus_client keeps the metrics in memory-mapped files there. The
+endpoint then adds them up across all workers, whichever worker answers the
+scrape. gunicorn.conf.py clears the directory at startup and retires a
+worker's gauges when it exits. Without the variable, the endpoint reports
+the process that serves it, which is what runserver needs.
+
+prometheus_client is optional. Without it the middleware is not used, the
+caches behave like the plain backends, and /metrics answers 503.
+"""
+import hmac
+import logging
+import os
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError as e:
+    prometheus_client = None
+    logger.warning(f"prometheus_client import failed, metrics are disabled: {e}")
+
+MULTIPROCESS_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+if prometheus_client is not None:
+    REQUESTS = prometheus_client.Counter(
+        'portal_http_requests_total', 'HTTP requests handled', ['view', 'method', 'status'],
+    )
+    LATENCY = prometheus_client.Histogram(
+        'portal_http_request_duration_seconds', 'Time to produce a response', ['view'], buckets=LATENCY_BUCKETS,
+    )
+    IN_FLIGHT = prometheus_client.Gauge(
+        'portal_http_requests_in_flight', 'Requests being handled', multiprocess_mode='livesum',
+    )
+    DB_TIME = prometheus_client.Histogram(
+        'portal_http_request_db_seconds', 'Database time per request', ['view'], buckets=LATENCY_BUCKETS,
+    )
+    DB_QUERIES = prometheus_client.Counter(
+        'portal_db_queries_total', 'SQL statements run', ['view'],
+    )
+    CACHE_REQUESTS = prometheus_client.Counter(
+        'portal_cache_requests_total', 'Cache lookups', ['prefix', 'result'],
+    )
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unresolved>'
+
+
+class _DatabaseTimer:
+    """execute_wrapper adding up the statements and time of one request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+class MetricsMiddleware:
+    """Request count, latency, database time and in-flight requests per view."""
+
+    def __init__(self, get_response):
+        if prometheus_client is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        database = _DatabaseTimer()
+        status = 500
+        started = time.perf_counter()
+        IN_FLIGHT.inc()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(database))
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            IN_FLIGHT.dec()
+            view = _view_name(request)
+            LATENCY.labels(view).observe(time.perf_counter() - started)
+            REQUESTS.labels(view, request.method, str(status)).inc()
+            DB_TIME.labels(view).observe(database.seconds)
+            if database.queries:
+                DB_QUERIES.labels(view).inc(database.queries)
+
+
+_MISSING = object()
+
+
+def _prefix(key):
+    # "exams:paper:12:3" -> "exams:paper": bounded label values whatever the ids
+    return ':'.join(str(key).split(':')[:2])
+
+
+class CacheMetricsMixin:
+    """Count hits and misses of get() and get_many() by key prefix."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if prometheus_client is not None:
+            CACHE_REQUESTS.labels(_prefix(key), 'miss' if value is _MISSING else 'hit').inc()
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        if prometheus_client is not None:
+            for key in keys:
+                CACHE_REQUESTS.labels(_prefix(key), 'hit' if key in found else 'miss').inc()
+        return found
+
+
+class InstrumentedLocMemCache(CacheMetricsMixin, LocMemCache):
+    pass
+
+
+class InstrumentedRedisCache(CacheMetricsMixin, RedisCache):
+    pass
+
+
+def _allowed(request):
+    """A scrape needs METRICS_TOKEN or an address in METRICS_ALLOWED_IPS; nothing is open by default."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if hmac.compare_digest(supplied.encode(), token.encode()):
+            return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, summed over all workers in multiprocess mode."""
+    if prometheus_client is None:
+        return HttpResponse('prometheus_client is not installed\n', status=503, content_type='text/plain')
+    if not _allowed(request):
+        return HttpResponse(status=403)
+    if MULTIPROCESS_DIR:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return HttpResponse(prometheus_client.generate_latest(registry), content_type=prometheus_client.CONTENT_TYPE_LATEST)
@@ -59,6 +59,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'college_exam_portal.metrics.MetricsMiddleware',  # Only active with prometheus_client installed
+    'users.middleware.QueryProfilingMiddleware',  # Only active with QUERY_PROFILING
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,9 +68,35 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'users.middleware.AccessDeniedMiddleware',  # Add this line
+    'users.middleware.HashingBusyMiddleware',  # 503 when password hashing is saturated
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request SQL profile in a Server-Timing header and the users.queries log
+QUERY_PROFILING = os.environ.get('QUERY_PROFILING', 'False').lower() in ('1', 'true', 'yes', 'on')
+# Statements run this many times in one request are logged as repeated
+QUERY_PROFILING_DUPLICATES = int(os.environ.get('QUERY_PROFILING_DUPLICATES', '2'))
+
+# Metrics at /metrics (see college_exam_portal.metrics). A scrape must carry
+# the bearer token or come from one of the comma-separated allowed addresses;
+# with neither configured, every scrape is refused
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
+# JSON lines on stderr, written by a background thread so requests never block on logging
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'()': 'college_exam_portal.log_handlers.QueueLogHandler'},
+    },
+    'root': {'handlers': ['console'], 'level': os.environ.get('LOG_LEVEL', 'INFO')},
+    'loggers': {
+        'django': {'handlers': ['console'], 'level': os.environ.get('LOG_LEVEL', 'INFO'), 'propagate': False},
+        'users.queries': {'handlers': ['console'], 'level': 'INFO' if QUERY_PROFILING else 'WARNING', 'propagate': False},
+    },
+}
+
 ROOT_URLCONF = 'college_exam_portal.urls'
 
 TEMPLATES = [
@@ -113,6 +141,39 @@ if db_url:
         'PORT': url.port or '5432',
     }
 
+# Cache
+# Set REDIS_URL so cached data (answer keys etc.) is shared between workers
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'college_exam_portal.metrics.InstrumentedRedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'college_exam_portal.metrics.InstrumentedLocMemCache',
+        }
+    }
+# Whether every worker process sees the same cache. Without it each process has
+# its own, so state that must be consistent across workers (the logged-in user,
+# completed quizzes) is not kept in the cache
+CACHE_IS_SHARED = bool(REDIS_URL)
+
+# Exams
+# Seconds a queued submission may wait for the grade_submissions worker before
+# the student's status page grades it itself
+EXAM_GRADING_FALLBACK_SECONDS = int(os.environ.get('EXAM_GRADING_FALLBACK_SECONDS', '10'))
+# Seconds live proctoring beacons are coalesced in memory before being written
+# in bulk (0 writes every beacon straight away)
+EXAM_BEACON_FLUSH_SECONDS = float(os.environ.get('EXAM_BEACON_FLUSH_SECONDS', '5'))
+# Seconds after an attempt's deadline that a submission still counts as on time
+EXAM_SUBMISSION_GRACE_SECONDS = int(os.environ.get('EXAM_SUBMISSION_GRACE_SECONDS', '30'))
+# What later submissions are graded with: 'accept' (the posted answers) or 'blank' (no answers)
+EXAM_LATE_SUBMISSION_POLICY = os.environ.get('EXAM_LATE_SUBMISSION_POLICY', 'blank')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -163,11 +224,42 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'users.CustomUser'
 
 # Authentication backends - add this after AUTH_USER_MODEL
+# EmailOrUsernameModelBackend extends ModelBackend (permissions included); listing
+# ModelBackend as well would hash every failed login a second time
 AUTHENTICATION_BACKENDS = [
     'users.backends.EmailOrUsernameModelBackend',
-    'django.contrib.auth.backends.ModelBackend',
 ]
 
+# New and changed passwords use the first hasher; passwords stored with one of
+# the others are rehashed with it on the user's next successful login.
+# 'scrypt' is memory-hard and in the standard library, 'argon2' needs argon2-cffi
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'scrypt')
+_HASHERS = {
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'bcrypt': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+}
+PASSWORD_HASHERS = [_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _HASHERS.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+# Roster imports (users.roster): processes hashing initial passwords (0 hashes in
+# the importing process) and their scrypt work factor. Initial passwords are
+# rehashed at full cost when each student first logs in
+ROSTER_HASH_WORKERS = int(os.environ.get('ROSTER_HASH_WORKERS', str(os.cpu_count() or 1)))
+ROSTER_PASSWORD_WORK_FACTOR = int(os.environ.get('ROSTER_PASSWORD_WORK_FACTOR', str(2 ** 11)))
+
+# Logged-in users kept in memory per process (see users.user_cache)
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '2048'))
+
+# Password checks running at once per process (default: one per CPU), how many
+# more may queue for a slot, and for how long before the login is answered with
+# 503 and Retry-After (see users.hashing)
+PASSWORD_HASHING_SLOTS = int(os.environ.get('PASSWORD_HASHING_SLOTS', '0')) or os.cpu_count() or 1
+PASSWORD_HASHING_QUEUE = int(os.environ.get('PASSWORD_HASHING_QUEUE', str(4 * PASSWORD_HASHING_SLOTS)))
+PASSWORD_HASHING_WAIT_SECONDS = float(os.environ.get('PASSWORD_HASHING_WAIT_SECONDS', '5'))
+
 # Email settings (from env with safe defaults)
 EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
@@ -176,6 +268,15 @@ EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True').lower() in ('1', 'true',
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', 'your-email@gmail.com')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', 'your-app-password')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER)
+# Where django.core.mail.backends.filebased.EmailBackend writes, for trying email locally
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', str(BASE_DIR / 'sent_emails'))
+
+# Outgoing email is queued and sent by `manage.py send_outbox` (see users.outbox).
+# A failed message is retried after EMAIL_OUTBOX_RETRY_SECONDS, doubling each
+# time up to the maximum, and is dead-lettered after EMAIL_OUTBOX_MAX_ATTEMPTS
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '6'))
+EMAIL_OUTBOX_RETRY_SECONDS = int(os.environ.get('EMAIL_OUTBOX_RETRY_SECONDS', '60'))
+EMAIL_OUTBOX_MAX_RETRY_SECONDS = int(os.environ.get('EMAIL_OUTBOX_MAX_RETRY_SECONDS', '3600'))
 
 # Supabase settings
 SUPABASE_URL = os.environ.get('SUPABASE_URL', '')
@@ -0,0 +1,30 @@
+from unittest import skipIf
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .metrics import prometheus_client
+
+
+@skipIf(prometheus_client is None, 'prometheus_client is not installed')
+class MetricsAccessTests(TestCase):
+    """/metrics is closed unless a token or an allowed address is configured."""
+
+    def scrape(self, address='127.0.0.1', **headers):
+        return self.client.get(reverse('metrics'), REMOTE_ADDR=address, headers=headers).status_code
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=[])
+    def test_closed_by_default(self):
+        self.assertEqual(self.scrape(), 403)
+        self.assertEqual(self.scrape('::1'), 403)
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_allowed_addresses(self):
+        self.assertEqual(self.scrape('10.0.0.5'), 200)
+        self.assertEqual(self.scrape('127.0.0.1'), 403)
+
+    @override_settings(METRICS_TOKEN='s3cret', METRICS_ALLOWED_IPS=[])
+    def test_bearer_token(self):
+        self.assertEqual(self.scrape('203.0.113.9', Authorization='Bearer s3cret'), 200)
+        self.assertEqual(self.scrape('203.0.113.9', Authorization='Bearer guess'), 403)
+        self.assertEqual(self.scrape('203.0.113.9'), 403)
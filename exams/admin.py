@@ -1,13 +1,28 @@
 from django.contrib import admin
-from .models import Quiz, Question, Result
+from .models import Quiz, Question, Result, PendingSubmission, ViolationEvent
+from .grading import invalidate_answer_key
+from .papers import cache_paper
 
 class QuestionInline(admin.TabularInline):
     model = Question
     extra = 1
 
 class QuizAdmin(admin.ModelAdmin):
-    list_display = ('title', 'creator', 'duration', 'created_at')
+    list_display = ('title', 'creator', 'duration', 'question_count', 'total_marks', 'created_at')
     inlines = [QuestionInline]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        invalidate_answer_key(form.instance)
+        cache_paper(form.instance)
+
 admin.site.register(Quiz, QuizAdmin)
 admin.site.register(Result)
+admin.site.register(PendingSubmission)
+
+class ViolationEventAdmin(admin.ModelAdmin):
+    list_display = ('user', 'quiz', 'event_type', 'count', 'occurred_at')
+    list_filter = ('event_type',)
+    list_select_related = ('user', 'quiz')
+
+admin.site.register(ViolationEvent, ViolationEventAdmin)
@@ -0,0 +1,123 @@
+"""
+Stored answer sheets.
+
+Every graded attempt keeps the options the student picked in Result.answers:
+one byte per question (0 = unanswered, 1-4 = option) in the column order of
+the answer key it was graded against, with that key's version in
+Result.quiz_version. 100k attempts of a 50-question paper hold 5 MB of
+answers; see `manage.py bench_answer_sheets` for measured numbers.
+
+load_response_matrix() turns all sheets of a quiz into one
+(attempts x questions) uint8 matrix laid out like the current answer key.
+Sheets graded against older versions are remapped by question id through
+their AnswerKeySnapshot; questions added since then read as unanswered and
+are excluded from that attempt's available marks, as are questions marked
+NOT_SERVED because they were not drawn for the student's paper.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+from .grading import NOT_SERVED, AnswerKey, get_answer_key
+from .models import AnswerKeySnapshot, Result
+
+
+def pack_answers(selected):
+    """Encode an array of selected options as a sheet."""
+    return np.asarray(selected, dtype=np.uint8).tobytes()
+
+
+@dataclass
+class ResponseMatrix:
+    key: AnswerKey
+    result_ids: np.ndarray
+    matrix: np.ndarray
+    # One row per distinct sheet layout: which current questions it contained
+    layouts: np.ndarray
+    # Index into `layouts` for every row of `matrix`
+    layout_index: np.ndarray
+
+    def __len__(self):
+        return len(self.result_ids)
+
+    def present(self):
+        """(attempts x questions) mask of the questions each attempt was actually given."""
+        return self.layouts[self.layout_index] & (self.matrix != NOT_SERVED)
+
+    def available_marks(self):
+        """Total marks of the questions each attempt was actually given."""
+        return self.present() @ self.key.marks.astype(np.int64)
+
+
+def load_response_matrix(quiz):
+    """Load every stored sheet of `quiz` as a ResponseMatrix."""
+    key = get_answer_key(quiz)
+    width = len(key)
+    rows = Result.objects.filter(quiz=quiz, answers__isnull=False).values_list('id', 'quiz_version', 'answers')
+
+    groups = {}
+    for result_id, version, answers in rows.iterator(chunk_size=5000):
+        ids, sheets = groups.setdefault(version, ([], []))
+        ids.append(result_id)
+        sheets.append(answers)
+
+    old_versions = [version for version in groups if version != key.version]
+    snapshots = {
+        snapshot.version: AnswerKey.from_snapshot(snapshot)
+        for snapshot in AnswerKeySnapshot.objects.filter(quiz=quiz, version__in=old_versions)
+    } if old_versions else {}
+
+    result_ids, blocks, layouts, layout_index = [], [], [], []
+    for version, (ids, sheets) in groups.items():
+        if version == key.version:
+            block = _decode(sheets, width)
+            present = np.ones(width, dtype=bool)
+        elif version in snapshots:
+            old_key = snapshots[version]
+            block = _decode(sheets, len(old_key))
+            if block is not None:
+                block, present = _remap(block, old_key.question_ids, key.question_ids)
+        else:
+            continue
+        if block is None:
+            continue
+        result_ids.append(np.array(ids, dtype=np.int64))
+        blocks.append(block)
+        layout_index.append(np.full(len(ids), len(layouts), dtype=np.int32))
+        layouts.append(present)
+
+    if not blocks:
+        return ResponseMatrix(
+            key, np.empty(0, dtype=np.int64), np.empty((0, width), dtype=np.uint8),
+            np.ones((1, width), dtype=bool), np.empty(0, dtype=np.int32),
+        )
+    return ResponseMatrix(
+        key, np.concatenate(result_ids), np.concatenate(blocks),
+        np.array(layouts, dtype=bool).reshape(len(layouts), width), np.concatenate(layout_index),
+    )
+
+
+def _decode(sheets, width):
+    data = np.frombuffer(b''.join(sheets), dtype=np.uint8)
+    if width == 0 or data.size != width * len(sheets):
+        return None
+    return data.reshape(len(sheets), width)
+
+
+def _remap(block, old_ids, new_ids):
+    """
+    Move columns of `block` from the `old_ids` layout to the `new_ids` layout.
+    Returns the new block and a mask of the new columns the old layout had.
+    """
+    out = np.zeros((block.shape[0], len(new_ids)), dtype=np.uint8)
+    present = np.zeros(len(new_ids), dtype=bool)
+    if len(new_ids) == 0:
+        return out, present
+    order = np.argsort(new_ids)
+    positions = np.searchsorted(new_ids, old_ids, sorter=order)
+    positions = np.minimum(positions, len(new_ids) - 1)
+    columns = order[positions]
+    found = new_ids[columns] == old_ids
+    out[:, columns[found]] = block[:, found]
+    present[columns[found]] = True
+    return out, present
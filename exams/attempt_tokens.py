@@ -0,0 +1,93 @@
+"""
+Signed attempt tokens: the server-side exam clock.
+
+Opening quiz_attempt issues a token, signed with SECRET_KEY, that records
+who is attempting which quiz, when they started, their deadline and a
+nonce. The answers are posted back with the token, and the deadline is
+checked from the token alone: one HMAC, no database read, no session write
+and no timer requests while the attempt runs. The countdown on the page only
+displays the same deadline.
+
+The start of an attempt is pinned in an AttemptStart row the first time the
+page is opened, so reloading the page, opening a second tab or landing on
+another web worker gets a token with the same deadline instead of
+restarting the clock. Once a submission is queued, the database's
+one-submission-per-attempt constraints take over.
+
+A submission that arrives after the deadline plus
+EXAM_SUBMISSION_GRACE_SECONDS is late. The grace period covers the network
+latency of the auto-submit. A late submission is recorded with the 'late'
+reason and handled according to EXAM_LATE_SUBMISSION_POLICY: 'accept'
+grades the answers as posted, 'blank' grades it with no answers. A missing,
+tampered or foreign token is rejected; the answers are not queued.
+"""
+import secrets
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core import signing
+
+from .models import AttemptStart
+
+TOKEN_SALT = 'exams.attempt'
+LATE_POLICIES = ('accept', 'blank')
+
+
+@dataclass(frozen=True)
+class AttemptToken:
+    user_id: int
+    quiz_id: int
+    started_at: int  # Unix seconds
+    deadline: int  # Unix seconds
+    nonce: str
+
+    def seconds_left(self, now=None):
+        return max(0, self.deadline - int(now if now is not None else time.time()))
+
+    def is_late(self, now=None):
+        now = now if now is not None else time.time()
+        return now > self.deadline + settings.EXAM_SUBMISSION_GRACE_SECONDS
+
+
+def issue_attempt_token(user, quiz, now=None):
+    """Return (signed token, AttemptToken) for `user`'s attempt at `quiz`, starting the clock if needed."""
+    now = int(now if now is not None else time.time())
+    # Insert-or-keep, then read: two queries whether or not the clock was already running
+    AttemptStart.objects.bulk_create([AttemptStart(
+        user=user, quiz=quiz, started_at=datetime.fromtimestamp(now, timezone.utc), nonce=secrets.token_urlsafe(12),
+    )], ignore_conflicts=True)
+    start = AttemptStart.objects.get(user=user, quiz=quiz)
+    started_at = int(start.started_at.timestamp())
+    attempt = AttemptToken(user.pk, quiz.pk, started_at, started_at + quiz.duration * 60, start.nonce)
+    token = signing.dumps(
+        [attempt.user_id, attempt.quiz_id, attempt.started_at, attempt.deadline, attempt.nonce],
+        salt=TOKEN_SALT,
+    )
+    return token, attempt
+
+
+def read_attempt_token(token, user, quiz):
+    """Return the AttemptToken in `token` if it is genuine and belongs to `user` and `quiz`, else None."""
+    try:
+        user_id, quiz_id, started_at, deadline, nonce = signing.loads(token or '', salt=TOKEN_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if user_id != user.pk or quiz_id != quiz.pk:
+        return None
+    return AttemptToken(user_id, quiz_id, started_at, deadline, nonce)
+
+
+def late_submission(data):
+    """The posted fields to queue for a late submission, according to EXAM_LATE_SUBMISSION_POLICY."""
+    data = dict(data.items())
+    data['submission_reason'] = 'late'
+    if settings.EXAM_LATE_SUBMISSION_POLICY == 'blank':
+        data = {key: value for key, value in data.items() if not (key[:1] == 'q' and key[1:].isdigit())}
+    return data
+
+
+def forget_attempt(user_id, quiz_id):
+    """Drop the pinned start time once the attempt has been submitted."""
+    AttemptStart.objects.filter(user_id=user_id, quiz_id=quiz_id).delete()
@@ -0,0 +1,63 @@
+"""
+Attempt status lookups for students.
+
+Each student's set of completed quiz ids is cached. Pages that list quizzes
+use it to skip the Result query entirely when nothing on the page was
+attempted, and otherwise fetch all needed results with one query.
+
+Grading drops the set after its results are committed, and the next read
+rebuilds it from the database. The set may over-report (e.g. after a Result
+is deleted), so it is only used to narrow the query, not to answer it. It
+must never under-report, which only a cache shared by every process can
+promise (the grading worker runs in its own process), so with a
+per-process cache (CACHE_IS_SHARED off) the Result query always runs.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Result
+
+COMPLETED_TIMEOUT = 60 * 60 * 24
+
+
+def _completed_key(user_id):
+    return f'exams:completed:{user_id}'
+
+
+def completed_quiz_ids(user):
+    """Return the set of quiz ids `user` has a Result for."""
+    quiz_ids = cache.get(_completed_key(user.pk))
+    if quiz_ids is None:
+        quiz_ids = frozenset(Result.objects.filter(user=user).values_list('quiz_id', flat=True))
+        cache.set(_completed_key(user.pk), quiz_ids, COMPLETED_TIMEOUT)
+    return quiz_ids
+
+
+def forget_completed(user_ids):
+    """Drop the cached sets of users who have new results; call once they are committed."""
+    cache.delete_many([_completed_key(user_id) for user_id in user_ids])
+
+
+def attach_attempts(user, quizzes):
+    """
+    Set `quiz.user_results` (the user's Result or None) on every quiz.
+
+    Costs at most one set rebuild and one Result query, regardless of how
+    many quizzes are passed. Returns the quizzes as a list.
+    """
+    quizzes = list(quizzes)
+    if settings.CACHE_IS_SHARED:
+        completed = completed_quiz_ids(user)
+        attempted = [quiz.pk for quiz in quizzes if quiz.pk in completed]
+    else:
+        attempted = [quiz.pk for quiz in quizzes]
+
+    results = {}
+    if attempted:
+        results = {
+            result.quiz_id: result
+            for result in Result.objects.filter(user=user, quiz_id__in=attempted)
+        }
+    for quiz in quizzes:
+        quiz.user_results = results.get(quiz.pk)
+    return quizzes
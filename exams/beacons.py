@@ -0,0 +1,106 @@
+"""
+Live proctoring beacons.
+
+While an attempt is running, the page sends its cumulative violation counts
+to the beacon endpoint every few seconds (and when the page is hidden or
+closed, via navigator.sendBeacon). Beacons are not written one by one:
+each process coalesces them in memory, keyed by (quiz, student, event type)
+so a student who reports ten times before a flush is one row, and a
+background thread flushes everything in one bulk merge every
+EXAM_BEACON_FLUSH_SECONDS. A full hall therefore costs a couple of queries
+per flush instead of one INSERT per beacon.
+
+Counts are cumulative, so a beacon lost in a crash is repaired by the next
+one or by the security data posted with the answers.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .models import Quiz
+from .violations import build_violation_events, save_violation_events
+
+logger = logging.getLogger(__name__)
+
+BEACON_MAX_BYTES = 4096
+MAX_PENDING = 20000
+
+
+class BeaconBuffer:
+    """In-process buffer of violation counts waiting to be written."""
+
+    def __init__(self, flush_interval, max_pending=MAX_PENDING, autostart=True):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.autostart = autostart
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, user_id, quiz_id, raw):
+        """Coalesce one beacon payload. Returns the number of event types it carried."""
+        events = build_violation_events(user_id, quiz_id, None, raw)
+        full = self._coalesce(events)
+        if self.flush_interval <= 0 or full:
+            self.flush()
+        elif self.autostart:
+            self._start()
+        return len(events)
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                events, self._pending = list(self._pending.values()), {}
+            if not events:
+                return 0
+            try:
+                # Beacons are accepted without a query, so drop any for quizzes that do not exist
+                quizzes = set(Quiz.objects.filter(pk__in={event.quiz_id for event in events}).values_list('pk', flat=True))
+                return save_violation_events([event for event in events if event.quiz_id in quizzes])
+            except Exception:
+                # Keep the counts for the next flush
+                self._coalesce(events)
+                raise
+
+    def _coalesce(self, events):
+        """Merge events into the buffer. Returns True when the buffer is full."""
+        with self._lock:
+            for event in events:
+                key = (event.quiz_id, event.user_id, event.event_type)
+                pending = self._pending.get(key)
+                if pending is None:
+                    self._pending[key] = event
+                else:
+                    pending.occurred_at = min(pending.occurred_at, event.occurred_at)
+                    pending.count = max(pending.count, event.count)
+            return len(self._pending) >= self.max_pending
+
+    def _start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='beacon-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                logger.exception('Flushing proctoring beacons failed')
+            finally:
+                connection.close()
+
+
+buffer = BeaconBuffer(settings.EXAM_BEACON_FLUSH_SECONDS)
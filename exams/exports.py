@@ -0,0 +1,149 @@
+"""
+Streaming results exports.
+
+Rows are read as plain tuples from a single joined query (no model instances,
+no per-row user or quiz lookups) through QuerySet.iterator(), so the database
+hands them over in chunks (a server-side cursor on PostgreSQL) and never more than one chunk is
+held in memory. Both formats are produced incrementally: CSV text is flushed
+every few hundred rows, and XLSX is written as a ZIP stream whose worksheet
+is deflated on the fly, so the first bytes leave before the query finishes
+and memory stays flat however many results are exported.
+"""
+import csv
+import io
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .models import SUBMISSION_REASONS
+
+EXPORT_CHUNK_SIZE = 2000
+FLUSH_ROWS = 500
+
+EXPORT_HEADER = ('Username', 'Full name', 'Department', 'Quiz', 'Score (%)', 'Status', 'Submission', 'Completed at')
+
+
+def export_rows(results):
+    """Yield one tuple per result, in EXPORT_HEADER order."""
+    reasons = dict(SUBMISSION_REASONS)
+    rows = results.order_by('id').values_list(
+        'user__username', 'user__first_name', 'user__last_name', 'user__department',
+        'quiz__title', 'score', 'passed', 'submission_reason', 'completed_at',
+    )
+    for username, first_name, last_name, department, title, score, passed, reason, completed_at in rows.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        yield (
+            username,
+            f'{first_name} {last_name}'.strip(),
+            department or '',
+            title,
+            score,
+            'Passed' if passed else 'Failed',
+            reasons.get(reason, reason),
+            timezone.localtime(completed_at).strftime('%Y-%m-%d %H:%M'),
+        )
+
+
+def stream_csv(rows):
+    """Encode rows as CSV, yielding a chunk every FLUSH_ROWS rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADER)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ZipBuffer:
+    """Write-only file object for ZipFile; zipfile streams to it since it cannot seek."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+_XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Results" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c><v>{value}</v></c>')
+        else:
+            cells.append(f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+    return f'<row>{"".join(cells)}</row>'
+
+
+def stream_xlsx(rows):
+    """Encode rows as a single-sheet XLSX workbook, yielding bytes as they are compressed."""
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_STATIC.items():
+            workbook.writestr(name, content)
+        yield from buffer.drain()
+
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(EXPORT_HEADER).encode())
+            lines = []
+            for row in rows:
+                lines.append(_xlsx_row(row))
+                if len(lines) == FLUSH_ROWS:
+                    sheet.write(''.join(lines).encode())
+                    lines = []
+                    yield from buffer.drain()
+            sheet.write(''.join(lines).encode())
+            sheet.write(b'</sheetData></worksheet>')
+    yield from buffer.drain()
@@ -1,23 +1,109 @@
 from django import forms
-from .models import Quiz, Question
+from .models import Quiz, Question, ViolationEvent, parse_tags
+from .question_io import FORMAT_CHOICES, detect_format
 
 class QuizForm(forms.ModelForm):
     class Meta:
         model = Quiz
-        fields = ['title', 'description', 'duration', 'passing_score']
+        fields = ['title', 'description', 'duration', 'passing_score', 'draw_count', 'draw_tags', 'shuffle_options']
         widgets = {
             'title': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter quiz title'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Enter quiz description'}),
             'duration': forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'placeholder': 'Duration in minutes'}),
             'passing_score': forms.NumberInput(attrs={'class': 'form-control', 'min': 0, 'max': 100, 'placeholder': 'Passing score percentage'}),
+            'draw_count': forms.NumberInput(attrs={'class': 'form-control', 'min': 0, 'placeholder': '0 = all questions'}),
+            'draw_tags': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. algebra, geometry (blank = any)'}),
+            'shuffle_options': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
+    def clean_draw_tags(self):
+        return ','.join(parse_tags(self.cleaned_data['draw_tags']))
+
 class QuestionForm(forms.ModelForm):
     class Meta:
         model = Question
-        fields = ['text', 'option_1', 'option_2', 'option_3', 'option_4', 'correct_answer', 'marks']
+        fields = ['text', 'option_1', 'option_2', 'option_3', 'option_4', 'correct_answer', 'marks', 'tags']
 
 QuestionFormSet = forms.inlineformset_factory(
     Quiz, Question, form=QuestionForm,
     extra=1, can_delete=True, min_num=1
 )
+
+class QuestionImportForm(forms.Form):
+    """Upload of a question file; the format is guessed from the file name when not given."""
+    file = forms.FileField(widget=forms.ClearableFileInput(attrs={'class': 'form-control'}))
+    file_format = forms.ChoiceField(
+        choices=[('', 'Detect from file name')] + FORMAT_CHOICES, required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = cleaned_data.get('file')
+        if upload and not cleaned_data.get('file_format'):
+            cleaned_data['file_format'] = detect_format(upload.name)
+            if not cleaned_data['file_format']:
+                self.add_error('file_format', 'Could not tell the format from the file name; please choose one.')
+        return cleaned_data
+
+class ResultFilterForm(forms.Form):
+    """Filters for the results report and its CSV/XLSX exports."""
+    STATUS_CHOICES = [('', 'Any status'), ('passed', 'Passed'), ('failed', 'Failed')]
+
+    quiz = forms.ModelChoiceField(queryset=Quiz.objects.none(), required=False, empty_label='All quizzes',
+                                  widget=forms.Select(attrs={'class': 'form-select'}))
+    department = forms.ChoiceField(required=False, widget=forms.Select(attrs={'class': 'form-select'}))
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    status = forms.ChoiceField(choices=STATUS_CHOICES, required=False, widget=forms.Select(attrs={'class': 'form-select'}))
+
+    def __init__(self, *args, quizzes, departments, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['quiz'].queryset = quizzes
+        self.fields['department'].choices = [('', 'All departments')] + [(d, d) for d in departments]
+
+    def filter(self, results):
+        """Apply the cleaned filters to a Result queryset."""
+        data = self.cleaned_data
+        if data.get('quiz'):
+            results = results.filter(quiz=data['quiz'])
+        if data.get('department'):
+            results = results.filter(user__department=data['department'])
+        if data.get('date_from'):
+            results = results.filter(completed_at__date__gte=data['date_from'])
+        if data.get('date_to'):
+            results = results.filter(completed_at__date__lte=data['date_to'])
+        if data.get('status'):
+            results = results.filter(passed=data['status'] == 'passed')
+        return results
+
+class ViolationFilterForm(forms.Form):
+    """Filters and grouping for the proctoring violations report."""
+    GROUP_CHOICES = [('quiz', 'By quiz'), ('student', 'By student'), ('department', 'By department')]
+
+    group = forms.ChoiceField(choices=GROUP_CHOICES, required=False, widget=forms.Select(attrs={'class': 'form-select'}))
+    quiz = forms.ModelChoiceField(queryset=Quiz.objects.none(), required=False, empty_label='All quizzes',
+                                  widget=forms.Select(attrs={'class': 'form-select'}))
+    event_type = forms.ChoiceField(choices=[('', 'Any violation')] + ViolationEvent.EVENT_TYPES, required=False,
+                                   widget=forms.Select(attrs={'class': 'form-select'}))
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    min_total = forms.IntegerField(required=False, min_value=0, label='More than',
+                                   widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'violations'}))
+
+    def __init__(self, *args, quizzes, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['quiz'].queryset = quizzes
+
+    def filter(self, events):
+        """Apply the cleaned filters to a ViolationEvent queryset."""
+        data = self.cleaned_data
+        if data.get('quiz'):
+            events = events.filter(quiz=data['quiz'])
+        if data.get('event_type'):
+            events = events.filter(event_type=data['event_type'])
+        if data.get('date_from'):
+            events = events.filter(occurred_at__date__gte=data['date_from'])
+        if data.get('date_to'):
+            events = events.filter(occurred_at__date__lte=data['date_to'])
+        return events
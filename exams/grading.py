@@ -0,0 +1,184 @@
+"""
+Compiled answer keys used to grade quiz submissions.
+
+A key holds only what grading needs (question ids, correct options and marks)
+as compact NumPy arrays. Keys are cached per quiz version, in-process and in
+the shared Django cache, so a submission normally runs no question queries.
+Every compiled version is also recorded as an AnswerKeySnapshot, which is
+what stored answer sheets are decoded against.
+
+For quizzes that draw from a tagged bank, the key covers the questions that
+can be drawn; questions a student was not given read as NOT_SERVED and do
+not count towards their total (see exams.papers).
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.core.cache import cache
+
+from .models import AnswerKeySnapshot, Question, Quiz, parse_tags
+
+ANSWER_KEY_TIMEOUT = 60 * 60 * 12
+LOCAL_KEY_LIMIT = 256
+# Selected-option value of a question that was not on the student's paper
+NOT_SERVED = 255
+
+_local_keys = OrderedDict()
+_local_lock = threading.Lock()
+
+
+class AnswerKey:
+    """Answer key for one version of a quiz."""
+
+    __slots__ = ('quiz_id', 'version', 'question_ids', 'correct', 'marks', 'total_marks')
+
+    def __init__(self, quiz_id, version, question_ids, correct, marks):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.question_ids = question_ids
+        self.correct = correct
+        self.marks = marks
+        self.total_marks = int(marks.sum())
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+    def selected_options(self, data):
+        """Read the chosen option (0 when unanswered or invalid) for every question."""
+        return np.fromiter(
+            (_parse_option(data.get(f'q{question_id}')) for question_id in self.question_ids.tolist()),
+            dtype=np.uint8,
+            count=len(self.question_ids),
+        )
+
+    def score(self, selected):
+        """
+        Score an array of selected options. Returns (score, total_marks, correct_answers),
+        where total_marks only counts the questions that were served.
+        """
+        hits = selected == self.correct
+        served = selected != NOT_SERVED
+        total_marks = self.total_marks if served.all() else int(self.marks[served].sum())
+        return int(self.marks[hits].sum()), total_marks, int(hits.sum())
+
+    def grade(self, data):
+        """
+        Score a submission. Returns (score, total_marks, correct_answers).
+        """
+        return self.score(self.selected_options(data))
+
+    def snapshot_fields(self):
+        return {
+            'question_ids': self.question_ids.astype('<i8').tobytes(),
+            'correct': self.correct.astype(np.uint8).tobytes(),
+            'marks': self.marks.astype('<i4').tobytes(),
+        }
+
+    def matches(self, snapshot):
+        return all(
+            bytes(getattr(snapshot, name)) == value for name, value in self.snapshot_fields().items()
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(
+            snapshot.quiz_id,
+            snapshot.version,
+            np.frombuffer(bytes(snapshot.question_ids), dtype='<i8').astype(np.int64),
+            np.frombuffer(bytes(snapshot.correct), dtype=np.uint8).astype(np.int8),
+            np.frombuffer(bytes(snapshot.marks), dtype='<i4').astype(np.int32),
+        )
+
+
+def _parse_option(value):
+    try:
+        option = int(value)
+    except (TypeError, ValueError):
+        return 0
+    return option if 1 <= option <= 4 else 0
+
+
+def _cache_key(quiz_id, version):
+    return f'exams:answer_key:{quiz_id}:{version}'
+
+
+def compile_answer_key(quiz):
+    """
+    Build the answer key for the current version of `quiz` from the database
+    and record it as that version's AnswerKeySnapshot.
+    """
+    key = _key_from_questions(quiz)
+    snapshot, created = AnswerKeySnapshot.objects.get_or_create(
+        quiz_id=quiz.pk, version=quiz.version, defaults=key.snapshot_fields(),
+    )
+    if not created and not key.matches(snapshot):
+        # Questions were changed without a version bump (e.g. from the shell);
+        # give the new key its own version so stored sheets stay decodable.
+        Quiz.objects.filter(pk=quiz.pk, version=quiz.version).update(version=quiz.version + 1)
+        quiz.refresh_from_db(fields=['version'])
+        return compile_answer_key(quiz)
+    return key
+
+
+def _key_from_questions(quiz):
+    rows = Question.objects.filter(quiz_id=quiz.pk).order_by('id').values_list('id', 'correct_answer', 'marks', 'tags')
+    draw_tags = set(parse_tags(quiz.draw_tags))
+    rows = [row[:3] for row in rows if not draw_tags or draw_tags.intersection(parse_tags(row[3]))]
+    if rows:
+        question_ids, correct, marks = zip(*rows)
+    else:
+        question_ids, correct, marks = (), (), ()
+    return AnswerKey(
+        quiz.pk,
+        quiz.version,
+        np.array(question_ids, dtype=np.int64),
+        np.array(correct, dtype=np.int8),
+        np.array(marks, dtype=np.int32),
+    )
+
+
+def get_answer_key(quiz):
+    """Return the cached answer key for `quiz`, compiling it on first use."""
+    local_key = (quiz.pk, quiz.version)
+    with _local_lock:
+        key = _local_keys.get(local_key)
+        if key is not None:
+            _local_keys.move_to_end(local_key)
+            return key
+
+    key = cache.get(_cache_key(quiz.pk, quiz.version))
+    if key is None:
+        key = compile_answer_key(quiz)
+        cache.set(_cache_key(quiz.pk, key.version), key, ANSWER_KEY_TIMEOUT)
+
+    with _local_lock:
+        _local_keys[(quiz.pk, key.version)] = key
+        while len(_local_keys) > LOCAL_KEY_LIMIT:
+            _local_keys.popitem(last=False)
+    return key
+
+
+def _forget(quiz_id, version):
+    cache.delete(_cache_key(quiz_id, version))
+    with _local_lock:
+        for local_key in [k for k in _local_keys if k[0] == quiz_id]:
+            del _local_keys[local_key]
+
+
+def invalidate_answer_key(quiz):
+    """Drop the cached key and move `quiz` to a new version."""
+    _forget(quiz.pk, quiz.version)
+    quiz.bump_version()
+
+
+def discard_answer_key(quiz):
+    """Drop cached keys for a quiz that is about to be deleted."""
+    _forget(quiz.pk, quiz.version)
@@ -0,0 +1,146 @@
+"""
+Item analysis for quizzes.
+
+Statistics are kept as sufficient sums over the response matrix, so they can
+be built in one vectorized pass and then extended batch by batch as new
+attempts are graded instead of being recomputed:
+
+- difficulty: share of attempts that answered the question correctly
+- discrimination: point-biserial correlation between answering the question
+  correctly and the number of correct answers on the paper
+- distractors: how often each option (and no answer) was picked
+- KR-20 reliability of the whole paper
+
+Everything is counted in correct answers (not marks), as classical test
+theory expects. Stats are cached per quiz version; a cheap row count tells
+when the cache missed attempts and a full recompute is needed.
+"""
+import math
+from dataclasses import dataclass
+
+import numpy as np
+from django.core.cache import cache
+
+from .answer_sheets import load_response_matrix
+from .grading import NOT_SERVED
+from .models import Result
+
+ITEM_STATS_TIMEOUT = 60 * 60 * 24
+OPTION_LABELS = ('Blank', 'A', 'B', 'C', 'D')
+
+
+def _stats_key(quiz_id, version):
+    return f'exams:item_stats:{quiz_id}:{version}'
+
+
+@dataclass
+class ItemStats:
+    version: int
+    question_ids: list
+    rows_seen: int
+    n: int
+    exposed: np.ndarray        # attempts that were given each question
+    option_counts: np.ndarray  # (questions, 5): blank, option 1-4
+    correct_counts: np.ndarray
+    sum_x: float               # sums of x = number correct per attempt
+    sum_x2: float
+    sum_xy: np.ndarray         # sum of x over attempts that got each question right
+
+    @classmethod
+    def empty(cls, version, question_ids):
+        width = len(question_ids)
+        return cls(
+            version, list(question_ids), 0, 0, np.zeros(width, dtype=np.int64), np.zeros((width, 5), dtype=np.int64),
+            np.zeros(width, dtype=np.int64), 0.0, 0.0, np.zeros(width, dtype=np.float64),
+        )
+
+    def add(self, matrix, correct, present=None):
+        """
+        Fold a block of answer sheets (rows of selected options) into the sums.
+        `present` masks the questions each attempt was given; by default every
+        question that is not NOT_SERVED.
+        """
+        if not len(matrix):
+            return
+        if present is None:
+            present = matrix != NOT_SERVED
+        hits = matrix == correct.astype(np.uint8)
+        x = hits.sum(axis=1).astype(np.float64)
+        self.n += len(matrix)
+        self.exposed += present.sum(axis=0)
+        self.option_counts += np.stack([(matrix == option).sum(axis=0) for option in range(5)], axis=1)
+        self.correct_counts += hits.sum(axis=0)
+        self.sum_x += float(x.sum())
+        self.sum_x2 += float((x * x).sum())
+        self.sum_xy += x @ hits
+
+    def reliability(self):
+        """KR-20 of the paper, or None when it is undefined."""
+        k = len(self.exposed)
+        if self.n < 2 or k < 2:
+            return None
+        variance = self.sum_x2 / self.n - (self.sum_x / self.n) ** 2
+        if variance <= 0:
+            return None
+        p = self.correct_counts / np.maximum(self.exposed, 1)
+        return float(k / (k - 1) * (1 - (p * (1 - p)).sum() / variance))
+
+    def questions(self):
+        """Per-question rows for display, keyed by question id."""
+        mean = self.sum_x / self.n if self.n else 0.0
+        variance = self.sum_x2 / self.n - mean ** 2 if self.n else 0.0
+        sd = math.sqrt(variance) if variance > 0 else 0.0
+
+        rows = {}
+        for j, question_id in enumerate(self.question_ids):
+            exposed = int(self.exposed[j])
+            correct = int(self.correct_counts[j])
+            p = correct / exposed if exposed else None
+            discrimination = None
+            if sd and p is not None and 0 < p < 1:
+                mean_correct = self.sum_xy[j] / correct
+                discrimination = (mean_correct - mean) / sd * math.sqrt(p / (1 - p))
+            rows[question_id] = {
+                'attempts': exposed,
+                'difficulty': p,
+                'discrimination': discrimination,
+                'options': [
+                    (label, int(count), count / exposed if exposed else 0.0)
+                    for label, count in zip(OPTION_LABELS, self.option_counts[j].tolist())
+                ],
+            }
+        return rows
+
+
+def compute_item_stats(quiz):
+    """Build item statistics for `quiz` from every stored answer sheet."""
+    rows_seen = Result.objects.filter(quiz=quiz, answers__isnull=False).count()
+    responses = load_response_matrix(quiz)
+    stats = ItemStats.empty(responses.key.version, responses.key.question_ids.tolist())
+    stats.rows_seen = rows_seen
+    stats.add(responses.matrix, responses.key.correct, responses.present())
+    return stats
+
+
+def get_item_stats(quiz):
+    """Return cached item statistics for `quiz`, recomputing them when stale."""
+    key = _stats_key(quiz.pk, quiz.version)
+    stats = cache.get(key)
+    if stats is None or stats.rows_seen != Result.objects.filter(quiz=quiz, answers__isnull=False).count():
+        stats = compute_item_stats(quiz)
+        cache.set(key, stats, ITEM_STATS_TIMEOUT)
+    return stats
+
+
+def record_attempts(quiz, answer_key, matrix):
+    """
+    Extend the cached statistics with freshly graded sheets. Nothing is
+    cached yet means nothing to update; the next read computes in full.
+    """
+    key = _stats_key(quiz.pk, answer_key.version)
+    stats = cache.get(key)
+    if stats is None:
+        return
+    stats.add(matrix, answer_key.correct)
+    stats.rows_seen += len(matrix)
+    cache.set(key, stats, ITEM_STATS_TIMEOUT)
@@ -0,0 +1,148 @@
+"""
+Score distributions, percentile ranks and leaderboards.
+
+Scores are whole percentages, so a quiz's results are fully described (for
+ranking purposes) by a 101-bucket histogram of how many attempts got each
+score. It is built with one GROUP BY over the (quiz, -score) index, cached,
+and bumped by the grading worker as results are written. Rank, percentile,
+mean and median then come from the cached histogram in constant time, with
+no COUNT over Result while the whole class is checking scores.
+
+Concurrent writers can occasionally lose an update, and results deleted
+outside the app are not seen, so cached histograms expire after a few
+minutes and are rebuilt; regrading drops the histogram outright.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Result
+
+SCORE_BUCKETS = 101
+DISTRIBUTION_TIMEOUT = 60 * 5
+LEADERBOARD_PAGE_SIZE = 50
+
+
+def _distribution_key(quiz_id):
+    return f'exams:score_distribution:{quiz_id}'
+
+
+def _bucket(scores):
+    return np.clip(np.asarray(scores, dtype=np.int64), 0, SCORE_BUCKETS - 1)
+
+
+@dataclass
+class ScoreDistribution:
+    counts: np.ndarray  # attempts per whole-percentage score, index = score
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def above(self, score):
+        """Number of attempts that scored strictly higher than `score`."""
+        return int(self.counts[int(_bucket(score)) + 1:].sum())
+
+    def rank(self, score):
+        """Competition rank of `score` (ties share a rank, 1 is best)."""
+        return self.above(score) + 1
+
+    def percentile(self, score):
+        """Percentile rank of `score`: share of attempts below it, counting ties as half."""
+        if not self.total:
+            return None
+        bucket = int(_bucket(score))
+        below = int(self.counts[:bucket].sum())
+        return 100.0 * (below + int(self.counts[bucket]) / 2) / self.total
+
+    def mean(self):
+        if not self.total:
+            return None
+        return float(self.counts @ np.arange(SCORE_BUCKETS)) / self.total
+
+    def median(self):
+        if not self.total:
+            return None
+        cumulative = np.cumsum(self.counts)
+        lower = int(np.searchsorted(cumulative, (self.total + 1) // 2))
+        upper = int(np.searchsorted(cumulative, self.total // 2 + 1))
+        return (lower + upper) / 2
+
+    def score_at(self, position):
+        """Score of the attempt at 0-based `position` in leaderboard order (highest first)."""
+        return SCORE_BUCKETS - 1 - int(np.searchsorted(np.cumsum(self.counts[::-1]), position, side='right'))
+
+
+def build_distribution(quiz_id):
+    """Count the results of a quiz per score straight from the database."""
+    counts = np.zeros(SCORE_BUCKETS, dtype=np.int64)
+    rows = Result.objects.filter(quiz_id=quiz_id).order_by().values_list('score').annotate(n=Count('id'))
+    for score, n in rows:
+        counts[int(_bucket(score))] += n
+    return ScoreDistribution(counts)
+
+
+def get_distribution(quiz_id):
+    """Return the cached score distribution of a quiz, building it on a miss."""
+    distribution = cache.get(_distribution_key(quiz_id))
+    if distribution is None:
+        distribution = build_distribution(quiz_id)
+        cache.set(_distribution_key(quiz_id), distribution, DISTRIBUTION_TIMEOUT)
+    return distribution
+
+
+def get_standing(result):
+    """Rank, percentile and class statistics for one result, from the cached distribution."""
+    distribution = get_distribution(result.quiz_id)
+    if not distribution.counts[int(_bucket(result.score))]:
+        # The cached histogram predates this result
+        distribution = build_distribution(result.quiz_id)
+        cache.set(_distribution_key(result.quiz_id), distribution, DISTRIBUTION_TIMEOUT)
+    return {
+        'rank': distribution.rank(result.score),
+        'attempts': distribution.total,
+        'percentile': distribution.percentile(result.score),
+        'mean': distribution.mean(),
+        'median': distribution.median(),
+    }
+
+
+def record_scores(quiz_id, scores):
+    """Add freshly written scores to the cached distribution, if there is one."""
+    distribution = cache.get(_distribution_key(quiz_id))
+    if distribution is None:
+        return
+    distribution.counts += np.bincount(_bucket(scores), minlength=SCORE_BUCKETS)
+    cache.set(_distribution_key(quiz_id), distribution, DISTRIBUTION_TIMEOUT)
+
+
+def forget_distribution(quiz_id):
+    cache.delete(_distribution_key(quiz_id))
+
+
+def leaderboard_page(quiz, page, size=LEADERBOARD_PAGE_SIZE):
+    """
+    Return (distribution, results) for 1-based leaderboard `page` of `quiz`.
+
+    The distribution says which score range the page covers and how many
+    results of its top score belong to earlier pages, so the page is one
+    index range scan on (quiz, -score) instead of an OFFSET over all results.
+    Each result gets a `rank` attribute.
+    """
+    distribution = get_distribution(quiz.pk)
+    start = (page - 1) * size
+    if start >= distribution.total:
+        return distribution, []
+    end = min(start + size, distribution.total)
+    high, low = distribution.score_at(start), distribution.score_at(end - 1)
+    skip = start - distribution.above(high)
+    results = list(
+        Result.objects.filter(quiz=quiz, score__lte=high, score__gte=low)
+        .select_related('user')
+        .order_by('-score', 'id')[skip:skip + size]
+    )
+    for result in results:
+        result.rank = distribution.rank(result.score)
+    return distribution, results
@@ -0,0 +1,79 @@
+import json
+import time
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from exams.answer_sheets import load_response_matrix, pack_answers
+from exams.grading import get_answer_key, invalidate_answer_key
+from exams.models import Question, Quiz, Result
+from exams.regrade import regrade_quiz
+
+
+class Command(BaseCommand):
+    help = "Measure storage and load time of answer sheets for a large synthetic exam (changes are rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=100000)
+        parser.add_argument('--questions', type=int, default=50)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--regrade', action='store_true',
+                            help='Also change half of the answer key and time a full regrade')
+
+    def handle(self, *args, **options):
+        attempts, questions, chunk_size = options['attempts'], options['questions'], options['chunk_size']
+        rng = np.random.default_rng(0)
+        User = get_user_model()
+
+        with transaction.atomic():
+            creator = User.objects.create(username='bench-sheets-creator', email='bench-sheets-creator@example.com')
+            quiz = Quiz.objects.create(title='Benchmark', description='', duration=60, creator=creator)
+            Question.objects.bulk_create([
+                Question(quiz=quiz, text=f'Question {i}', option_1='A', option_2='B', option_3='C', option_4='D',
+                         correct_answer=i % 4 + 1)
+                for i in range(questions)
+            ])
+            quiz.refresh_from_db()
+            key = get_answer_key(quiz)
+
+            started = time.perf_counter()
+            for offset in range(0, attempts, chunk_size):
+                count = min(chunk_size, attempts - offset)
+                users = User.objects.bulk_create([
+                    User(username=f'bench-sheets-{offset + i}', email=f'bench-sheets-{offset + i}@example.com',
+                         password='!')
+                    for i in range(count)
+                ])
+                sheets = rng.integers(0, 5, size=(count, questions), dtype=np.uint8)
+                Result.objects.bulk_create([
+                    Result(user=user, quiz=quiz, score=0, answers=pack_answers(sheet), quiz_version=key.version)
+                    for user, sheet in zip(users, sheets)
+                ])
+            insert_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            responses = load_response_matrix(quiz)
+            load_seconds = time.perf_counter() - started
+
+            sample = {f'q{question_id}': '1' for question_id in key.question_ids.tolist()}
+            json_bytes = len(json.dumps(sample, separators=(',', ':'))) * attempts
+
+            self.stdout.write(f'attempts x questions : {attempts} x {questions}')
+            self.stdout.write(f'sheet bytes          : {attempts * questions / 1e6:.1f} MB '
+                              f'({questions} B per attempt)')
+            self.stdout.write(f'same answers as JSON : {json_bytes / 1e6:.1f} MB')
+            self.stdout.write(f'insert (with users)  : {insert_seconds:.2f} s')
+            self.stdout.write(f'load matrix          : {load_seconds:.2f} s, shape {responses.matrix.shape}, '
+                              f'{responses.matrix.nbytes / 1e6:.1f} MB in memory')
+
+            if options['regrade']:
+                Question.objects.filter(quiz=quiz, id__in=key.question_ids[::2].tolist()).update(correct_answer=1)
+                invalidate_answer_key(quiz)
+                started = time.perf_counter()
+                report = regrade_quiz(quiz)
+                self.stdout.write(f'regrade              : {time.perf_counter() - started:.2f} s, '
+                                  f'{report.graded} graded, {report.changed} changed')
+
+            transaction.set_rollback(True)
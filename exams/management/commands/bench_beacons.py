@@ -0,0 +1,99 @@
+import json
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from exams.beacons import BeaconBuffer
+from exams.models import Quiz, ViolationEvent
+from exams.violations import build_violation_events, save_violation_events
+
+
+class Command(BaseCommand):
+    help = "Simulate a full exam hall sending proctoring beacons and compare coalesced and direct writes (changes are rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--seconds', type=int, default=30, help='Simulated exam time')
+        parser.add_argument('--rate', type=float, default=1.0, help='Beacons per student per second')
+        parser.add_argument('--flush-interval', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        students, seconds, rate, interval = (
+            options['students'], options['seconds'], options['rate'], options['flush_interval'],
+        )
+        rng = random.Random(0)
+        User = get_user_model()
+
+        with transaction.atomic():
+            creator = User.objects.create(username='bench-beacon-creator', email='bench-beacon-creator@example.com')
+            quiz = Quiz.objects.create(title='Beacon benchmark', description='', duration=60, creator=creator)
+            users = User.objects.bulk_create([
+                User(username=f'bench-beacon-{i}', email=f'bench-beacon-{i}@example.com', password='!')
+                for i in range(students)
+            ])
+            counts = {user.pk: {} for user in users}
+            started_at = timezone.now().isoformat()
+
+            def payload(user_id):
+                # Each beacon carries the student's cumulative counts, sometimes with a new event
+                if rng.random() < 0.3:
+                    event_type = rng.choice(['tab_switch', 'tab_switch', 'devtools_shortcut', 'screenshot_attempt'])
+                    counts[user_id][event_type] = counts[user_id].get(event_type, 0) + 1
+                return json.dumps({'events': [
+                    {'type': event_type, 'at': started_at, 'count': count}
+                    for event_type, count in counts[user_id].items()
+                ]})
+
+            statements = []
+
+            def count_statements(execute, sql, params, many, context):
+                statements.append(sql.split(None, 1)[0].upper())
+                return execute(sql, params, many, context)
+
+            buffer = BeaconBuffer(interval, autostart=False)
+            beacons, add_seconds, flush_times = 0, 0.0, []
+            with connection.execute_wrapper(count_statements):
+                next_flush = interval
+                for second in range(1, seconds + 1):
+                    batch = [(user.pk, payload(user.pk)) for user in users if rng.random() < rate]
+                    started = time.perf_counter()
+                    for user_id, raw in batch:
+                        buffer.add(user_id, quiz.pk, raw)
+                    add_seconds += time.perf_counter() - started
+                    beacons += len(batch)
+                    if second >= next_flush:
+                        started = time.perf_counter()
+                        buffer.flush()
+                        flush_times.append(time.perf_counter() - started)
+                        next_flush += interval
+                started = time.perf_counter()
+                buffer.flush()
+                flush_times.append(time.perf_counter() - started)
+            coalesced_statements = len(statements)
+
+            # Direct writes for one simulated second, for comparison
+            statements.clear()
+            sample = [(user.pk, payload(user.pk)) for user in users if rng.random() < rate]
+            with connection.execute_wrapper(count_statements):
+                started = time.perf_counter()
+                for user_id, raw in sample:
+                    save_violation_events(build_violation_events(user_id, quiz.pk, None, raw))
+                direct_seconds = time.perf_counter() - started
+
+            rows = ViolationEvent.objects.filter(quiz=quiz).count()
+            self.stdout.write(f'students x seconds    : {students} x {seconds} at {rate:g} beacon/s each')
+            self.stdout.write(f'beacons received      : {beacons} ({beacons / seconds:.0f}/s)')
+            self.stdout.write(f'coalesce in request   : {add_seconds / max(beacons, 1) * 1e6:.0f} us per beacon')
+            self.stdout.write(f'flushes               : {len(flush_times)} every {interval:g} s, '
+                              f'avg {sum(flush_times) / len(flush_times) * 1000:.0f} ms, '
+                              f'max {max(flush_times) * 1000:.0f} ms')
+            self.stdout.write(f'SQL statements        : {coalesced_statements} in total '
+                              f'({coalesced_statements / seconds:.1f}/s), {rows} violation rows stored')
+            self.stdout.write(f'direct writes         : {len(statements)} statements for one second of beacons '
+                              f'({len(sample)} beacons, {direct_seconds:.2f} s)')
+
+            transaction.set_rollback(True)
@@ -0,0 +1,56 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from exams.models import Quiz
+from exams.question_sync import sync_questions
+
+
+class Command(BaseCommand):
+    help = "Measure queries and time used to save quizzes of growing size (changes are rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,50,200,1000',
+                            help='Comma separated question counts to benchmark')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(f"{'questions':>10} {'step':>8} {'queries':>8} {'ms':>9}")
+        for size in sizes:
+            with transaction.atomic():
+                creator = get_user_model().objects.create(
+                    username=f'bench-question-sync-{size}', email=f'bench-question-sync-{size}@example.com',
+                )
+                quiz = Quiz.objects.create(title='Benchmark', description='', duration=60, creator=creator)
+
+                submitted = [(None, self._fields(i, 1)) for i in range(size)]
+                self._measure(size, 'create', quiz, submitted)
+
+                ids = list(quiz.question_set.order_by('id').values_list('id', flat=True))
+                # Edit every other question, drop the last tenth and add as many new ones
+                keep = ids[:size - size // 10]
+                submitted = [(pk, self._fields(i, 2 if i % 2 else 1)) for i, pk in enumerate(keep)]
+                submitted += [(None, self._fields(size + i, 1)) for i in range(size // 10)]
+                self._measure(size, 'edit', quiz, submitted)
+                self._measure(size, 'noop', quiz, submitted)
+
+                transaction.set_rollback(True)
+
+    def _measure(self, size, step, quiz, submitted):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            sync_questions(quiz, submitted)
+            elapsed = (time.perf_counter() - started) * 1000
+        self.stdout.write(f'{size:>10} {step:>8} {len(queries):>8} {elapsed:>9.1f}')
+
+    @staticmethod
+    def _fields(i, marks):
+        return {
+            'text': f'Question {i}',
+            'option_1': 'A', 'option_2': 'B', 'option_3': 'C', 'option_4': 'D',
+            'correct_answer': i % 4 + 1,
+            'marks': marks,
+        }
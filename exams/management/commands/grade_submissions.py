@@ -0,0 +1,61 @@
+import logging
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from exams.submissions import process_pending
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Grade queued quiz submissions in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Submissions claimed per batch')
+        parser.add_argument('--workers', type=int, default=2, help='Number of grading threads')
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        self.graded = 0
+        self.lock = threading.Lock()
+        workers = [
+            threading.Thread(target=self._work, args=(options,), daemon=True)
+            for _ in range(max(1, options['workers']))
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(1)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping.')
+        self.stdout.write(self.style.SUCCESS(f'Graded {self.graded} submission(s).'))
+
+    def _work(self, options):
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    graded = process_pending(options['batch_size'])
+                except Exception:
+                    # Typically the database going away; keep the worker alive and try again
+                    logger.exception('Grading worker failed to process a batch')
+                    if options['once']:
+                        return
+                    time.sleep(options['interval'])
+                    continue
+                if graded:
+                    with self.lock:
+                        self.graded += graded
+                    self.stdout.write(f'Graded {graded} submission(s).')
+                elif options['once']:
+                    return
+                else:
+                    time.sleep(options['interval'])
+        finally:
+            connection.close()
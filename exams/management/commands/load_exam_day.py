@@ -0,0 +1,263 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from exams.models import Question, Quiz
+from users.user_cache import forget_users
+
+USERNAME_PREFIX = 'loadtest-student-'
+PASSWORD = 'loadtest-password'
+ENDPOINTS = ('login_form', 'login', 'login_busy', 'dashboard', 'attempt', 'submit')
+LOGIN_RETRIES = 5
+DEFAULT_MIX = 'manual=0.8,time_up=0.15,tab_switch_violation=0.05'
+
+ANSWER_RE = re.compile(r'name="(q\d+)"[^>]*value="(\d+)"')
+TOKEN_RE = re.compile(r'name="attempt_token" value="([^"]+)"')
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    # Time each endpoint on its own instead of following redirects into the next one
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class _Student:
+    """One virtual student: a cookie jar and timed requests."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.retry_after = 0.0
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), _NoRedirect())
+
+    def csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def request(self, path, data=None):
+        """Return (status, body, seconds); status 0 means the request never got a response."""
+        body = None
+        if data is not None:
+            data = dict(data, csrfmiddlewaretoken=self.csrf_token())
+            body = urlencode(data).encode()
+        request = Request(self.base_url + path, data=body, headers={'Referer': self.base_url + path})
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, content = response.status, response.read()
+        except HTTPError as error:
+            status, content = error.code, error.read()
+            self.retry_after = float(error.headers.get('Retry-After') or 1)
+        except (URLError, OSError):
+            status, content = 0, b''
+        return status, content.decode('utf-8', 'replace'), time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate exam day against a running server: N concurrent students log in, open the dashboard, "
+        "start a quiz and submit it. Reports latency percentiles, throughput and error rates per endpoint, "
+        "and fails when a saved baseline regresses."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the running server')
+        parser.add_argument('--students', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=20, help='Students running at the same time')
+        parser.add_argument('--questions', type=int, default=20)
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='Submission reasons and their weights')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds before a request counts as failed')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Keep the load-test quiz and its results')
+        parser.add_argument('--save-baseline', metavar='PATH', help='Write this run\'s report as the baseline')
+        parser.add_argument('--baseline', metavar='PATH', help='Fail if this run regresses against the baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative slowdown of p95 and drop in throughput')
+
+    def handle(self, *args, **options):
+        mix = self._parse_mix(options['mix'])
+        students = self._students(options['students'])
+        quiz = self._quiz(options['questions'])
+        self.stdout.write(f"{len(students)} students, {options['concurrency']} at a time, quiz {quiz.pk} "
+                          f"with {options['questions']} questions, against {options['url']}")
+
+        samples = defaultdict(list)  # endpoint -> [(seconds, ok)]
+        lock = threading.Lock()
+
+        def record(endpoint, seconds, ok):
+            with lock:
+                samples[endpoint].append((seconds, ok))
+
+        def run(index, username):
+            rng = random.Random(options['seed'] * 1_000_003 + index)
+            self._exam_day(_Student(options['url'], options['timeout']), username, quiz, mix, rng, record)
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                list(pool.map(run, range(len(students)), students))
+        finally:
+            wall = time.perf_counter() - started
+            if not options['keep']:
+                quiz.delete()
+
+        report = self._report(samples, wall)
+        self._print(report, wall)
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f"Baseline saved to {options['save_baseline']}")
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+            regressions = self._regressions(report, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressed against the baseline:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def _parse_mix(self, value):
+        mix = {}
+        for part in value.split(','):
+            reason, _, weight = part.partition('=')
+            try:
+                mix[reason.strip()] = float(weight)
+            except ValueError:
+                raise CommandError(f'Bad --mix entry: {part!r}')
+        if not mix or min(mix.values()) < 0 or not sum(mix.values()):
+            raise CommandError('--mix needs at least one positive weight')
+        return mix
+
+    def _students(self, count):
+        """Make sure `count` verified load-test students exist; they are kept between runs."""
+        User = get_user_model()
+        usernames = [f'{USERNAME_PREFIX}{i}' for i in range(count)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        # One hash for everyone: creating thousands of accounts should not take minutes of hashing
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=username, email=f'{username}@loadtest.invalid', password=password,
+                 role='STUDENT', department='Load test', is_email_verified=True)
+            for username in usernames if username not in existing
+        ])
+        students = User.objects.filter(username__in=usernames)
+        students.update(password=password, is_active=True, is_email_verified=True)
+        forget_users(students.values_list('pk', flat=True))
+        return usernames
+
+    def _quiz(self, questions):
+        User = get_user_model()
+        creator, _ = User.objects.get_or_create(
+            username='loadtest-faculty',
+            defaults={'email': 'loadtest-faculty@loadtest.invalid', 'role': 'FACULTY', 'password': '!'},
+        )
+        quiz = Quiz.objects.create(title='Load test', description='Created by load_exam_day', duration=60,
+                                   creator=creator)
+        Question.objects.bulk_create([
+            Question(quiz=quiz, text=f'Load test question {i + 1}', option_1='A', option_2='B', option_3='C',
+                     option_4='D', correct_answer=i % 4 + 1)
+            for i in range(questions)
+        ])
+        quiz.assigned_faculty.add(creator)
+        return quiz
+
+    def _exam_day(self, student, username, quiz, mix, rng, record):
+        """The real flow for one student; stops at the first failed step."""
+        status, _, seconds = student.request('/login/')
+        record('login_form', seconds, status == 200)
+        if status != 200:
+            return
+        for _ in range(LOGIN_RETRIES + 1):
+            status, _, seconds = student.request('/login/', {'username': username, 'password': PASSWORD})
+            if status != 503:
+                break
+            # Turned away by password-hashing admission control: come back as told, like a browser would
+            record('login_busy', seconds, True)
+            time.sleep(student.retry_after * rng.uniform(0.5, 1.5))
+        record('login', seconds, status == 302)
+        if status != 302:
+            return
+        status, _, seconds = student.request('/dashboard/')
+        record('dashboard', seconds, status == 200)
+        if status != 200:
+            return
+        status, page, seconds = student.request(f'/exams/{quiz.pk}/attempt/')
+        record('attempt', seconds, status == 200)
+        if status != 200:
+            return
+
+        options = defaultdict(list)
+        for name, value in ANSWER_RE.findall(page):
+            options[name].append(value)
+        reason = rng.choices(list(mix), weights=list(mix.values()))[0]
+        data = {name: rng.choice(values) for name, values in options.items() if rng.random() < 0.9}
+        token = TOKEN_RE.search(page)
+        data.update({
+            'attempt_token': token.group(1) if token else '',
+            'submission_reason': reason,
+            'security_data': json.dumps({'events': [{'type': 'tab_switch', 'count': 2}]})
+            if reason == 'tab_switch_violation' else '{}',
+        })
+        status, _, seconds = student.request(f'/exams/{quiz.pk}/attempt/', data)
+        record('submit', seconds, status == 302)
+
+    def _report(self, samples, wall):
+        report = {}
+        for endpoint in ENDPOINTS:
+            if not samples[endpoint]:
+                continue
+            seconds = np.array([sample[0] for sample in samples[endpoint]]) * 1000
+            errors = sum(1 for _, ok in samples[endpoint] if not ok)
+            p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+            report[endpoint] = {
+                'requests': len(seconds),
+                'errors': errors,
+                'error_rate': errors / len(seconds),
+                'p50_ms': round(float(p50), 1),
+                'p95_ms': round(float(p95), 1),
+                'p99_ms': round(float(p99), 1),
+                'per_second': round(len(seconds) / wall, 1),
+            }
+        return report
+
+    def _print(self, report, wall):
+        self.stdout.write(f'{"endpoint":<12}{"requests":>9}{"errors":>8}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"req/s":>8}')
+        for endpoint, row in report.items():
+            self.stdout.write(
+                f"{endpoint:<12}{row['requests']:>9}{row['errors']:>8}{row['p50_ms']:>9.1f}"
+                f"{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['per_second']:>8.1f}"
+            )
+        total = sum(row['requests'] for row in report.values())
+        self.stdout.write(f'{total} requests in {wall:.1f} s ({total / wall:.1f}/s)')
+
+    def _regressions(self, report, baseline, tolerance):
+        regressions = []
+        for endpoint, before in baseline.items():
+            if endpoint == 'login_busy':
+                # Shed logins are retried; their cost shows up in login latency and throughput
+                continue
+            now = report.get(endpoint)
+            if now is None:
+                regressions.append(f'{endpoint}: no requests reached this endpoint')
+                continue
+            if now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{endpoint}: p95 {now['p95_ms']:.1f} ms, baseline {before['p95_ms']:.1f} ms")
+            if now['error_rate'] > before['error_rate'] + 0.01:
+                regressions.append(f"{endpoint}: error rate {now['error_rate']:.1%}, "
+                                   f"baseline {before['error_rate']:.1%}")
+            if now['per_second'] < before['per_second'] * (1 - tolerance):
+                regressions.append(f"{endpoint}: {now['per_second']:.1f} req/s, "
+                                   f"baseline {before['per_second']:.1f} req/s")
+        return regressions
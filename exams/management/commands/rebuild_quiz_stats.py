@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from exams.models import Quiz
+
+
+class Command(BaseCommand):
+    help = "Check Quiz.question_count / Quiz.total_marks against the questions table and fix any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drift; exit with an error if any quiz is out of date')
+
+    def handle(self, *args, **options):
+        drifted = list(
+            Quiz.objects.annotate(
+                actual_count=Count('question'),
+                actual_marks=Coalesce(Sum('question__marks'), 0),
+            ).filter(
+                ~Q(question_count=F('actual_count')) | ~Q(total_marks=F('actual_marks'))
+            ).values_list('pk', 'title', 'question_count', 'actual_count', 'total_marks', 'actual_marks')
+        )
+
+        for pk, title, count, actual_count, marks, actual_marks in drifted:
+            self.stdout.write(
+                f'Quiz {pk} "{title}": question_count {count} -> {actual_count}, '
+                f'total_marks {marks} -> {actual_marks}'
+            )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All quiz question stats are up to date.'))
+            return
+        if options['check']:
+            raise CommandError(f'{len(drifted)} quiz(zes) have drifted question stats.')
+
+        Quiz.refresh_question_stats([row[0] for row in drifted])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt question stats for {len(drifted)} quiz(zes).'))
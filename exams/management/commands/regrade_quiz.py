@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exams.models import Quiz
+from exams.regrade import REGRADE_CHUNK_SIZE, regrade_quiz
+
+
+class Command(BaseCommand):
+    help = "Rescore stored answer sheets against the current answer key and passing score."
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_ids', nargs='*', type=int, help='Quizzes to regrade')
+        parser.add_argument('--all', action='store_true', help='Regrade every quiz')
+        parser.add_argument('--dry-run', action='store_true', help='Report changes without saving them')
+        parser.add_argument('--chunk-size', type=int, default=REGRADE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['all']:
+            quizzes = Quiz.objects.order_by('id')
+        elif options['quiz_ids']:
+            quizzes = Quiz.objects.filter(id__in=options['quiz_ids']).order_by('id')
+        else:
+            raise CommandError('Pass one or more quiz ids, or --all.')
+
+        for quiz in quizzes:
+            started = time.perf_counter()
+            report = regrade_quiz(quiz, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'Quiz {quiz.id} "{quiz.title}": {report.graded} graded, {report.changed} changed '
+                f'({report.outcome_changed} pass/fail), {report.skipped} without answer sheet, {elapsed:.2f} s'
+            )
+        if options['dry_run']:
+            self.stdout.write('Dry run: nothing was saved.')
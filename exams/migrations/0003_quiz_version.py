@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0002_result_submission_reason'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Bumped whenever the answer key changes'),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='security_violations',
+            field=models.TextField(blank=True, help_text='JSON data containing security violation details', null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='result',
+            unique_together={('user', 'quiz')},
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_question_stats(apps, schema_editor):
+    Quiz = apps.get_model('exams', 'Quiz')
+    Question = apps.get_model('exams', 'Question')
+    questions = Question.objects.filter(quiz=OuterRef('pk')).order_by().values('quiz')
+    Quiz.objects.update(
+        question_count=Coalesce(Subquery(questions.annotate(n=Count('pk')).values('n')), 0),
+        total_marks=Coalesce(Subquery(questions.annotate(s=Sum('marks')).values('s')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0003_quiz_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='total_marks',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_question_stats, migrations.RunPython.noop),
+    ]
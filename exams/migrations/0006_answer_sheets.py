@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0005_pendingsubmission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='result',
+            name='answers',
+            field=models.BinaryField(help_text='Selected option per question (one byte each, 0 = unanswered) in answer-key order', null=True),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='quiz_version',
+            field=models.PositiveIntegerField(editable=False, help_text='Quiz version the answers were graded against', null=True),
+        ),
+        migrations.CreateModel(
+            name='AnswerKeySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('question_ids', models.BinaryField(help_text='Little-endian int64 question ids, in sheet column order')),
+                ('correct', models.BinaryField(help_text='Correct option per question, one byte each')),
+                ('marks', models.BinaryField(help_text='Little-endian int32 marks per question')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_key_snapshots', to='exams.quiz')),
+            ],
+            options={
+                'unique_together': {('quiz', 'version')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0006_answer_sheets'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['quiz', '-score', 'id'], name='exams_result_leaderboard'),
+        ),
+    ]
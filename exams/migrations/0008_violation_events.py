@@ -0,0 +1,135 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:12
+
+import json
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# A frozen copy of exams.violations.parse_security_data as it was when this
+# migration was written, so later changes to the app cannot change what it does.
+MAX_EVENTS = 1000
+REASON_EVENTS = {
+    'tab_switch_violation': 'tab_switch',
+    'screenshot_attempt': 'screenshot_attempt',
+}
+EVENT_TYPES = {'tab_switch', 'screenshot_attempt', 'devtools_shortcut', 'other'}
+
+
+def _event_type(value):
+    value = str(value or '').strip().lower()
+    return value if value in EVENT_TYPES else 'other'
+
+
+def _timestamp(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        occurred_at = parse_datetime(value)
+    except ValueError:
+        return None
+    if occurred_at is not None and timezone.is_naive(occurred_at):
+        occurred_at = timezone.make_aware(occurred_at)
+    return occurred_at
+
+
+def _events(data):
+    if isinstance(data, dict):
+        events = data.get('events')
+        if events is None:
+            for event_type, count in data.items():
+                if isinstance(count, int) and not isinstance(count, bool):
+                    yield _event_type(event_type), None, count
+            return
+        data = events
+    if not isinstance(data, list):
+        return
+    for event in data[:MAX_EVENTS]:
+        if isinstance(event, str):
+            yield _event_type(event), None, 1
+        elif isinstance(event, dict):
+            count = event.get('count', 1)
+            yield _event_type(event.get('type')), _timestamp(event.get('at')), count if isinstance(count, int) else 1
+
+
+def parse_security_data(raw, submission_reason, received_at):
+    try:
+        data = json.loads(raw) if raw else {}
+    except (TypeError, ValueError):
+        data = {}
+    parsed = {}
+    for event_type, occurred_at, count in _events(data):
+        if count < 1:
+            continue
+        if occurred_at is None or occurred_at > received_at:
+            occurred_at = received_at
+        first, total = parsed.get(event_type, (occurred_at, 0))
+        parsed[event_type] = (min(first, occurred_at), min(total + count, 2 ** 31 - 1))
+    reason_event = REASON_EVENTS.get(submission_reason)
+    if reason_event and reason_event not in parsed:
+        parsed[reason_event] = (received_at, 1)
+    return parsed
+
+
+def parse_security_blobs(apps, schema_editor):
+    """Move the JSON blobs stored on results into ViolationEvent rows."""
+    Result = apps.get_model('exams', 'Result')
+    ViolationEvent = apps.get_model('exams', 'ViolationEvent')
+    results = (
+        Result.objects.exclude(security_violations__isnull=True, submission_reason='manual')
+        .values_list('id', 'user_id', 'quiz_id', 'security_violations', 'submission_reason', 'completed_at')
+    )
+    events = []
+    for result_id, user_id, quiz_id, raw, reason, completed_at in results.iterator(chunk_size=2000):
+        for event_type, (occurred_at, count) in parse_security_data(raw, reason, completed_at).items():
+            events.append(ViolationEvent(
+                result_id=result_id, user_id=user_id, quiz_id=quiz_id,
+                event_type=event_type, occurred_at=occurred_at, count=count,
+            ))
+        if len(events) >= 2000:
+            ViolationEvent.objects.bulk_create(events)
+            events = []
+    ViolationEvent.objects.bulk_create(events)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0007_result_leaderboard_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pendingsubmission',
+            name='submission_reason',
+            field=models.CharField(choices=[('manual', 'Manual Submission'), ('time_up', 'Time Expired'), ('tab_switch_violation', 'Tab Switch Violation'), ('screenshot_attempt', 'Screenshot Attempt')], default='manual', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='result',
+            name='submission_reason',
+            field=models.CharField(choices=[('manual', 'Manual Submission'), ('time_up', 'Time Expired'), ('tab_switch_violation', 'Tab Switch Violation'), ('screenshot_attempt', 'Screenshot Attempt')], default='manual', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ViolationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('tab_switch', 'Tab switch'), ('screenshot_attempt', 'Screenshot attempt'), ('devtools_shortcut', 'Developer tools shortcut'), ('other', 'Other')], max_length=20)),
+                ('occurred_at', models.DateTimeField(help_text='First occurrence during the attempt')),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='violations', to='exams.quiz')),
+                ('result', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='violations', to='exams.result')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='violations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['quiz', 'event_type', 'occurred_at'], name='exams_viola_quiz_id_75b9d3_idx'), models.Index(fields=['event_type', 'occurred_at'], name='exams_viola_event_t_ccdae6_idx'), models.Index(fields=['user', 'occurred_at'], name='exams_viola_user_id_ed0a35_idx')],
+            },
+        ),
+        migrations.RunPython(parse_security_blobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='result',
+            name='security_violations',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0008_violation_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='violationevent',
+            constraint=models.UniqueConstraint(fields=('quiz', 'user', 'event_type'), name='exams_violation_per_attempt'),
+        ),
+    ]
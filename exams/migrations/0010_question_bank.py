@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0009_violation_per_attempt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='tags',
+            field=models.CharField(blank=True, help_text='Comma-separated, used to draw randomized papers', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='draw_count',
+            field=models.PositiveIntegerField(default=0, help_text='Questions drawn from the bank for each student (0 = all)'),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='draw_tags',
+            field=models.CharField(blank=True, help_text='Only draw questions tagged with any of these (comma-separated)', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='shuffle_options',
+            field=models.BooleanField(default=False, help_text='Show each student the options in their own order'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0010_question_bank'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pendingsubmission',
+            name='submission_reason',
+            field=models.CharField(choices=[('manual', 'Manual Submission'), ('time_up', 'Time Expired'), ('tab_switch_violation', 'Tab Switch Violation'), ('screenshot_attempt', 'Screenshot Attempt'), ('late', 'Late Submission')], default='manual', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='result',
+            name='submission_reason',
+            field=models.CharField(choices=[('manual', 'Manual Submission'), ('time_up', 'Time Expired'), ('tab_switch_violation', 'Tab Switch Violation'), ('screenshot_attempt', 'Screenshot Attempt'), ('late', 'Late Submission')], default='manual', max_length=20),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:22
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exams', '0011_late_submission_reason'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='question',
+            name='marks',
+            field=models.IntegerField(default=1, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
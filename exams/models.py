@@ -1,6 +1,16 @@
+from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.conf import settings
 
+from .signals import question_stats_changed
+
+
+def parse_tags(value):
+    """Split a comma-separated tag string into normalised tags."""
+    return [tag for tag in dict.fromkeys(tag.strip().lower() for tag in (value or '').split(',')) if tag]
+
 class Quiz(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -9,6 +19,73 @@ class Quiz(models.Model):
     assigned_faculty = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='assigned_quizzes')
     created_at = models.DateTimeField(auto_now_add=True)
     passing_score = models.IntegerField(default=40)
+    version = models.PositiveIntegerField(default=0, editable=False, help_text="Bumped whenever the answer key changes")
+    question_count = models.PositiveIntegerField(default=0, editable=False)
+    total_marks = models.PositiveIntegerField(default=0, editable=False)
+    draw_count = models.PositiveIntegerField(default=0, help_text="Questions drawn from the bank for each student (0 = all)")
+    draw_tags = models.CharField(max_length=200, blank=True, help_text="Only draw questions tagged with any of these (comma-separated)")
+    shuffle_options = models.BooleanField(default=False, help_text="Show each student the options in their own order")
+
+    # Changing any of these changes the answer key or the papers
+    PAPER_FIELDS = ('draw_count', 'draw_tags', 'shuffle_options')
+
+    @property
+    def is_randomized(self):
+        """Whether students get individual papers (see exams.papers)."""
+        return bool(self.draw_count or self.draw_tags or self.shuffle_options)
+
+    def bump_version(self):
+        """Move the quiz to a new answer-key version so cached keys are not reused."""
+        Quiz.objects.filter(pk=self.pk).update(version=models.F('version') + 1)
+        self.version += 1
+
+    @classmethod
+    def refresh_question_stats(cls, quiz_ids):
+        """Recompute question_count and total_marks for the given quizzes in one UPDATE."""
+        quiz_ids = [quiz_id for quiz_id in quiz_ids if quiz_id is not None]
+        if not quiz_ids:
+            return 0
+        questions = Question.objects.filter(quiz=OuterRef('pk')).order_by().values('quiz')
+        updated = cls.objects.filter(pk__in=quiz_ids).update(
+            question_count=Coalesce(Subquery(questions.annotate(n=Count('pk')).values('n')), 0),
+            total_marks=Coalesce(Subquery(questions.annotate(s=Sum('marks')).values('s')), 0),
+        )
+        question_stats_changed.send(sender=cls, quiz_ids=quiz_ids)
+        return updated
+
+
+class QuestionQuerySet(models.QuerySet):
+    """
+    Keeps Quiz.question_count and Quiz.total_marks in step with bulk writes,
+    which bypass Question.save() and Question.delete(). bulk_update() is
+    covered by update(), which it runs for each batch.
+    """
+    STATS_FIELDS = {'quiz', 'quiz_id', 'marks'}
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        Quiz.refresh_question_stats({obj.quiz_id for obj in objs})
+        return objs
+
+    def update(self, **kwargs):
+        if not self.STATS_FIELDS & kwargs.keys():
+            return super().update(**kwargs)
+        quiz_ids = set(self.values_list('quiz_id', flat=True))
+        rows = super().update(**kwargs)
+        new_quiz = kwargs.get('quiz', kwargs.get('quiz_id'))
+        if new_quiz is not None:
+            quiz_ids.add(getattr(new_quiz, 'pk', new_quiz))
+        Quiz.refresh_question_stats(quiz_ids)
+        return rows
+    update.alters_data = True
+
+    def delete(self):
+        quiz_ids = set(self.values_list('quiz_id', flat=True).distinct())
+        deleted = super().delete()
+        Quiz.refresh_question_stats(quiz_ids)
+        return deleted
+    delete.alters_data = True
+    delete.queryset_only = True
 
 class Question(models.Model):
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
@@ -18,7 +95,27 @@ class Question(models.Model):
     option_3 = models.CharField(max_length=200)
     option_4 = models.CharField(max_length=200)
     correct_answer = models.IntegerField(choices=[(1,1), (2,2), (3,3), (4,4)])
-    marks = models.IntegerField(default=1)
+    marks = models.IntegerField(default=1, validators=[MinValueValidator(0)])
+    tags = models.CharField(max_length=200, blank=True, help_text="Comma-separated, used to draw randomized papers")
+
+    objects = QuestionQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Quiz.refresh_question_stats([self.quiz_id])
+
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        Quiz.refresh_question_stats([self.quiz_id])
+        return deleted
+
+SUBMISSION_REASONS = [
+    ('manual', 'Manual Submission'),
+    ('time_up', 'Time Expired'),
+    ('tab_switch_violation', 'Tab Switch Violation'),
+    ('screenshot_attempt', 'Screenshot Attempt'),
+    ('late', 'Late Submission'),
+]
 
 class Result(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -28,18 +125,91 @@ class Result(models.Model):
     passed = models.BooleanField(default=False)
     submission_reason = models.CharField(
         max_length=20,
-        choices=[
-            ('manual', 'Manual Submission'),
-            ('time_up', 'Time Expired'),
-            ('tab_switch_violation', 'Tab Switch Violation'),
-        ],
+        choices=SUBMISSION_REASONS,
         default='manual'
     )
-    security_violations = models.TextField(
-        blank=True,
+    answers = models.BinaryField(
         null=True,
-        help_text="JSON data containing security violation details"
+        editable=False,
+        help_text="Selected option per question (one byte each, 0 = unanswered) in answer-key order"
     )
+    quiz_version = models.PositiveIntegerField(null=True, editable=False, help_text="Quiz version the answers were graded against")
     
     class Meta:
         unique_together = ['user', 'quiz']  # Prevent multiple attempts 
+        indexes = [
+            # Leaderboard pages and score histograms (see exams.leaderboard)
+            models.Index(fields=['quiz', '-score', 'id'], name='exams_result_leaderboard'),
+        ]
+
+class AnswerKeySnapshot(models.Model):
+    """
+    The answer key of one quiz version, kept so stored answer sheets can be
+    mapped back to questions after the quiz is edited (see exams.answer_sheets).
+    """
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='answer_key_snapshots')
+    version = models.PositiveIntegerField()
+    question_ids = models.BinaryField(help_text="Little-endian int64 question ids, in sheet column order")
+    correct = models.BinaryField(help_text="Correct option per question, one byte each")
+    marks = models.BinaryField(help_text="Little-endian int32 marks per question")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['quiz', 'version']
+
+class PendingSubmission(models.Model):
+    """Raw answers of a submitted attempt, waiting to be graded (see exams.submissions)."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
+    answers = models.TextField(help_text="JSON object of q<question id> -> selected option")
+    submission_reason = models.CharField(max_length=20, choices=SUBMISSION_REASONS, default='manual')
+    security_data = models.TextField(blank=True, null=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        unique_together = ['user', 'quiz']  # One attempt in flight per student
+
+class AttemptStart(models.Model):
+    """
+    When a student first opened a quiz, so every attempt token they get has
+    the same deadline (see exams.attempt_tokens).
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
+    started_at = models.DateTimeField()
+    nonce = models.CharField(max_length=24)
+
+    class Meta:
+        unique_together = ['user', 'quiz']
+
+class ViolationEvent(models.Model):
+    """
+    Proctoring violations of one type during one attempt, reported live by
+    the attempt page or parsed from the submitted security data (see
+    exams.violations). `result` is set once the attempt is graded.
+    """
+    EVENT_TYPES = [
+        ('tab_switch', 'Tab switch'),
+        ('screenshot_attempt', 'Screenshot attempt'),
+        ('devtools_shortcut', 'Developer tools shortcut'),
+        ('other', 'Other'),
+    ]
+
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='violations')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='violations')
+    result = models.ForeignKey(Result, on_delete=models.CASCADE, null=True, related_name='violations')
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    occurred_at = models.DateTimeField(help_text="First occurrence during the attempt")
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            # Counts are cumulative per attempt (see exams.violations)
+            models.UniqueConstraint(fields=['quiz', 'user', 'event_type'], name='exams_violation_per_attempt'),
+        ]
+        indexes = [
+            models.Index(fields=['quiz', 'event_type', 'occurred_at']),
+            models.Index(fields=['event_type', 'occurred_at']),
+            models.Index(fields=['user', 'occurred_at']),
+        ]
@@ -0,0 +1,160 @@
+"""
+Exam papers for quiz_attempt.
+
+For an ordinary quiz the question section of the attempt page is identical
+for every student, so it is rendered once per quiz version and kept
+zlib-compressed in the shared cache. Each request then only renders the
+small attempt shell (user, timer, CSRF token) around it. A version bump
+(see Quiz.bump_version) retires the old fragment automatically.
+
+Randomized quizzes (Quiz.draw_count, draw_tags, shuffle_options) give every
+student their own paper without storing it: the draw and the option orders
+come from a generator seeded with an HMAC of (quiz, student), so the same
+paper can be rebuilt in O(N) whenever it is needed, for rendering and again
+when grading maps the submitted option positions back to the real options.
+Only the question bank (per version) is cached.
+"""
+import hashlib
+import hmac
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .grading import NOT_SERVED, get_answer_key
+from .models import Question
+
+PAPER_TIMEOUT = 60 * 60 * 12
+OPTION_LABELS = 'ABCD'
+
+
+def _paper_key(quiz):
+    return f'exams:paper:{quiz.pk}:{quiz.version}'
+
+
+def _bank_key(quiz, version):
+    return f'exams:paper_bank:{quiz.pk}:{version}'
+
+
+def _paper_questions(questions, option_orders=None):
+    """Shape (id, text, options) rows for _paper.html, with options in display order."""
+    paper = []
+    for index, (question_id, text, options) in enumerate(questions):
+        order = option_orders[index].tolist() if option_orders is not None else (1, 2, 3, 4)
+        paper.append({
+            'id': question_id,
+            'text': text,
+            'options': [
+                (position, OPTION_LABELS[position - 1], options[option - 1])
+                for position, option in enumerate(order, 1)
+            ],
+        })
+    return paper
+
+
+def _question_rows(questions):
+    return [
+        (question.id, question.text, (question.option_1, question.option_2, question.option_3, question.option_4))
+        for question in questions
+    ]
+
+
+def render_paper(quiz):
+    """Render the question section of `quiz` without any per-student data."""
+    return render_to_string('exams/_paper.html', {
+        'questions': _paper_questions(_question_rows(quiz.question_set.order_by('id'))),
+    })
+
+
+def cache_paper(quiz):
+    """Render and store the paper for the current version of `quiz`."""
+    if quiz.is_randomized:
+        return None
+    html = render_paper(quiz)
+    cache.set(_paper_key(quiz), zlib.compress(html.encode('utf-8')), PAPER_TIMEOUT)
+    return mark_safe(html)
+
+
+def get_paper(quiz, user):
+    """Return the rendered question section of `quiz` as `user` should see it."""
+    if quiz.is_randomized:
+        return render_student_paper(quiz, user)
+    compressed = cache.get(_paper_key(quiz))
+    if compressed is None:
+        return cache_paper(quiz)
+    return mark_safe(zlib.decompress(compressed).decode('utf-8'))
+
+
+def paper_length(quiz):
+    """Number of questions on each student's paper of `quiz`."""
+    if not quiz.is_randomized:
+        return quiz.question_count
+    width = len(get_answer_key(quiz))  # the bank, after the tag filter
+    return min(quiz.draw_count, width) if quiz.draw_count else width
+
+
+def paper_seed(quiz_id, user_id):
+    """Deterministic, unguessable 64-bit seed of one student's paper."""
+    digest = hmac.new(
+        settings.SECRET_KEY.encode('utf-8'), f'exams.paper:{quiz_id}:{user_id}'.encode('ascii'), hashlib.sha256,
+    ).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+@dataclass
+class PaperDraw:
+    # Answer-key columns on the paper, in the order they are shown
+    columns: np.ndarray
+    # (questions, 4): the real option shown at each position, or None when options are not shuffled
+    option_orders: np.ndarray = None
+
+    def sheet(self, selected):
+        """
+        Map the option positions a student picked (one per answer-key column)
+        to the real options, marking questions not on the paper NOT_SERVED.
+        """
+        sheet = np.full(len(selected), NOT_SERVED, dtype=np.uint8)
+        shown = selected[self.columns]
+        if self.option_orders is not None:
+            picked = self.option_orders[np.arange(len(shown)), np.maximum(shown, 1) - 1]
+            shown = np.where(shown > 0, picked, 0)
+        sheet[self.columns] = shown
+        return sheet
+
+
+def draw_paper(quiz, key, user_id):
+    """Rebuild the paper `user_id` gets for the version of `quiz` that `key` grades."""
+    rng = np.random.default_rng(paper_seed(quiz.pk, user_id))
+    width = len(key)
+    if quiz.draw_count:
+        columns = rng.choice(width, size=min(quiz.draw_count, width), replace=False)
+    else:
+        columns = np.arange(width)
+    option_orders = None
+    if quiz.shuffle_options:
+        option_orders = rng.permuted(np.tile(np.arange(1, 5, dtype=np.uint8), (len(columns), 1)), axis=1)
+    return PaperDraw(columns, option_orders)
+
+
+def _question_bank(quiz, key):
+    """Question text and options of every answer-key column, cached per version."""
+    bank = cache.get(_bank_key(quiz, key.version))
+    if bank is None:
+        questions = Question.objects.in_bulk(key.question_ids.tolist())
+        bank = _question_rows(questions[question_id] for question_id in key.question_ids.tolist())
+        cache.set(_bank_key(quiz, key.version), bank, PAPER_TIMEOUT)
+    return bank
+
+
+def render_student_paper(quiz, user):
+    """Render `user`'s individual paper of a randomized quiz."""
+    key = get_answer_key(quiz)
+    draw = draw_paper(quiz, key, user.pk)
+    bank = _question_bank(quiz, key)
+    return mark_safe(render_to_string('exams/_paper.html', {
+        'questions': _paper_questions([bank[column] for column in draw.columns.tolist()], draw.option_orders),
+    }))
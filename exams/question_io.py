@@ -0,0 +1,347 @@
+"""
+Question import and export in CSV, JSON, Aiken and GIFT.
+
+Uploads are parsed as a stream, one record at a time, so memory does not
+grow with the size of the bank. Every record is validated against
+Question's fields, and valid questions are inserted in chunks with
+bulk_create inside one transaction. If any record is invalid, nothing is
+kept and the errors are reported with the line they start on.
+
+Exports stream the same four formats back, and an exported file imports
+unchanged. Only single-answer, four-option questions fit the Question
+model; anything else in Aiken or GIFT files is reported as an error.
+
+CSV   header row with text, option_1..option_4, correct_answer (1-4 or A-D),
+      marks and tags; marks and tags may be left out.
+JSON  an array of objects with the CSV column names, or one object per line.
+Aiken the question, four "A. option" lines and "ANSWER: X".
+GIFT  "::title:: question { =right ~wrong ~wrong ~wrong }". Marks and tags
+      travel in "// marks: N" and "// tags: a, b" comments, and
+      $CATEGORY lines tag the questions that follow.
+"""
+import csv
+import io
+import json
+import re
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import Question, parse_tags
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+JSON_READ_SIZE = 64 * 1024
+JSON_MAX_RECORD = 1024 * 1024
+
+FORMAT_CHOICES = [('csv', 'CSV'), ('json', 'JSON'), ('aiken', 'Aiken'), ('gift', 'GIFT')]
+EXTENSIONS = {'.csv': 'csv', '.json': 'json', '.jsonl': 'json', '.txt': 'aiken', '.aiken': 'aiken', '.gift': 'gift'}
+CONTENT_TYPES = {'csv': 'text/csv', 'json': 'application/json', 'aiken': 'text/plain', 'gift': 'text/plain'}
+FILE_EXTENSIONS = {'csv': 'csv', 'json': 'json', 'aiken': 'txt', 'gift': 'gift'}
+
+COLUMNS = ('text', 'option_1', 'option_2', 'option_3', 'option_4', 'correct_answer', 'marks', 'tags')
+LETTERS = 'ABCD'
+
+
+@dataclass
+class ImportReport:
+    created: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)  # (line, message), first MAX_REPORTED_ERRORS
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def detect_format(filename):
+    """Guess the format from a file name, or None."""
+    match = re.search(r'\.\w+$', filename or '')
+    return EXTENSIONS.get(match.group(0).lower()) if match else None
+
+
+def _build_question(quiz, record):
+    """Validate one parsed record. Returns an unsaved Question or raises ValidationError."""
+    correct = str(record.get('correct_answer') or '').strip().upper()
+    if correct in LETTERS and correct:
+        correct = LETTERS.index(correct) + 1
+    tags = record.get('tags')
+    if isinstance(tags, (list, tuple)) and all(isinstance(tag, str) for tag in tags):
+        # JSON may carry tags as an array
+        tags = ','.join(tags)
+    elif tags is not None and not isinstance(tags, str):
+        raise ValidationError({'tags': ['Enter the tags as text or a list of text.']})
+    question = Question(
+        quiz=quiz,
+        text=str(record.get('text') or '').strip(),
+        option_1=str(record.get('option_1') or '').strip(),
+        option_2=str(record.get('option_2') or '').strip(),
+        option_3=str(record.get('option_3') or '').strip(),
+        option_4=str(record.get('option_4') or '').strip(),
+        correct_answer=correct,
+        marks=record.get('marks') if record.get('marks') not in (None, '') else 1,
+        tags=','.join(parse_tags(tags)),
+    )
+    question.full_clean(exclude=['quiz'], validate_unique=False, validate_constraints=False)
+    return question
+
+
+def _describe(error):
+    return '; '.join(
+        f"{name}: {' '.join(messages)}" if name != '__all__' else ' '.join(messages)
+        for name, messages in error.message_dict.items()
+    )
+
+
+def import_questions(quiz, stream, file_format, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Add the questions in the text `stream` to `quiz`. Returns an ImportReport;
+    nothing is saved unless every record is valid.
+    """
+    report = ImportReport()
+    chunk = []
+    with transaction.atomic():
+        for line, record in PARSERS[file_format](stream):
+            if isinstance(record, str):
+                report.add_error(line, record)
+                continue
+            try:
+                question = _build_question(quiz, record)
+            except ValidationError as error:
+                report.add_error(line, _describe(error))
+                continue
+            if report.error_count:
+                # Keep validating to report every problem, but stop writing
+                continue
+            chunk.append(question)
+            if len(chunk) >= chunk_size:
+                Question.objects.bulk_create(chunk)
+                report.created += len(chunk)
+                chunk = []
+        if chunk and not report.error_count:
+            Question.objects.bulk_create(chunk)
+            report.created += len(chunk)
+        if report.error_count:
+            transaction.set_rollback(True)
+            report.created = 0
+    return report
+
+
+# Parsers: each takes a text stream and yields (line number, record dict or error message)
+
+def _parse_csv(stream):
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None:
+        return
+    header = [name.strip().lower() for name in reader.fieldnames]
+    missing = [name for name in COLUMNS[:6] if name not in header]
+    if missing:
+        yield 1, f"Missing column(s): {', '.join(missing)}"
+        return
+    reader.fieldnames = header
+    for row in reader:
+        if not any((value or '').strip() for value in row.values() if isinstance(value, str)):
+            continue
+        yield reader.line_num, row
+
+
+def _parse_json(stream):
+    decoder = json.JSONDecoder()
+    buffer, position, line, eof = '', 0, 1, False
+    started = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        data = stream.read(JSON_READ_SIZE)
+        if not data:
+            eof = True
+        buffer = buffer[position:] + data
+        position = 0
+
+    while True:
+        # Skip whitespace and separators, counting lines
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+                if buffer[position] == '\n':
+                    line += 1
+                elif buffer[position] == '[':
+                    if started:
+                        yield line, 'Unexpected "["'
+                        return
+                started = True
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            fill()
+        if position >= len(buffer):
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as error:
+            if not eof and len(buffer) - position < JSON_MAX_RECORD:
+                fill()
+                continue
+            yield line + buffer.count('\n', position, error.pos), f'Invalid JSON: {error.msg}'
+            return
+        started = True
+        if isinstance(record, dict):
+            yield line, record
+        else:
+            yield line, 'Expected a JSON object'
+        line += buffer.count('\n', position, end)
+        position = end
+
+
+AIKEN_OPTION_RE = re.compile(r'^([A-Z])[.)]\s+(.*)$')
+AIKEN_ANSWER_RE = re.compile(r'^ANSWER:\s*([A-Z])\s*$', re.IGNORECASE)
+
+
+def _parse_aiken(stream):
+    start, text, options = None, [], []
+    for number, raw in enumerate(stream, 1):
+        value = raw.rstrip('\r\n').strip()
+        if not value:
+            continue
+        if start is None:
+            start = number
+        answer = AIKEN_ANSWER_RE.match(value)
+        option = AIKEN_OPTION_RE.match(value)
+        if answer:
+            if len(options) != 4 or [letter for letter, _ in options] != list(LETTERS):
+                yield start, f'Expected options A-D, found {len(options)}'
+            else:
+                record = {'text': ' '.join(text), 'correct_answer': answer.group(1).upper()}
+                record.update({f'option_{index}': option_text for index, (_, option_text) in enumerate(options, 1)})
+                yield start, record
+            start, text, options = None, [], []
+        elif option and text:
+            options.append((option.group(1), option.group(2)))
+        elif options:
+            yield start, 'Missing ANSWER line'
+            start, text, options = number, [value], []
+        else:
+            text.append(value)
+    if start is not None:
+        yield start, 'Missing ANSWER line'
+
+
+GIFT_META_RE = re.compile(r'^//\s*(marks|tags):\s*(.*)$', re.IGNORECASE)
+GIFT_ESCAPE_RE = re.compile(r'\\([~=#{}:\\])')
+GIFT_SPLIT_RE = re.compile(r'(?<!\\)([=~])')
+
+
+def _gift_unescape(value):
+    return GIFT_ESCAPE_RE.sub(r'\1', value).strip()
+
+
+def _gift_question(lines, category, meta):
+    source = ' '.join(lines)
+    match = re.match(r'^(?:::(.*?)::)?\s*(.*?)(?<!\\)\{(.*?)(?<!\\)\}\s*$', source, re.DOTALL)
+    if not match:
+        return 'Expected "question { =right ~wrong ... }"'
+    text = re.sub(r'^\[\w+\]', '', match.group(2)).strip()
+    parts = GIFT_SPLIT_RE.split(match.group(3))
+    answers = []
+    for marker, body in zip(parts[1::2], parts[2::2]):
+        body = re.split(r'(?<!\\)#', body)[0]
+        body = re.sub(r'^%-?[\d.]+%', '', body.strip())
+        answers.append((marker, _gift_unescape(body)))
+    correct = [index for index, (marker, _) in enumerate(answers, 1) if marker == '=']
+    if len(answers) != 4 or len(correct) != 1:
+        return 'Only multiple choice questions with four options and one right answer are supported'
+    record = {'text': _gift_unescape(text), 'correct_answer': correct[0], 'tags': meta.get('tags', category)}
+    record.update({f'option_{index}': answer for index, (_, answer) in enumerate(answers, 1)})
+    if 'marks' in meta:
+        record['marks'] = meta['marks']
+    return record
+
+
+def _parse_gift(stream):
+    category, meta, lines, start = '', {}, [], None
+    for number, raw in enumerate(stream, 1):
+        value = raw.rstrip('\r\n').strip()
+        if not value:
+            if lines:
+                yield start, _gift_question(lines, category, meta)
+                meta, lines, start = {}, [], None
+            continue
+        if value.startswith('//'):
+            found = GIFT_META_RE.match(value)
+            if found:
+                meta[found.group(1).lower()] = found.group(2).strip()
+            continue
+        if value.startswith('$CATEGORY:') and not lines:
+            path = [part for part in value[len('$CATEGORY:'):].strip().split('/') if not part.startswith('$')]
+            category = path[-1].strip() if path else ''
+            continue
+        if start is None:
+            start = number
+        lines.append(value)
+    if lines:
+        yield start, _gift_question(lines, category, meta)
+
+
+PARSERS = {'csv': _parse_csv, 'json': _parse_json, 'aiken': _parse_aiken, 'gift': _parse_gift}
+
+
+# Exports: each takes a values() iterator of questions and yields text chunks
+
+def _export_csv(questions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for question in questions:
+        writer.writerow([question[column] for column in COLUMNS])
+        if buffer.tell() > 32 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _export_json(questions):
+    separator = '[\n'
+    for question in questions:
+        yield separator + json.dumps({column: question[column] for column in COLUMNS}, ensure_ascii=False)
+        separator = ',\n'
+    yield '[]\n' if separator == '[\n' else '\n]\n'
+
+
+def _single_line(value):
+    return ' '.join(value.split())
+
+
+def _export_aiken(questions):
+    for question in questions:
+        lines = [_single_line(question['text'])]
+        lines += [f"{letter}. {_single_line(question[f'option_{index}'])}" for index, letter in enumerate(LETTERS, 1)]
+        lines.append(f"ANSWER: {LETTERS[question['correct_answer'] - 1]}")
+        yield '\n'.join(lines) + '\n\n'
+
+
+def _gift_escape(value):
+    return re.sub(r'([~=#{}:\\])', r'\\\1', _single_line(value))
+
+
+def _export_gift(questions):
+    for question in questions:
+        answers = ' '.join(
+            ('=' if question['correct_answer'] == index else '~') + _gift_escape(question[f'option_{index}'])
+            for index in range(1, 5)
+        )
+        lines = [f"// marks: {question['marks']}"]
+        if question['tags']:
+            lines.append(f"// tags: {question['tags']}")
+        lines.append(f"{_gift_escape(question['text'])} {{ {answers} }}")
+        yield '\n'.join(lines) + '\n\n'
+
+
+EXPORTERS = {'csv': _export_csv, 'json': _export_json, 'aiken': _export_aiken, 'gift': _export_gift}
+
+
+def export_questions(quiz, file_format):
+    """Stream the questions of `quiz` in `file_format`."""
+    questions = quiz.question_set.order_by('id').values(*COLUMNS).iterator(chunk_size=2000)
+    return EXPORTERS[file_format](questions)
@@ -0,0 +1,96 @@
+"""
+Persist the questions submitted with the quiz create/edit forms.
+
+The forms post one `questions-<n>-<field>` value per question field. They are
+parsed in a single pass and compared against the stored questions so that a
+save costs one SELECT, one bulk_create, one bulk_update and one DELETE at
+most, whatever the number of questions.
+"""
+import re
+from dataclasses import dataclass
+
+from django.db import transaction
+
+from .models import Question, parse_tags
+
+QUESTION_KEY_RE = re.compile(r'^questions-(\d+)-(\w+)$')
+QUESTION_FIELDS = ('text', 'option_1', 'option_2', 'option_3', 'option_4', 'correct_answer', 'marks', 'tags')
+REQUIRED_FIELDS = ('text', 'option_1', 'option_2', 'option_3', 'option_4', 'correct_answer')
+
+
+@dataclass
+class SyncResult:
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+
+    @property
+    def changed(self):
+        return bool(self.created or self.updated or self.deleted)
+
+
+def parse_questions(data):
+    """
+    Group `questions-<n>-<field>` values by form index.
+
+    Returns a list of (question_id, fields) tuples in form order, skipping
+    incomplete or invalid rows. question_id is None for new questions.
+    """
+    rows = {}
+    for key, value in data.items():
+        match = QUESTION_KEY_RE.match(key)
+        if match:
+            rows.setdefault(int(match.group(1)), {})[match.group(2)] = value
+
+    questions = []
+    for index in sorted(rows):
+        row = rows[index]
+        if not all(row.get(field) for field in REQUIRED_FIELDS):
+            continue
+        try:
+            fields = {field: row[field] for field in REQUIRED_FIELDS}
+            fields['correct_answer'] = int(row['correct_answer'])
+            fields['marks'] = int(row.get('marks') or 1)
+            fields['tags'] = ','.join(parse_tags(row.get('tags')))
+            question_id = int(row['id']) if row.get('id') else None
+        except ValueError:
+            continue
+        if fields['correct_answer'] not in (1, 2, 3, 4) or fields['marks'] < 0:
+            continue
+        questions.append((question_id, fields))
+    return questions
+
+
+def sync_questions(quiz, questions):
+    """
+    Make the stored questions of `quiz` match `questions` (see parse_questions).
+
+    Rows are matched by id; unchanged rows are left alone, changed rows are
+    updated, unknown rows are inserted and missing rows are deleted.
+    """
+    result = SyncResult()
+    with transaction.atomic():
+        existing = {question.pk: question for question in Question.objects.filter(quiz=quiz)}
+        seen = set()
+        to_create, to_update = [], []
+
+        for question_id, fields in questions:
+            question = existing.get(question_id)
+            if question is None or question_id in seen:
+                to_create.append(Question(quiz=quiz, **fields))
+                continue
+            seen.add(question_id)
+            if any(getattr(question, name) != value for name, value in fields.items()):
+                for name, value in fields.items():
+                    setattr(question, name, value)
+                to_update.append(question)
+
+        stale = existing.keys() - seen
+        if stale:
+            result.deleted, _ = Question.objects.filter(pk__in=stale).delete()
+        if to_update:
+            result.updated = Question.objects.bulk_update(to_update, QUESTION_FIELDS)
+        if to_create:
+            Question.objects.bulk_create(to_create)
+            result.created = len(to_create)
+    return result
@@ -0,0 +1,14 @@
+"""
+Signals for writes that bypass post_save / post_delete.
+
+Grading, regrading and question-stat refreshes write with bulk_create and
+update(), which send no model signals. They send these instead, so caches
+invalidated from model signals (see users.dashboard) hear about them too.
+"""
+from django.dispatch import Signal
+
+# Results created or rescored; kwargs: quiz_ids, user_ids
+results_changed = Signal()
+
+# Quiz.question_count / total_marks recomputed; kwargs: quiz_ids
+question_stats_changed = Signal()
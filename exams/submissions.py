@@ -0,0 +1,213 @@
+"""
+Submission intake and batched grading.
+
+quiz_attempt only appends the raw answers to the PendingSubmission table and
+answers the student straight away. Grading happens in batches, normally in
+the `grade_submissions` worker: a batch is claimed with a lease, graded
+against the cached answer keys, written with one bulk_create and removed from
+the queue. Result's unique (user, quiz) constraint still guarantees a single
+attempt. The queue rows are locked while a batch is written, so a batch
+claimed twice (a lease ran out) is only graded and counted once. The
+security data posted with an attempt is parsed into ViolationEvent rows in
+the same transaction (see exams.violations).
+
+If no worker picks a submission up within EXAM_GRADING_FALLBACK_SECONDS, the
+submission status page grades it in the request instead, so results never
+get stuck when the worker is not running.
+"""
+import json
+import logging
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .answer_sheets import pack_answers
+from .attempts import forget_completed
+from .grading import get_answer_key
+from .item_analysis import record_attempts
+from .leaderboard import record_scores
+from .models import PendingSubmission, Result
+from .papers import draw_paper
+from .signals import results_changed
+from .violations import build_violation_events, save_violation_events
+
+logger = logging.getLogger(__name__)
+
+CLAIM_LEASE = timedelta(minutes=2)
+
+
+def enqueue_submission(user, quiz, data):
+    """
+    Store the answers posted for `quiz`. Returns False if the student
+    already has a submission waiting for this quiz.
+    """
+    answers = {key: value for key, value in data.items() if key[:1] == 'q' and key[1:].isdigit()}
+    try:
+        with transaction.atomic():
+            PendingSubmission.objects.create(
+                user=user,
+                quiz=quiz,
+                answers=json.dumps(answers, separators=(',', ':')),
+                submission_reason=data.get('submission_reason', 'manual'),
+                security_data=data.get('security_data', '{}'),
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def _claimable(now):
+    """Submissions nobody holds a lease on (never claimed, or the claimer died)."""
+    return PendingSubmission.objects.filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - CLAIM_LEASE))
+
+
+def claim_batch(limit):
+    """Lease up to `limit` waiting submissions to the caller."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            _claimable(now)
+            .select_for_update(skip_locked=True)
+            .order_by('received_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        PendingSubmission.objects.filter(id__in=ids).update(claimed_at=now)
+    return list(PendingSubmission.objects.filter(id__in=ids, claimed_at=now).select_related('quiz'))
+
+
+def _grade(submission):
+    """Grade one submission. Returns its unsaved Result and the answer sheet it was scored from."""
+    quiz = submission.quiz
+    key = get_answer_key(quiz)
+    selected = key.selected_options(json.loads(submission.answers))
+    if quiz.is_randomized:
+        # Rebuild the student's paper to know what they were shown
+        selected = draw_paper(quiz, key, submission.user_id).sheet(selected)
+    score, total_marks, _ = key.score(selected)
+    percentage = (score / total_marks * 100) if total_marks > 0 else 0
+    result = Result(
+        user_id=submission.user_id,
+        quiz=quiz,
+        score=percentage,
+        passed=percentage >= quiz.passing_score,
+        submission_reason=submission.submission_reason,
+        answers=pack_answers(selected),
+        quiz_version=key.version,
+    )
+    return result, key, selected
+
+
+def grade_batch(submissions):
+    """
+    Grade claimed submissions and insert their results. Returns the number graded.
+
+    Submissions another worker finished in the meantime (its lease expired
+    and the batch was claimed twice) are skipped, so nothing is counted twice.
+    """
+    if not submissions:
+        return 0
+    graded = [(submission, *_grade(submission)) for submission in submissions]
+
+    with transaction.atomic():
+        # Lock the queue rows: whoever gets them first grades them, the other finds them gone
+        waiting = set(
+            PendingSubmission.objects.select_for_update()
+            .filter(id__in=[submission.id for submission in submissions])
+            .values_list('id', flat=True)
+        )
+        done = set(
+            Result.objects.filter(
+                user_id__in={submission.user_id for submission in submissions},
+                quiz_id__in={submission.quiz_id for submission in submissions},
+            ).values_list('user_id', 'quiz_id')
+        )
+        graded = [
+            row for row in graded
+            if row[0].id in waiting and (row[0].user_id, row[0].quiz_id) not in done
+        ]
+        Result.objects.bulk_create([result for _, result, _, _ in graded])
+        violations = [
+            event
+            for submission, _, _, _ in graded
+            for event in build_violation_events(
+                submission.user_id, submission.quiz_id, None,
+                submission.security_data, submission.submission_reason, submission.received_at,
+            )
+        ]
+        # Also claims events already reported live by the attempt page
+        save_violation_events(violations, {(submission.user_id, submission.quiz_id) for submission, *_ in graded})
+        PendingSubmission.objects.filter(id__in=waiting).delete()
+
+    if graded:
+        try:
+            _after_grading(graded)
+        except Exception:
+            # The results are stored; only the derived caches and statistics are behind
+            logger.exception('Bookkeeping after grading %d submission(s) failed', len(graded))
+    return len(graded)
+
+
+def _after_grading(graded):
+    """Update the caches and statistics derived from newly inserted results."""
+    forget_completed({submission.user_id for submission, *_ in graded})
+    results_changed.send(
+        sender=Result,
+        quiz_ids={submission.quiz_id for submission, *_ in graded},
+        user_ids={submission.user_id for submission, *_ in graded},
+    )
+    sheets = {}
+    for _, result, key, selected in graded:
+        quiz, _, rows = sheets.setdefault(result.quiz_id, (result.quiz, key, []))
+        rows.append((selected, int(result.score)))
+    for quiz, key, rows in sheets.values():
+        selected = np.array([sheet for sheet, _ in rows], dtype=np.uint8).reshape(len(rows), len(key))
+        record_attempts(quiz, key, selected)
+        record_scores(quiz.pk, [score for _, score in rows])
+
+
+def process_pending(batch_size=200):
+    """
+    Claim and grade one batch. Returns the number of submissions graded.
+
+    If the batch fails, its submissions are graded one at a time so a single
+    bad one cannot hold up the rest. Those that still fail keep their lease
+    and are tried again once it expires.
+    """
+    submissions = claim_batch(batch_size)
+    try:
+        return grade_batch(submissions)
+    except Exception:
+        logger.exception('Grading a batch of %d submission(s) failed; retrying them one by one', len(submissions))
+    graded = 0
+    for submission in submissions:
+        try:
+            graded += grade_batch([submission])
+        except Exception:
+            logger.exception('Could not grade submission %s; retrying after %s', submission.pk, CLAIM_LEASE)
+    return graded
+
+
+def grade_overdue(user, quiz):
+    """
+    Grade the student's waiting submission in-process if no worker has
+    handled it within EXAM_GRADING_FALLBACK_SECONDS. Returns True if graded.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.EXAM_GRADING_FALLBACK_SECONDS)
+    claimed = _claimable(now).filter(user=user, quiz=quiz, received_at__lte=cutoff).update(claimed_at=now)
+    if not claimed:
+        return False
+    try:
+        return bool(grade_batch(list(
+            PendingSubmission.objects.filter(user=user, quiz=quiz, claimed_at=now).select_related('quiz')
+        )))
+    except Exception:
+        # The student keeps seeing the grading page; the worker retries once the lease expires
+        logger.exception('Could not grade the overdue submission of user %s for quiz %s', user.pk, quiz.pk)
+        return False
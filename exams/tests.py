@@ -1,3 +1,788 @@
-from django.test import TestCase
+import io
+import json
+import random
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from users.models import CustomUser
+from users.testing import QueryBudgetMixin, seed_dataset
+
+from . import beacons, grading, urls
+from .answer_sheets import load_response_matrix
+from .attempt_tokens import issue_attempt_token, read_attempt_token
+from .attempts import attach_attempts
+from .grading import compile_answer_key, get_answer_key, invalidate_answer_key
+from .item_analysis import compute_item_stats, get_item_stats
+from .management.commands import load_exam_day
+from .leaderboard import build_distribution, get_distribution, get_standing, leaderboard_page
+from .models import AnswerKeySnapshot, AttemptStart, PendingSubmission, Question, Quiz, Result, ViolationEvent
+from .papers import draw_paper, get_paper, render_paper
+from .question_io import export_questions, import_questions
+from .question_sync import parse_questions, sync_questions
+from .regrade import regrade_quiz
+from .submissions import claim_batch, enqueue_submission, grade_batch, process_pending
+from .violations import build_violation_events, parse_security_data, save_violation_events
+
+# (URL name, who is logged in, most queries allowed, method)
+QUERY_BUDGETS = [
+    ('quiz_list', 'student', 5, 'get'),
+    ('quiz_list', 'faculty', 3, 'get'),
+    ('quiz_create', 'faculty', 2, 'get'),
+    ('quiz_detail', 'student', 7, 'get'),
+    ('quiz_detail', 'faculty', 12, 'get'),
+    ('quiz_edit', 'faculty', 5, 'get'),
+    ('quiz_delete', 'faculty', 4, 'get'),
+    ('question_import', 'faculty', 4, 'get'),
+    ('question_export', 'faculty', 5, 'get'),
+    ('quiz_leaderboard', 'faculty', 5, 'get'),
+    ('quiz_attempt', 'student', 8, 'get'),
+    ('quiz_beacon', 'student', 2, 'post'),
+    ('submission_status', 'student', 4, 'get'),
+    ('quiz_result', 'student', 4, 'get'),
+    ('results', 'hod', 6, 'get'),
+    ('results_export', 'hod', 4, 'get'),
+    ('violations', 'hod', 4, 'get'),
+    ('violations', 'faculty', 4, 'get'),
+    ('quiz_regrade', 'faculty', 19, 'post'),
+]
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every exams page stays within its query budget on a large dataset."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hod = seed_dataset()
+        cls.faculty = CustomUser.objects.get(username='faculty0')
+        cls.quiz = Quiz.objects.filter(creator=cls.faculty).first()
+        cls.result = Result.objects.filter(quiz=cls.quiz).select_related('user').first()
+        cls.student = cls.result.user
+        cls.unattempted = Quiz.objects.exclude(result__user=cls.student).first()
+
+    def url(self, name):
+        if name in ('quiz_list', 'quiz_create', 'results', 'violations'):
+            return reverse(f'exams:{name}')
+        if name == 'results_export':
+            return reverse('exams:results_export', args=['csv'])
+        if name == 'question_export':
+            return reverse('exams:question_export', args=[self.quiz.pk, 'csv'])
+        if name == 'quiz_result':
+            return reverse('exams:quiz_result', args=[self.result.pk])
+        if name in ('quiz_attempt', 'quiz_beacon'):
+            return reverse(f'exams:{name}', args=[self.unattempted.pk])
+        return reverse(f'exams:{name}', args=[self.quiz.pk])
+
+    def test_query_budgets(self):
+        for name, who, budget, method in QUERY_BUDGETS:
+            with self.subTest(url=name, user=who):
+                cache.clear()
+                self.client.force_login(getattr(self, who))
+                self.assertQueryBudget(budget, self.url(name), method, status_codes=(200, 204, 302))
+
+    def test_every_url_has_a_budget(self):
+        self.assertCoversUrls(urls.urlpatterns, [name for name, *_ in QUERY_BUDGETS])
+
+
+def make_quiz(creator, questions, **fields):
+    """A quiz with one question per (correct option, marks[, tags]) in `questions`."""
+    quiz = Quiz.objects.create(title='Quiz', description='', duration=30, passing_score=50, creator=creator, **fields)
+    quiz.assigned_faculty.add(creator)
+    Question.objects.bulk_create([
+        Question(quiz=quiz, text=f'Question {n}', option_1='a', option_2='b', option_3='c', option_4='d',
+                 correct_answer=question[0], marks=question[1], tags=question[2] if len(question) > 2 else '')
+        for n, question in enumerate(questions)
+    ])
+    quiz.refresh_from_db()
+    return quiz
+
+
+class ExamsTestCase(TestCase):
+    """Clears the caches the exams app keeps between tests, since ids are reused after each rollback."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.faculty = CustomUser.objects.create(username='teacher', email='teacher@example.com', role='FACULTY',
+                                                is_email_verified=True)
+        cls.student = CustomUser.objects.create(username='asha', email='asha@example.com', is_email_verified=True)
+
+    def setUp(self):
+        cache.clear()
+        grading._local_keys.clear()
+
+
+class GradingTests(ExamsTestCase):
+    """Submissions are graded from a compiled, cached answer key."""
+
+    def test_grades_against_the_key(self):
+        quiz = make_quiz(self.faculty, [(1, 2), (3, 1), (4, 5)])
+        key = get_answer_key(quiz)
+        first, second, third = key.question_ids.tolist()
+        self.assertEqual(key.total_marks, 8)
+        # Wrong, right, and an invalid option that counts as unanswered
+        self.assertEqual(key.grade({f'q{first}': '2', f'q{second}': '3', f'q{third}': '9'}), (1, 8, 1))
+        self.assertEqual(key.grade({}), (0, 8, 0))
+
+    def test_key_is_cached(self):
+        quiz = make_quiz(self.faculty, [(1, 1)])
+        get_answer_key(quiz)
+        with self.assertNumQueries(0):
+            get_answer_key(quiz)
+        grading._local_keys.clear()
+        with self.assertNumQueries(0):
+            get_answer_key(quiz)  # from the shared cache
+
+    def test_invalidation_moves_to_a_new_version(self):
+        quiz = make_quiz(self.faculty, [(1, 1)])
+        old = get_answer_key(quiz)
+        Question.objects.filter(quiz=quiz).update(correct_answer=2)
+        invalidate_answer_key(quiz)
+        new = get_answer_key(quiz)
+        self.assertEqual((old.version, new.version), (0, 1))
+        self.assertEqual(new.correct.tolist(), [2])
+        self.assertEqual(AnswerKeySnapshot.objects.filter(quiz=quiz).count(), 2)
+
+    def test_changes_without_a_version_bump_get_their_own_version(self):
+        quiz = make_quiz(self.faculty, [(1, 1)])
+        compile_answer_key(quiz)
+        Question.objects.filter(quiz=quiz).update(correct_answer=3)
+        key = compile_answer_key(quiz)
+        self.assertEqual((key.version, quiz.version, key.correct.tolist()), (1, 1, [3]))
+
+
+def question_post(*questions):
+    """Form data for the quiz forms: one dict of question fields (plus an optional id) per question."""
+    data = {}
+    for index, question in enumerate(questions):
+        fields = {'text': f'Question {index}', 'option_1': 'a', 'option_2': 'b', 'option_3': 'c', 'option_4': 'd',
+                  'correct_answer': '1', 'marks': '1', **question}
+        data.update({f'questions-{index}-{name}': str(value) for name, value in fields.items()})
+    return data
+
+
+class QuestionSyncTests(ExamsTestCase):
+    """Saving the quiz form writes only what changed, in bulk."""
+
+    def test_parse_skips_incomplete_and_invalid_rows(self):
+        questions = parse_questions(question_post(
+            {'tags': ' Algebra, algebra ,Geometry'}, {'text': ''}, {'correct_answer': '5'}, {'marks': 'many'},
+        ))
+        self.assertEqual(len(questions), 1)
+        self.assertEqual(questions[0][1]['tags'], 'algebra,geometry')
+
+    def test_creates_updates_and_deletes(self):
+        quiz = make_quiz(self.faculty, [(1, 1), (2, 1), (3, 1)])
+        keep, change, drop = Question.objects.filter(quiz=quiz).order_by('id')
+        questions = parse_questions(question_post(
+            {'id': keep.pk, 'text': keep.text},
+            {'id': change.pk, 'text': change.text, 'correct_answer': '4'},
+            {'text': 'New question', 'marks': '3'},
+        ))
+        with CaptureQueriesContext(connection) as queries:
+            result = sync_questions(quiz, questions)
+        writes = [query['sql'].split()[0] for query in queries
+                  if re.match(r'(INSERT INTO|UPDATE|DELETE FROM) "exams_question"', query['sql'])]
+        self.assertEqual(writes, ['DELETE', 'UPDATE', 'INSERT'])
+        self.assertEqual((result.created, result.updated, result.deleted), (1, 1, 1))
+        self.assertFalse(Question.objects.filter(pk=drop.pk).exists())
+        self.assertEqual(Question.objects.get(pk=change.pk).correct_answer, 4)
+        quiz.refresh_from_db()
+        self.assertEqual((quiz.question_count, quiz.total_marks), (3, 5))
+
+    def test_unchanged_questions_are_not_written(self):
+        quiz = make_quiz(self.faculty, [(1, 1)])
+        question = Question.objects.get(quiz=quiz)
+        questions = parse_questions(question_post({'id': question.pk, 'text': question.text}))
+        with self.assertNumQueries(3):  # savepoint, select, release
+            self.assertFalse(sync_questions(quiz, questions).changed)
+
+
+QUIZ_FORM = {'title': 'Algebra', 'description': 'Week 3', 'duration': '30', 'passing_score': '50', 'draw_count': '0'}
+
+
+class QuizFormTests(ExamsTestCase):
+    """Creating and editing quizzes keeps the stored question stats and version consistent."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.faculty)
+
+    def test_create_stores_question_stats(self):
+        self.client.post(reverse('exams:quiz_create'), {**QUIZ_FORM, **question_post({'marks': '2'}, {'marks': '3'})})
+        quiz = Quiz.objects.get(title='Algebra')
+        self.assertEqual((quiz.question_count, quiz.total_marks), (2, 5))
+
+    def test_negative_marks_are_rejected(self):
+        response = self.client.post(reverse('exams:quiz_create'), {**QUIZ_FORM, **question_post({'marks': '-3'})})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Please add at least one question')
+        self.assertFalse(Quiz.objects.exists())
+
+    def test_edit_does_not_overwrite_a_concurrent_version_bump(self):
+        quiz = make_quiz(self.faculty, [(1, 1)])
+        question = Question.objects.get(quiz=quiz)
+
+        def concurrent_edit(data):
+            # Another request moves the quiz to a new version while this one is running
+            Quiz.objects.filter(pk=quiz.pk).update(version=5)
+            return parse_questions(data)
+
+        with mock.patch('exams.views.parse_questions', side_effect=concurrent_edit):
+            self.client.post(reverse('exams:quiz_edit', args=[quiz.pk]), {
+                **QUIZ_FORM, 'title': 'Renamed', **question_post({'id': question.pk, 'text': question.text, 'marks': '4'}),
+            })
+        quiz.refresh_from_db()
+        self.assertEqual((quiz.title, quiz.version, quiz.question_count, quiz.total_marks), ('Renamed', 6, 1, 4))
+
+
+class AttemptLookupTests(ExamsTestCase):
+    """Quiz pages find the student's results with at most one query, and never miss one."""
+
+    def setUp(self):
+        super().setUp()
+        self.quizzes = [make_quiz(self.faculty, [(1, 1)]) for _ in range(3)]
+
+    @override_settings(CACHE_IS_SHARED=True)
+    def test_cached_completed_quizzes_skip_the_result_query(self):
+        with self.assertNumQueries(1):  # building the set
+            attach_attempts(self.student, self.quizzes)
+        with self.assertNumQueries(0):
+            attach_attempts(self.student, self.quizzes)
+
+        enqueue_submission(self.student, self.quizzes[1], {f'q{get_answer_key(self.quizzes[1]).question_ids[0]}': '1'})
+        process_pending()
+        with self.assertNumQueries(2):  # grading dropped the set: rebuild, then the one result
+            quizzes = attach_attempts(self.student, self.quizzes)
+        self.assertEqual([quiz.user_results is not None for quiz in quizzes], [False, True, False])
+
+    @override_settings(CACHE_IS_SHARED=False)
+    def test_per_process_cache_is_not_trusted(self):
+        cache.set(f'exams:completed:{self.student.pk}', frozenset())
+        Result.objects.create(user=self.student, quiz=self.quizzes[0], score=100, passed=True)
+        with self.assertNumQueries(1):
+            quizzes = attach_attempts(self.student, self.quizzes)
+        self.assertIsNotNone(quizzes[0].user_results)
+
+
+class PaperCacheTests(ExamsTestCase):
+    """The question section of an ordinary quiz is rendered once per version."""
+
+    def test_cached_paper_matches_a_fresh_render(self):
+        quiz = make_quiz(self.faculty, [(1, 1), (2, 1)])
+        first = get_paper(quiz, self.student)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_paper(quiz, self.student), first)
+        self.assertEqual(first, render_paper(quiz))
+        self.assertIn('Question 1', first)
+
+    def test_version_bump_retires_the_paper(self):
+        quiz = make_quiz(self.faculty, [(1, 1)])
+        get_paper(quiz, self.student)
+        Question.objects.filter(quiz=quiz).update(text='Reworded')
+        self.assertNotIn('Reworded', get_paper(quiz, self.student))
+        quiz.bump_version()
+        self.assertIn('Reworded', get_paper(quiz, self.student))
+
+    def test_attempt_page_serves_the_paper(self):
+        quiz = make_quiz(self.faculty, [(1, 1)])
+        self.client.force_login(self.student)
+        self.client.get(reverse('exams:quiz_attempt', args=[quiz.pk]))
+        with mock.patch('exams.papers.render_paper') as render:
+            response = self.client.get(reverse('exams:quiz_attempt', args=[quiz.pk]))
+        render.assert_not_called()
+        self.assertContains(response, 'Question 0')
+
+
+class SubmissionQueueTests(ExamsTestCase):
+    """Queued submissions are graded exactly once, and one bad submission cannot block the rest."""
+
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(self.faculty, [(1, 1), (2, 1)])
+        self.first, self.second = get_answer_key(self.quiz).question_ids.tolist()
+
+    def test_batch_graded_twice_is_counted_once(self):
+        enqueue_submission(self.student, self.quiz, {f'q{self.first}': '1', f'q{self.second}': '3'})
+        get_distribution(self.quiz.pk)
+        batch = claim_batch(10)
+        # The lease ran out and a second worker got the same batch
+        self.assertEqual(grade_batch(batch), 1)
+        self.assertEqual(grade_batch(batch), 0)
+        result = Result.objects.get(user=self.student, quiz=self.quiz)
+        self.assertEqual(result.score, 50)
+        self.assertEqual(get_distribution(self.quiz.pk).total, 1)
+        self.assertFalse(PendingSubmission.objects.exists())
+
+    def test_bad_submission_does_not_block_the_batch(self):
+        other = CustomUser.objects.create(username='ravi', email='ravi@example.com', is_email_verified=True)
+        enqueue_submission(self.student, self.quiz, {f'q{self.first}': '1'})
+        enqueue_submission(other, self.quiz, {f'q{self.first}': '1'})
+        PendingSubmission.objects.filter(user=other).update(answers='not json')
+        with self.assertLogs('exams.submissions', 'ERROR'):
+            self.assertEqual(process_pending(), 1)
+        self.assertTrue(Result.objects.filter(user=self.student).exists())
+        # The bad one keeps its lease and is retried once it expires
+        self.assertIsNotNone(PendingSubmission.objects.get(user=other).claimed_at)
+        self.assertEqual(process_pending(), 0)
+
+
+def submit(user, quiz, *options):
+    """Queue and grade `user`'s attempt, picking options[i] for the i-th answer-key column (0 = blank)."""
+    question_ids = get_answer_key(quiz).question_ids.tolist()
+    enqueue_submission(user, quiz, {f'q{question_id}': str(option) for question_id, option in zip(question_ids, options)})
+    process_pending()
+    return Result.objects.get(user=user, quiz=quiz)
+
+
+def make_students(count):
+    return CustomUser.objects.bulk_create([
+        CustomUser(username=f'student{n}', email=f'student{n}@example.com', is_email_verified=True)
+        for n in range(count)
+    ])
+
+
+class AnswerSheetTests(ExamsTestCase):
+    """Graded attempts keep their answers, loadable as one matrix."""
+
+    def test_sheet_is_stored_and_loaded_in_one_query(self):
+        quiz = make_quiz(self.faculty, [(1, 1), (2, 1), (3, 1)])
+        result = submit(self.student, quiz, 1, 0, 4)
+        self.assertEqual((bytes(result.answers), result.quiz_version), (bytes([1, 0, 4]), 0))
+        with self.assertNumQueries(1):
+            responses = load_response_matrix(quiz)
+        self.assertEqual(responses.matrix.tolist(), [[1, 0, 4]])
+        self.assertEqual(responses.result_ids.tolist(), [result.pk])
+
+    def test_older_sheets_are_remapped_to_the_current_key(self):
+        quiz = make_quiz(self.faculty, [(1, 1), (2, 1)])
+        submit(self.student, quiz, 1, 2)
+        first, second = Question.objects.filter(quiz=quiz).order_by('id')
+        second.delete()
+        Question.objects.create(quiz=quiz, text='New', option_1='a', option_2='b', option_3='c', option_4='d',
+                                correct_answer=3)
+        invalidate_answer_key(quiz)
+        responses = load_response_matrix(quiz)
+        self.assertEqual(responses.key.question_ids.tolist()[0], first.pk)
+        self.assertEqual(responses.matrix.tolist(), [[1, 0]])
+        # The new question was not on the old paper and does not count against it
+        self.assertEqual(responses.present().tolist(), [[True, False]])
+        self.assertEqual(responses.available_marks().tolist(), [1])
+
+
+class RegradeTests(ExamsTestCase):
+    """Fixing the answer key rescores stored sheets and writes only what changed."""
+
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(self.faculty, [(1, 1), (2, 1)])
+        self.students = make_students(3)
+        for student, options in zip(self.students, [(1, 2), (1, 3), (4, 3)]):
+            submit(student, self.quiz, *options)
+
+    def test_regrade_after_fixing_the_key(self):
+        Question.objects.filter(quiz=self.quiz, correct_answer=2).update(correct_answer=3)
+        invalidate_answer_key(self.quiz)
+        report = regrade_quiz(self.quiz)
+        self.assertEqual((report.graded, report.changed, report.outcome_changed, report.skipped), (3, 3, 1, 0))
+        scores = dict(Result.objects.filter(quiz=self.quiz).values_list('user__username', 'score'))
+        self.assertEqual(scores, {'student0': 50, 'student1': 100, 'student2': 50})
+
+    def test_dry_run_and_unchanged_key_write_nothing(self):
+        self.assertEqual(regrade_quiz(self.quiz).changed, 0)
+        Quiz.objects.filter(pk=self.quiz.pk).update(passing_score=100)
+        self.quiz.refresh_from_db()
+        self.assertEqual(regrade_quiz(self.quiz, dry_run=True).outcome_changed, 1)
+        self.assertEqual(Result.objects.filter(quiz=self.quiz, passed=True).count(), 2)
+
+    def test_regrade_action_is_limited_to_the_creator_and_hod(self):
+        Question.objects.filter(quiz=self.quiz, correct_answer=2).update(correct_answer=3)
+        invalidate_answer_key(self.quiz)
+        url = reverse('exams:quiz_regrade', args=[self.quiz.pk])
+        self.client.force_login(self.students[0])
+        self.client.post(url)
+        self.assertEqual(Result.objects.get(user=self.students[1]).score, 50)
+        self.client.force_login(self.faculty)
+        response = self.client.post(url, follow=True)
+        self.assertContains(response, '3 changed')
+        self.assertEqual(Result.objects.get(user=self.students[1]).score, 100)
+
+
+class ItemAnalysisTests(ExamsTestCase):
+    """Question statistics are computed from the response matrix and kept up to date incrementally."""
+
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(self.faculty, [(1, 1), (2, 1), (3, 1)])
+        self.students = make_students(4)
+        self.sheets = [(1, 2, 3), (1, 2, 4), (1, 1, 4), (2, 1, 4)]
+
+    def test_statistics(self):
+        for student, sheet in zip(self.students, self.sheets):
+            submit(student, self.quiz, *sheet)
+        stats = compute_item_stats(self.quiz)
+        rows = [stats.questions()[question_id] for question_id in stats.question_ids]
+        self.assertEqual([row['difficulty'] for row in rows], [0.75, 0.5, 0.25])
+        self.assertEqual([count for _, count, _ in rows[0]['options']], [0, 3, 1, 0, 0])
+        self.assertAlmostEqual(stats.reliability(), 0.75)
+        self.assertGreater(rows[0]['discrimination'], 0)
+
+    def test_new_attempts_extend_the_cached_statistics(self):
+        for student, sheet in zip(self.students[:2], self.sheets[:2]):
+            submit(student, self.quiz, *sheet)
+        get_item_stats(self.quiz)
+        for student, sheet in zip(self.students[2:], self.sheets[2:]):
+            submit(student, self.quiz, *sheet)
+        with mock.patch('exams.item_analysis.compute_item_stats') as compute:
+            stats = get_item_stats(self.quiz)
+        compute.assert_not_called()
+        full = compute_item_stats(self.quiz)
+        self.assertEqual((stats.n, stats.sum_x, stats.sum_x2), (full.n, full.sum_x, full.sum_x2))
+        self.assertEqual(stats.option_counts.tolist(), full.option_counts.tolist())
+
+    def test_shown_to_the_creator_only(self):
+        submit(self.students[0], self.quiz, *self.sheets[0])
+        url = reverse('exams:quiz_detail', args=[self.quiz.pk])
+        self.client.force_login(self.faculty)
+        self.assertContains(self.client.get(url), 'KR-20 reliability')
+        self.client.force_login(self.students[0])
+        self.assertNotContains(self.client.get(url), 'KR-20 reliability')
+
+
+class ResultsReportTests(ExamsTestCase):
+    """The results report and export apply the filter, and an invalid filter matches nothing."""
+
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(self.faculty, [(1, 1), (2, 1)])
+        self.passed, self.failed = make_students(2)
+        submit(self.passed, self.quiz, 1, 2)
+        submit(self.failed, self.quiz, 0, 0)
+        self.client.force_login(self.faculty)
+
+    def test_export_streams_the_filtered_results(self):
+        response = self.client.get(reverse('exams:results_export', args=['csv']), {'status': 'passed'})
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertIn('student0', rows[1])
+
+    def test_invalid_filter_shows_errors_instead_of_everything(self):
+        response = self.client.get(reverse('exams:results'), {'date_from': 'yesterday'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors)
+        self.assertEqual(list(response.context['results']), [])
+        self.assertEqual(response.context['summary']['total'], 0)
+
+    def test_invalid_filter_is_not_exported(self):
+        response = self.client.get(reverse('exams:results_export', args=['csv']), {'date_from': 'yesterday'})
+        self.assertRedirects(response, reverse('exams:results') + '?date_from=yesterday')
+
+
+class LeaderboardTests(ExamsTestCase):
+    """Ranks and leaderboard pages come from the cached score distribution."""
+
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(self.faculty, [(1, 1), (2, 1)])
+        self.students = make_students(5)
+        self.results = Result.objects.bulk_create([
+            Result(user=student, quiz=self.quiz, score=score, passed=score >= 50)
+            for student, score in zip(self.students, [100, 80, 80, 50, 0])
+        ])
+
+    def test_standing(self):
+        get_distribution(self.quiz.pk)
+        with self.assertNumQueries(0):
+            standing = get_standing(self.results[1])
+        self.assertEqual(standing, {'rank': 2, 'attempts': 5, 'percentile': 60.0, 'mean': 62.0, 'median': 80.0})
+
+    def test_pages_follow_score_order(self):
+        pages = [leaderboard_page(self.quiz, page, size=2)[1] for page in (1, 2, 3, 4)]
+        self.assertEqual([[(result.score, result.rank) for result in page] for page in pages],
+                         [[(100, 1), (80, 2)], [(80, 2), (50, 4)], [(0, 5)], []])
+        self.assertEqual(len({result.pk for page in pages for result in page}), 5)
+
+    def test_grading_keeps_the_cached_distribution_current(self):
+        get_distribution(self.quiz.pk)
+        submit(self.student, self.quiz, 1, 1)
+        self.assertEqual(get_distribution(self.quiz.pk).counts.tolist(),
+                         build_distribution(self.quiz.pk).counts.tolist())
+        self.assertEqual(get_distribution(self.quiz.pk).total, 6)
+
+
+RECEIVED_AT = datetime(2026, 3, 2, 10, 30, tzinfo=dt_timezone.utc)
+
+
+def security_data(*events):
+    return json.dumps({'events': list(events)})
+
+
+class SecurityDataTests(ExamsTestCase):
+    """Whatever the attempt page posts is parsed into events, never into an error."""
+
+    def test_counts_and_first_occurrence(self):
+        parsed = parse_security_data(security_data(
+            {'type': 'tab_switch', 'at': '2026-03-02T10:05:00Z', 'count': 2},
+            {'type': 'TAB_SWITCH', 'at': '2026-03-02T10:01:00Z'},
+            'devtools_shortcut', {'type': 'mystery'},
+        ), received_at=RECEIVED_AT)
+        self.assertEqual(parsed, {
+            'tab_switch': (datetime(2026, 3, 2, 10, 1, tzinfo=dt_timezone.utc), 3),
+            'devtools_shortcut': (RECEIVED_AT, 1),
+            'other': (RECEIVED_AT, 1),
+        })
+
+    def test_naive_timestamps_are_made_aware(self):
+        parsed = parse_security_data(security_data({'type': 'tab_switch', 'at': '2026-03-02T10:05:00'}),
+                                     received_at=RECEIVED_AT)
+        self.assertEqual(parsed['tab_switch'][0], datetime(2026, 3, 2, 10, 5, tzinfo=dt_timezone.utc))
+
+    def test_invalid_and_future_timestamps_fall_back_to_the_submission_time(self):
+        parsed = parse_security_data(security_data(
+            {'type': 'tab_switch', 'at': '2026-02-30T10:05:00Z'},
+            {'type': 'screenshot_attempt', 'at': '2027-01-01T00:00:00'},
+            {'type': 'devtools_shortcut', 'at': 'soon'},
+        ), received_at=RECEIVED_AT)
+        self.assertEqual({occurred_at for occurred_at, _ in parsed.values()}, {RECEIVED_AT})
+
+    def test_malformed_blobs_and_the_submission_reason(self):
+        self.assertEqual(parse_security_data('{not json', received_at=RECEIVED_AT), {})
+        self.assertEqual(parse_security_data('[1, null, {"count": -4}]', received_at=RECEIVED_AT), {})
+        self.assertEqual(parse_security_data('{"tab_switch": 2, "other": true}', 'screenshot_attempt', RECEIVED_AT),
+                         {'tab_switch': (RECEIVED_AT, 2), 'screenshot_attempt': (RECEIVED_AT, 1)})
+
+    def test_violation_report_groups_and_filters(self):
+        quiz = make_quiz(self.faculty, [(1, 1)])
+        save_violation_events(build_violation_events(self.student.pk, quiz.pk, None, security_data(
+            {'type': 'tab_switch', 'count': 4}, 'screenshot_attempt'), received_at=RECEIVED_AT))
+        self.client.force_login(self.faculty)
+        response = self.client.get(reverse('exams:violations'), {'group': 'student', 'min_total': '3'})
+        self.assertEqual([(row['user__username'], row['total'], row['tab_switches']) for row in response.context['rows']],
+                         [('asha', 5, 4)])
+        response = self.client.get(reverse('exams:violations'), {'min_total': '-1'})
+        self.assertTrue(response.context['form'].errors)
+        self.assertEqual(list(response.context['rows']), [])
+
+
+class ViolationStoreTests(ExamsTestCase):
+    """Live beacons and graded submissions merge into one row per event type and never lose data."""
+
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(self.faculty, [(1, 1)])
+
+    def events(self, count, result_id=None):
+        return build_violation_events(self.student.pk, self.quiz.pk, result_id,
+                                      json.dumps({'tab_switch': count}), received_at=RECEIVED_AT)
+
+    def test_grading_links_live_events_to_the_result(self):
+        save_violation_events(self.events(3))
+        enqueue_submission(self.student, self.quiz, {'security_data': json.dumps({'tab_switch': 5})})
+        process_pending()
+        event = ViolationEvent.objects.get()
+        self.assertEqual((event.count, event.result), (5, Result.objects.get()))
+
+    def test_stale_beacon_does_not_undo_a_concurrent_grading(self):
+        save_violation_events(self.events(3))
+        result = Result.objects.create(user=self.student, quiz=self.quiz, score=0, passed=False)
+        bulk_create = ViolationEvent.objects.bulk_create
+
+        def graded_meanwhile(*args, **kwargs):
+            # Grading writes between the beacon flush starting and it touching the rows
+            ViolationEvent.objects.update(count=5, result=result)
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(ViolationEvent.objects, 'bulk_create', side_effect=graded_meanwhile):
+            save_violation_events(self.events(2))
+        event = ViolationEvent.objects.get()
+        self.assertEqual((event.count, event.result_id), (5, result.pk))
+
+    def test_beacons_are_coalesced_into_one_write(self):
+        buffer = beacons.BeaconBuffer(flush_interval=60, autostart=False)
+        for count in (1, 4, 2):
+            buffer.add(self.student.pk, self.quiz.pk, json.dumps({'tab_switch': count, 'other': 1}))
+        buffer.add(self.student.pk, self.quiz.pk + 1000, json.dumps({'tab_switch': 1}))
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.flush(), 2)  # the beacon for a missing quiz is dropped
+        self.assertEqual(dict(ViolationEvent.objects.values_list('event_type', 'count')), {'tab_switch': 4, 'other': 1})
+        self.assertEqual(len(buffer), 0)
+
+
+class RandomizedPaperTests(ExamsTestCase):
+    """Drawn and shuffled papers are rebuilt from a per-student seed, for rendering and for grading."""
+
+    def test_tag_filter_alone_gives_students_only_the_tagged_questions(self):
+        quiz = make_quiz(self.faculty, [(1, 1, 'algebra'), (1, 1, 'geometry'), (1, 1, 'algebra')], draw_tags='algebra')
+        self.assertTrue(quiz.is_randomized)
+        paper = get_paper(quiz, self.student)
+        self.assertIn('Question 0', paper)
+        self.assertNotIn('Question 1', paper)
+        self.client.force_login(self.student)
+        response = self.client.get(reverse('exams:quiz_attempt', args=[quiz.pk]))
+        self.assertContains(response, '<strong>Total Questions:</strong> 2<br>', html=False)
+
+    def test_drawn_paper_is_stable_and_counted(self):
+        quiz = make_quiz(self.faculty, [(1, 1)] * 6, draw_count=3)
+        key = get_answer_key(quiz)
+        columns = draw_paper(quiz, key, self.student.pk).columns.tolist()
+        self.assertEqual(len(set(columns)), 3)
+        self.assertEqual(draw_paper(quiz, key, self.student.pk).columns.tolist(), columns)
+        self.client.force_login(self.student)
+        response = self.client.get(reverse('exams:quiz_attempt', args=[quiz.pk]))
+        self.assertContains(response, '<strong>Total Questions:</strong> 3<br>', html=False)
+
+    def test_grading_maps_shuffled_positions_back(self):
+        quiz = make_quiz(self.faculty, [(1, 1), (2, 1), (3, 1), (4, 1)], draw_count=2, shuffle_options=True)
+        key = get_answer_key(quiz)
+        draw = draw_paper(quiz, key, self.student.pk)
+        # Pick the position showing the correct option on each drawn question
+        picks = {
+            column: draw.option_orders[row].tolist().index(int(key.correct[column])) + 1
+            for row, column in enumerate(draw.columns.tolist())
+        }
+        options = [picks.get(column, 0) for column in range(len(key))]
+        result = submit(self.student, quiz, *options)
+        self.assertEqual((result.score, result.passed), (100, True))
+
+
+def json_question(**fields):
+    return {'text': 'Sum?', 'option_1': '1', 'option_2': '2', 'option_3': '3', 'option_4': '4',
+            'correct_answer': 'B', **fields}
+
+
+class QuestionImportTests(ExamsTestCase):
+    """Imports validate every record, report errors by line and save all or nothing."""
+
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(self.faculty, [])
+
+    def import_json(self, *records):
+        return import_questions(self.quiz, io.StringIO('\n'.join(json.dumps(record) for record in records)), 'json')
+
+    def test_json_tags_may_be_a_list(self):
+        report = self.import_json(json_question(tags=['Algebra', 'sums']), json_question(tags='Geometry'))
+        self.assertEqual((report.created, report.errors), (2, []))
+        self.assertEqual(sorted(Question.objects.values_list('tags', flat=True)), ['algebra,sums', 'geometry'])
+        self.quiz.refresh_from_db()
+        self.assertEqual((self.quiz.question_count, self.quiz.total_marks), (2, 2))
+
+    def test_bad_tags_and_negative_marks_are_reported_not_raised(self):
+        report = self.import_json(json_question(), json_question(tags=7), json_question(tags=[1, 2]),
+                                  json_question(marks=-2), json_question(marks=[3]))
+        self.assertEqual([line for line, _ in report.errors], [2, 3, 4, 5])
+        self.assertIn('tags', report.errors[0][1])
+        self.assertIn('marks', report.errors[2][1])
+        self.assertEqual(report.created, 0)
+        self.assertFalse(Question.objects.exists())
+
+    def test_export_imports_unchanged(self):
+        source = make_quiz(self.faculty, [(2, 3, 'algebra'), (4, 1, '')])
+        for file_format in ('csv', 'json', 'aiken', 'gift'):
+            Question.objects.filter(quiz=self.quiz).delete()
+            exported = ''.join(export_questions(source, file_format))
+            report = import_questions(self.quiz, io.StringIO(exported), file_format)
+            self.assertEqual(report.errors, [], file_format)
+            fields = ('text', 'correct_answer') if file_format == 'aiken' else ('text', 'correct_answer', 'marks', 'tags')
+            self.assertEqual(list(self.quiz.question_set.order_by('id').values_list(*fields)),
+                             list(source.question_set.order_by('id').values_list(*fields)), file_format)
+
+
+class AttemptTokenTests(ExamsTestCase):
+    """The deadline is pinned when the attempt starts and checked from the signed token."""
+
+    def setUp(self):
+        super().setUp()
+        self.quiz = make_quiz(self.faculty, [(1, 1)])
+        self.question_id = get_answer_key(self.quiz).question_ids[0]
+        self.client.force_login(self.student)
+
+    def post(self, token, **data):
+        return self.client.post(reverse('exams:quiz_attempt', args=[self.quiz.pk]),
+                                {'attempt_token': token, f'q{self.question_id}': '1', **data})
+
+    def test_reopening_keeps_the_deadline(self):
+        _, first = issue_attempt_token(self.student, self.quiz, now=1_000_000)
+        cache.clear()  # the start lives in the database, not in one worker's cache
+        token, again = issue_attempt_token(self.student, self.quiz, now=1_000_500)
+        self.assertEqual((again.started_at, again.deadline, again.nonce), (1_000_000, 1_000_000 + 30 * 60, first.nonce))
+        self.assertEqual(read_attempt_token(token, self.student, self.quiz), again)
+        self.assertIsNone(read_attempt_token(token, self.faculty, self.quiz))
+        self.assertIsNone(read_attempt_token(token + 'x', self.student, self.quiz))
+
+    def test_submission_in_time_is_queued(self):
+        token, _ = issue_attempt_token(self.student, self.quiz)
+        self.assertRedirects(self.post(token), reverse('exams:submission_status', args=[self.quiz.pk]),
+                             fetch_redirect_response=False)
+        submission = PendingSubmission.objects.get()
+        self.assertEqual((submission.submission_reason, json.loads(submission.answers)),
+                         ('manual', {f'q{self.question_id}': '1'}))
+        self.assertFalse(AttemptStart.objects.exists())
+
+    def test_late_submission_follows_the_policy(self):
+        token, _ = issue_attempt_token(self.student, self.quiz, now=time.time() - 30 * 60 - 60)
+        self.post(token)
+        submission = PendingSubmission.objects.get()
+        self.assertEqual((submission.submission_reason, json.loads(submission.answers)), ('late', {}))
+
+    def test_missing_or_foreign_token_is_rejected(self):
+        other, _ = issue_attempt_token(self.faculty, self.quiz)
+        for token in ('', 'forged', other):
+            response = self.post(token)
+            self.assertRedirects(response, reverse('exams:quiz_attempt', args=[self.quiz.pk]),
+                                 fetch_redirect_response=False)
+        self.assertFalse(PendingSubmission.objects.exists())
+
+
+class ClientStudent:
+    """Stands in for load_exam_day's HTTP student, sending its requests through the test client."""
+
+    retry_after = 0.0
+
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, path, data=None):
+        response = self.client.get(path) if data is None else self.client.post(path, data)
+        return response.status_code, response.content.decode(), 0.01
+
+
+class LoadExamDayTests(ExamsTestCase):
+    """The load harness scripts the real student flow and judges runs against a baseline."""
+
+    def setUp(self):
+        super().setUp()
+        self.command = load_exam_day.Command()
+
+    def test_student_flow_submits_an_attempt(self):
+        username, = self.command._students(1)
+        quiz = self.command._quiz(3)
+        samples = []
+        self.command._exam_day(ClientStudent(self.client), username, quiz, {'tab_switch_violation': 1},
+                               random.Random(0), lambda *sample: samples.append(sample))
+        self.assertEqual([(endpoint, ok) for endpoint, _, ok in samples],
+                         [('login_form', True), ('login', True), ('dashboard', True), ('attempt', True), ('submit', True)])
+        submission = PendingSubmission.objects.get(quiz=quiz)
+        self.assertEqual((submission.user.username, submission.submission_reason), (username, 'tab_switch_violation'))
+
+    def test_mix_must_have_positive_weights(self):
+        self.assertEqual(self.command._parse_mix('manual=3,time_up=1'), {'manual': 3.0, 'time_up': 1.0})
+        for mix in ('manual=many', 'manual=0', 'manual=-1,time_up=2'):
+            with self.assertRaises(CommandError):
+                self.command._parse_mix(mix)
+
+    def test_regressions_against_the_baseline(self):
+        report = self.command._report(defaultdict(list, submit=[(0.1, True)] * 19 + [(0.5, False)]), wall=2.0)
+        self.assertEqual((report['submit']['requests'], report['submit']['error_rate']), (20, 0.05))
+        self.assertEqual(self.command._regressions(report, report, 0.25), [])
+        faster = {'submit': dict(report['submit'], p95_ms=report['submit']['p95_ms'] / 2, error_rate=0.0, per_second=20)}
+        regressions = self.command._regressions(report, {**faster, 'attempt': report['submit']}, 0.25)
+        self.assertEqual([regression.split(':')[0] for regression in regressions], ['submit'] * 3 + ['attempt'])
@@ -9,7 +9,15 @@ urlpatterns = [
     path('<int:quiz_id>/', views.quiz_detail, name='quiz_detail'),
     path('<int:quiz_id>/edit/', views.quiz_edit, name='quiz_edit'),
     path('<int:quiz_id>/delete/', views.quiz_delete, name='quiz_delete'),
+    path('<int:quiz_id>/regrade/', views.quiz_regrade, name='quiz_regrade'),
+    path('<int:quiz_id>/questions/import/', views.question_import, name='question_import'),
+    path('<int:quiz_id>/questions/export.<str:file_format>', views.question_export, name='question_export'),
+    path('<int:quiz_id>/leaderboard/', views.quiz_leaderboard, name='quiz_leaderboard'),
     path('<int:quiz_id>/attempt/', views.quiz_attempt, name='quiz_attempt'),
+    path('<int:quiz_id>/beacon/', views.quiz_beacon, name='quiz_beacon'),
+    path('<int:quiz_id>/submission/', views.submission_status, name='submission_status'),
     path('result/<int:result_id>/', views.quiz_result, name='quiz_result'),
-    path('results/', views.Result, name='results'),
+    path('results/', views.results_report, name='results'),
+    path('results/export.<str:file_format>', views.results_export, name='results_export'),
+    path('violations/', views.violations_report, name='violations'),
 ]
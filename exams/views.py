@@ -1,22 +1,70 @@
+import io
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from .models import Quiz, Question, Result
-from .forms import QuizForm, QuestionFormSet
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from django.utils import timezone
+from .models import Quiz, Question, Result, PendingSubmission, ViolationEvent
+from .forms import QuizForm, QuestionFormSet, QuestionImportForm, ResultFilterForm, ViolationFilterForm
+from .attempts import attach_attempts
+from .attempt_tokens import forget_attempt, issue_attempt_token, late_submission, read_attempt_token
+from . import beacons
+from .exports import export_rows, stream_csv, stream_xlsx
+from .grading import invalidate_answer_key, discard_answer_key
+from .item_analysis import get_item_stats
+from .leaderboard import LEADERBOARD_PAGE_SIZE, forget_distribution, get_standing, leaderboard_page
+from .papers import cache_paper, get_paper, paper_length
+from .question_io import CONTENT_TYPES, EXPORTERS, FILE_EXTENSIONS, export_questions, import_questions
+from .question_sync import parse_questions, sync_questions
+from .regrade import regrade_quiz
+from .submissions import enqueue_submission, grade_overdue
+from .violations import violation_report
 from django.contrib import messages
+from django.db import transaction
+from django.db.models import Avg, Count, Q
+from django.utils.text import slugify
+from django.urls import reverse
+
+QUIZ_PAGE_SIZE = 30
+RESULTS_PREVIEW_SIZE = 50
+VIOLATION_REPORT_ROWS = 200
+
+
+def _keyset_page(queryset, before, size=QUIZ_PAGE_SIZE):
+    """
+    Return one page of `queryset` ordered newest first, starting below the
+    id `before`, plus the id to continue from (None on the last page).
+    """
+    queryset = queryset.order_by('-id')
+    if before:
+        queryset = queryset.filter(id__lt=before)
+    page = list(queryset[:size + 1])
+    if len(page) > size:
+        page = page[:size]
+        return page, page[-1].id
+    return page, None
 
 @login_required
 def quiz_list(request):
+    try:
+        before = int(request.GET.get('before', 0))
+    except ValueError:
+        before = 0
+
     if request.user.role == 'STUDENT':
-        quizzes = Quiz.objects.filter(assigned_faculty__isnull=False)
+        quizzes = Quiz.objects.filter(assigned_faculty__isnull=False).distinct().select_related('creator')
+        quizzes, next_before = _keyset_page(quizzes, before)
         # Add user results to each quiz for students
-        for quiz in quizzes:
-            try:
-                quiz.user_results = Result.objects.get(user=request.user, quiz=quiz)
-            except Result.DoesNotExist:
-                quiz.user_results = None
+        attach_attempts(request.user, quizzes)
     else:
-        quizzes = Quiz.objects.all()
-    return render(request, 'exams/quiz_list.html', {'quizzes': quizzes})
+        quizzes, next_before = _keyset_page(Quiz.objects.select_related('creator'), before)
+    return render(request, 'exams/quiz_list.html', {
+        'quizzes': quizzes,
+        'next_before': next_before,
+        'is_first_page': not before,
+    })
 
 @login_required
 def quiz_create(request):
@@ -27,41 +75,17 @@ def quiz_create(request):
     if request.method == 'POST':
         form = QuizForm(request.POST)
         if form.is_valid():
-            quiz = form.save(commit=False)
-            quiz.creator = request.user
-            quiz.save()
-            
-            # Process questions
-            question_count = 0
-            for key in request.POST.keys():
-                if key.startswith('questions-') and key.endswith('-text'):
-                    index = key.split('-')[1]
-                    text = request.POST.get(f'questions-{index}-text')
-                    option_1 = request.POST.get(f'questions-{index}-option_1')
-                    option_2 = request.POST.get(f'questions-{index}-option_2')
-                    option_3 = request.POST.get(f'questions-{index}-option_3')
-                    option_4 = request.POST.get(f'questions-{index}-option_4')
-                    correct_answer = request.POST.get(f'questions-{index}-correct_answer')
-                    marks = request.POST.get(f'questions-{index}-marks', 1)
-                    
-                    if all([text, option_1, option_2, option_3, option_4, correct_answer]):
-                        Question.objects.create(
-                            quiz=quiz,
-                            text=text,
-                            option_1=option_1,
-                            option_2=option_2,
-                            option_3=option_3,
-                            option_4=option_4,
-                            correct_answer=int(correct_answer),
-                            marks=int(marks)
-                        )
-                        question_count += 1
-            
-            if question_count > 0:
-                messages.success(request, f'Quiz created successfully with {question_count} questions!')
+            questions = parse_questions(request.POST)
+            if questions:
+                with transaction.atomic():
+                    quiz = form.save(commit=False)
+                    quiz.creator = request.user
+                    quiz.save()
+                    sync_questions(quiz, questions)
+                cache_paper(quiz)
+                messages.success(request, f'Quiz created successfully with {len(questions)} questions!')
                 return redirect('exams:quiz_list')
             else:
-                quiz.delete()
                 messages.error(request, 'Please add at least one question to the quiz.')
         else:
             messages.error(request, 'Please correct the errors below.')
@@ -73,13 +97,20 @@ def quiz_create(request):
 @login_required
 def quiz_detail(request, quiz_id):
     quiz = get_object_or_404(Quiz, pk=quiz_id)
+    questions = list(quiz.question_set.order_by('id'))
+    context = {'quiz': quiz, 'questions': questions}
     # Add user result for students
     if request.user.role == 'STUDENT':
-        try:
-            quiz.user_results = Result.objects.get(user=request.user, quiz=quiz)
-        except Result.DoesNotExist:
-            quiz.user_results = None
-    return render(request, 'exams/quiz_detail.html', {'quiz': quiz})
+        attach_attempts(request.user, [quiz])
+    elif request.user == quiz.creator or request.user.role == 'HOD':
+        # Item analysis for the people who maintain the quiz
+        stats = get_item_stats(quiz)
+        if stats.n:
+            rows = stats.questions()
+            for question in questions:
+                question.stats = rows.get(question.id)
+            context.update({'item_stats': stats, 'reliability': stats.reliability()})
+    return render(request, 'exams/quiz_detail.html', context)
 
 @login_required
 
@@ -92,63 +123,106 @@ def quiz_attempt(request, quiz_id):
         if existing_result:
             messages.warning(request, 'You have already taken this quiz and cannot retake it.')
             return redirect('exams:quiz_result', result_id=existing_result.id)
+        if PendingSubmission.objects.filter(user=request.user, quiz=quiz).exists():
+            return redirect('exams:submission_status', quiz_id=quiz.id)
     
     if request.method == 'POST':
-        # Double-check before processing submission
-        if request.user.role == 'STUDENT':
-            existing_result = Result.objects.filter(user=request.user, quiz=quiz).first()
-            if existing_result:
-                messages.error(request, 'Quiz submission failed: You have already completed this quiz.')
-                return redirect('exams:quiz_result', result_id=existing_result.id)
+        # Students with a Result were redirected above, and the queue and
+        # Result constraints reject a second attempt racing this one
         
-        # Get submission reason
-        submission_reason = request.POST.get('submission_reason', 'manual')
-        security_data = request.POST.get('security_data', '{}')
+        # The deadline comes from the signed attempt token (see exams.attempt_tokens)
+        data = request.POST
+        attempt = read_attempt_token(data.get('attempt_token'), request.user, quiz)
+        if attempt is None:
+            messages.error(request, 'Your attempt could not be verified. Please submit again from this page.')
+            return redirect('exams:quiz_attempt', quiz_id=quiz.id)
+        if attempt.is_late():
+            data = late_submission(data)
+        submission_reason = data.get('submission_reason', 'manual')
         
-        # Process quiz submission
-        score = 0
-        total_marks = 0
-        correct_answers = 0
-        total_questions = quiz.question_set.count()
-        
-        for question in quiz.question_set.all():
-            total_marks += question.marks
-            selected_answer = request.POST.get(f'q{question.id}')
-            
-            if selected_answer and int(selected_answer) == question.correct_answer:
-                score += question.marks
-                correct_answers += 1
-        
-        # Calculate percentage
-        percentage = (score / total_marks * 100) if total_marks > 0 else 0
-        passed = percentage >= quiz.passing_score
-        
-        # Create result record
-        result = Result.objects.create(
-            user=request.user,
-            quiz=quiz,
-            score=percentage,
-            passed=passed,
-            submission_reason=submission_reason,
-            security_violations=security_data
-        )
+        # Queue the raw answers; grading happens in batches (see exams.submissions)
+        if not enqueue_submission(request.user, quiz, data):
+            messages.info(request, 'Your submission for this quiz has already been received.')
+            return redirect('exams:submission_status', quiz_id=quiz.id)
+        forget_attempt(request.user.pk, quiz.pk)
         
         # Add success message based on submission reason
-        if submission_reason == 'tab_switch_violation':
+        if submission_reason == 'late':
+            messages.warning(request, 'Your answers arrived after the time limit and were recorded as a late submission.')
+        elif submission_reason == 'tab_switch_violation':
             messages.warning(request, 'Quiz was auto-submitted due to tab switching violation.')
         elif submission_reason == 'time_up':
             messages.info(request, 'Quiz was auto-submitted as time expired.')
         else:
             messages.success(request, 'Quiz submitted successfully!')
         
+        return redirect('exams:submission_status', quiz_id=quiz.id)
+    
+    attempt_token, attempt = issue_attempt_token(request.user, quiz)
+    return render(request, 'exams/quiz_attempt.html', {
+        'quiz': quiz,
+        'paper_html': get_paper(quiz, request.user),
+        'question_count': paper_length(quiz),
+        'attempt_token': attempt_token,
+        'seconds_left': attempt.seconds_left(),
+    })
+
+@require_POST
+@login_required
+def quiz_beacon(request, quiz_id):
+    """Live violation counts from a running attempt; buffered, not written per request."""
+    if request.user.role != 'STUDENT':
+        return HttpResponse(status=403)
+    events = request.POST.get('events', '')
+    if len(events) > beacons.BEACON_MAX_BYTES:
+        return HttpResponse(status=413)
+    beacons.buffer.add(request.user.pk, quiz_id, events)
+    return HttpResponse(status=204)
+
+@login_required
+def submission_status(request, quiz_id):
+    quiz = get_object_or_404(Quiz, pk=quiz_id)
+    result = Result.objects.filter(user=request.user, quiz=quiz).first()
+    if result is None and grade_overdue(request.user, quiz):
+        result = Result.objects.filter(user=request.user, quiz=quiz).first()
+    if result:
         return redirect('exams:quiz_result', result_id=result.id)
     
-    return render(request, 'exams/quiz_attempt.html', {'quiz': quiz})
+    if not PendingSubmission.objects.filter(user=request.user, quiz=quiz).exists():
+        messages.error(request, 'No submission found for this quiz.')
+        return redirect('exams:quiz_detail', quiz_id=quiz.id)
+    
+    # Still waiting for the grading worker; the page refreshes itself
+    return render(request, 'exams/submission_status.html', {'quiz': quiz})
 
 @login_required
 def quiz_result(request, result_id):
-    result = get_object_or_404(Result, pk=result_id, user=request.user)
-    return render(request, 'exams/quiz_result.html', {'result': result})
+    result = get_object_or_404(Result.objects.select_related('quiz'), pk=result_id, user=request.user)
+    return render(request, 'exams/quiz_result.html', {'result': result, 'standing': get_standing(result)})
+
+@login_required
+def quiz_leaderboard(request, quiz_id):
+    quiz = get_object_or_404(Quiz, pk=quiz_id)
+    
+    if request.user.role == 'STUDENT':
+        messages.error(request, 'You do not have permission to view the leaderboard.')
+        return redirect('exams:quiz_list')
+    
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    distribution, results = leaderboard_page(quiz, page)
+    return render(request, 'exams/quiz_leaderboard.html', {
+        'quiz': quiz,
+        'results': results,
+        'page': page,
+        'attempts': distribution.total,
+        'mean': distribution.mean(),
+        'median': distribution.median(),
+        'has_previous': page > 1,
+        'has_next': page * LEADERBOARD_PAGE_SIZE < distribution.total,
+    })
 
 @login_required
 def quiz_edit(request, quiz_id):
@@ -162,39 +236,19 @@ def quiz_edit(request, quiz_id):
     if request.method == 'POST':
         form = QuizForm(request.POST, instance=quiz)
         if form.is_valid():
-            quiz = form.save()
-            
-            # Delete existing questions
-            quiz.question_set.all().delete()
-            
-            # Process new questions
-            question_count = 0
-            for key in request.POST.keys():
-                if key.startswith('questions-') and key.endswith('-text'):
-                    index = key.split('-')[1]
-                    text = request.POST.get(f'questions-{index}-text')
-                    option_1 = request.POST.get(f'questions-{index}-option_1')
-                    option_2 = request.POST.get(f'questions-{index}-option_2')
-                    option_3 = request.POST.get(f'questions-{index}-option_3')
-                    option_4 = request.POST.get(f'questions-{index}-option_4')
-                    correct_answer = request.POST.get(f'questions-{index}-correct_answer')
-                    marks = request.POST.get(f'questions-{index}-marks', 1)
-                    
-                    if all([text, option_1, option_2, option_3, option_4, correct_answer]):
-                        Question.objects.create(
-                            quiz=quiz,
-                            text=text,
-                            option_1=option_1,
-                            option_2=option_2,
-                            option_3=option_3,
-                            option_4=option_4,
-                            correct_answer=int(correct_answer),
-                            marks=int(marks)
-                        )
-                        question_count += 1
-            
-            if question_count > 0:
-                messages.success(request, f'Quiz updated successfully with {question_count} questions!')
+            questions = parse_questions(request.POST)
+            if questions:
+                with transaction.atomic():
+                    quiz = form.save(commit=False)
+                    # Edits of one quiz take turns, and only the form's fields are written:
+                    # version and the question stats belong to sync_questions and the answer key
+                    quiz.refresh_from_db(fields=['version'], from_queryset=Quiz.objects.select_for_update())
+                    quiz.save(update_fields=form._meta.fields)
+                    paper_changed = bool(set(form.changed_data) & set(Quiz.PAPER_FIELDS))
+                    if sync_questions(quiz, questions).changed or paper_changed:
+                        invalidate_answer_key(quiz)
+                cache_paper(quiz)
+                messages.success(request, f'Quiz updated successfully with {len(questions)} questions!')
                 return redirect('exams:quiz_detail', quiz_id=quiz.id)
             else:
                 messages.error(request, 'Please add at least one question to the quiz.')
@@ -205,6 +259,53 @@ def quiz_edit(request, quiz_id):
     
     return render(request, 'exams/quiz_edit.html', {'form': form, 'quiz': quiz})
 
+@login_required
+def question_import(request, quiz_id):
+    quiz = get_object_or_404(Quiz, pk=quiz_id)
+    
+    # Only creator or HOD can add questions
+    if request.user != quiz.creator and request.user.role != 'HOD':
+        messages.error(request, 'You do not have permission to edit this quiz.')
+        return redirect('exams:quiz_detail', quiz_id=quiz.id)
+    
+    report = None
+    if request.method == 'POST':
+        form = QuestionImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            # Read the upload as a stream of text; it may be on disk rather than in memory
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', errors='replace', newline='')
+            report = import_questions(quiz, stream, form.cleaned_data['file_format'])
+            if not report.error_count and report.created:
+                invalidate_answer_key(quiz)
+                cache_paper(quiz)
+                messages.success(request, f'Imported {report.created} questions.')
+                return redirect('exams:quiz_detail', quiz_id=quiz.id)
+            if not report.error_count:
+                messages.warning(request, 'The file did not contain any questions.')
+            else:
+                messages.error(request, f'Nothing was imported: {report.error_count} problem(s) found.')
+    else:
+        form = QuestionImportForm()
+    
+    return render(request, 'exams/question_import.html', {'form': form, 'quiz': quiz, 'report': report})
+
+@login_required
+def question_export(request, quiz_id, file_format):
+    quiz = get_object_or_404(Quiz, pk=quiz_id)
+    if file_format not in EXPORTERS:
+        raise Http404('Unknown export format')
+    if request.user != quiz.creator and request.user.role != 'HOD':
+        messages.error(request, 'You do not have permission to export this quiz.')
+        return redirect('exams:quiz_detail', quiz_id=quiz.id)
+    
+    response = StreamingHttpResponse(
+        export_questions(quiz, file_format), content_type=f'{CONTENT_TYPES[file_format]}; charset=utf-8',
+    )
+    filename = f"{slugify(quiz.title) or 'quiz'}-questions.{FILE_EXTENSIONS[file_format]}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @login_required
 def quiz_delete(request, quiz_id):
     quiz = get_object_or_404(Quiz, pk=quiz_id)
@@ -216,8 +317,113 @@ def quiz_delete(request, quiz_id):
     
     if request.method == 'POST':
         quiz_title = quiz.title
+        discard_answer_key(quiz)
+        forget_distribution(quiz.pk)
         quiz.delete()
         messages.success(request, f'Quiz "{quiz_title}" has been deleted successfully.')
         return redirect('exams:quiz_list')
     
     return render(request, 'exams/quiz_delete.html', {'quiz': quiz})
+
+@login_required
+def quiz_regrade(request, quiz_id):
+    quiz = get_object_or_404(Quiz, pk=quiz_id)
+    
+    # Only creator or HOD can regrade
+    if request.user != quiz.creator and request.user.role != 'HOD':
+        messages.error(request, 'You do not have permission to regrade this quiz.')
+        return redirect('exams:quiz_detail', quiz_id=quiz.id)
+    
+    if request.method == 'POST':
+        report = regrade_quiz(quiz)
+        messages.success(
+            request,
+            f'Regraded {report.graded} results: {report.changed} changed, '
+            f'{report.outcome_changed} changed pass/fail status.'
+        )
+    return redirect('exams:quiz_detail', quiz_id=quiz.id)
+
+def _results_filter(request):
+    """
+    Build the results filter form for a faculty member (their own quizzes)
+    or the HOD (everything). Returns (form, filtered results), or
+    (None, None) for students. An invalid filter matches nothing, so its
+    errors are shown instead of every result.
+    """
+    if request.user.role == 'HOD':
+        quizzes, results = Quiz.objects.all(), Result.objects.all()
+    elif request.user.role == 'FACULTY':
+        quizzes = Quiz.objects.filter(creator=request.user)
+        results = Result.objects.filter(quiz__creator=request.user)
+    else:
+        return None, None
+    departments = (
+        get_user_model().objects.filter(role='STUDENT').exclude(department__isnull=True).exclude(department='')
+        .order_by('department').values_list('department', flat=True).distinct()
+    )
+    form = ResultFilterForm(request.GET or None, quizzes=quizzes.order_by('title'), departments=departments)
+    if form.is_bound:
+        results = form.filter(results) if form.is_valid() else results.none()
+    return form, results
+
+@login_required
+def results_report(request):
+    form, results = _results_filter(request)
+    if form is None:
+        messages.error(request, 'You do not have permission to view results.')
+        return redirect('exams:quiz_list')
+    
+    summary = results.aggregate(total=Count('id'), passed=Count('id', filter=Q(passed=True)), average=Avg('score'))
+    preview = results.select_related('user', 'quiz').order_by('-id')[:RESULTS_PREVIEW_SIZE]
+    return render(request, 'exams/results_report.html', {
+        'form': form,
+        'summary': summary,
+        'results': preview,
+        'query': request.GET.urlencode(),
+    })
+
+@login_required
+def results_export(request, file_format):
+    if file_format not in ('csv', 'xlsx'):
+        raise Http404('Unknown export format')
+    form, results = _results_filter(request)
+    if form is None:
+        messages.error(request, 'You do not have permission to export results.')
+        return redirect('exams:quiz_list')
+    if form.errors:
+        messages.error(request, 'Please correct the filter before exporting.')
+        return redirect(f"{reverse('exams:results')}?{request.GET.urlencode()}")
+    
+    filename = f"results-{timezone.localdate():%Y-%m-%d}"
+    if file_format == 'xlsx':
+        response = StreamingHttpResponse(
+            stream_xlsx(export_rows(results)),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    else:
+        response = StreamingHttpResponse(stream_csv(export_rows(results)), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
+
+@login_required
+def violations_report(request):
+    if request.user.role == 'HOD':
+        quizzes, events = Quiz.objects.all(), ViolationEvent.objects.all()
+    elif request.user.role == 'FACULTY':
+        quizzes = Quiz.objects.filter(creator=request.user)
+        events = ViolationEvent.objects.filter(quiz__creator=request.user)
+    else:
+        messages.error(request, 'You do not have permission to view violation reports.')
+        return redirect('exams:quiz_list')
+    
+    form = ViolationFilterForm(request.GET or None, quizzes=quizzes.order_by('title'))
+    group, min_total = 'quiz', None
+    if form.is_bound and form.is_valid():
+        events = form.filter(events)
+        group = form.cleaned_data['group'] or 'quiz'
+        min_total = form.cleaned_data['min_total']
+    elif form.is_bound:
+        # Show the errors rather than an unfiltered report
+        events = events.none()
+    rows = violation_report(events, group, min_total)[:VIOLATION_REPORT_ROWS]
+    return render(request, 'exams/violations_report.html', {'form': form, 'group': group, 'rows': rows})
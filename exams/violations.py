@@ -0,0 +1,200 @@
+"""
+Proctoring violations.
+
+The attempt page reports what it observed twice: live, through the beacon
+endpoint (see exams.beacons), and as the `security_data` field posted with
+the answers. Both carry cumulative counts per event type, and both are
+parsed into ViolationEvent rows, one per (quiz, student, event type), with
+the first occurrence and a count; the raw JSON is discarded. Because counts
+are cumulative, saving keeps the larger count and the earlier occurrence,
+so late, repeated or out-of-order reports are harmless. Reports are plain
+SQL aggregates over the indexed table.
+"""
+import json
+
+from django.db import transaction
+from django.db.models import CharField, Count, Max, Q, Sum, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Result, ViolationEvent
+
+# Bound the work one submission can cause, whatever the client posts
+MAX_EVENTS = 1000
+
+# Submission reasons that are themselves evidence of a violation
+REASON_EVENTS = {
+    'tab_switch_violation': 'tab_switch',
+    'screenshot_attempt': 'screenshot_attempt',
+}
+
+EVENT_TYPES = {event_type for event_type, _ in ViolationEvent.EVENT_TYPES}
+
+
+def _event_type(value):
+    value = str(value or '').strip().lower()
+    return value if value in EVENT_TYPES else 'other'
+
+
+def _events(data):
+    """Yield (event_type, occurred_at or None, count) from a decoded blob."""
+    if isinstance(data, dict):
+        events = data.get('events')
+        if events is None:
+            # {"tab_switch": 2, ...} counters
+            for event_type, count in data.items():
+                if isinstance(count, int) and not isinstance(count, bool):
+                    yield _event_type(event_type), None, count
+            return
+        data = events
+    if not isinstance(data, list):
+        return
+    for event in data[:MAX_EVENTS]:
+        if isinstance(event, str):
+            yield _event_type(event), None, 1
+        elif isinstance(event, dict):
+            count = event.get('count', 1)
+            yield _event_type(event.get('type')), _timestamp(event.get('at')), count if isinstance(count, int) else 1
+
+
+def _timestamp(value):
+    """An aware datetime from an ISO 8601 string, or None if it is missing or not a real date."""
+    if not isinstance(value, str):
+        return None
+    try:
+        occurred_at = parse_datetime(value)
+    except ValueError:
+        # Well-formed but impossible, e.g. 2024-02-30
+        return None
+    if occurred_at is not None and timezone.is_naive(occurred_at):
+        occurred_at = timezone.make_aware(occurred_at)
+    return occurred_at
+
+
+def parse_security_data(raw, submission_reason='manual', received_at=None):
+    """
+    Turn a raw security_data blob into {event_type: (first occurrence, count)}.
+    Malformed input yields no events rather than an error.
+    """
+    received_at = received_at or timezone.now()
+    try:
+        data = json.loads(raw) if raw else {}
+    except (TypeError, ValueError):
+        data = {}
+
+    parsed = {}
+    for event_type, occurred_at, count in _events(data):
+        if count < 1:
+            continue
+        if occurred_at is None or occurred_at > received_at:
+            occurred_at = received_at
+        first, total = parsed.get(event_type, (occurred_at, 0))
+        parsed[event_type] = (min(first, occurred_at), min(total + count, 2 ** 31 - 1))
+
+    reason_event = REASON_EVENTS.get(submission_reason)
+    if reason_event and reason_event not in parsed:
+        parsed[reason_event] = (received_at, 1)
+    return parsed
+
+
+def build_violation_events(user_id, quiz_id, result_id, raw, submission_reason='manual', received_at=None):
+    """Unsaved ViolationEvent rows for one attempt."""
+    return [
+        ViolationEvent(
+            user_id=user_id, quiz_id=quiz_id, result_id=result_id,
+            event_type=event_type, occurred_at=occurred_at, count=count,
+        )
+        for event_type, (occurred_at, count) in parse_security_data(raw, submission_reason, received_at).items()
+    ]
+
+
+def save_violation_events(events, attempts=()):
+    """
+    Upsert unsaved ViolationEvent rows, merging them with what is stored.
+    Every stored row of `attempts` ((user id, quiz id) pairs that have just
+    been graded) is also pointed at its Result. Returns the rows written.
+
+    The stored rows are merged under a row lock, so a stale beacon flushed
+    concurrently with grading can neither lower a count nor unset a result.
+    """
+    attempts = set(attempts)
+    incoming = {}
+    for event in events:
+        _merge(incoming, event.quiz_id, event.user_id, event.event_type, event.occurred_at, event.count, event.result_id)
+    pairs = attempts | {(user_id, quiz_id) for quiz_id, user_id, _ in incoming}
+    if not pairs:
+        return 0
+    users, quizzes = {user_id for user_id, _ in pairs}, {quiz_id for _, quiz_id in pairs}
+
+    with transaction.atomic():
+        results = {}
+        if attempts:
+            rows = Result.objects.filter(user_id__in=users, quiz_id__in=quizzes).values_list('id', 'user_id', 'quiz_id')
+            results = {(user_id, quiz_id): result_id for result_id, user_id, quiz_id in rows}
+            for (quiz_id, user_id, _), event in incoming.items():
+                event.result_id = results.get((user_id, quiz_id), event.result_id)
+
+        # New rows go in as they are; rows that already exist are merged below
+        ViolationEvent.objects.bulk_create(list(incoming.values()), ignore_conflicts=True)
+        stored = ViolationEvent.objects.select_for_update().filter(user_id__in=users, quiz_id__in=quizzes).order_by('id')
+        changed = {}
+        for row in stored:
+            key, pair = (row.quiz_id, row.user_id, row.event_type), (row.user_id, row.quiz_id)
+            event = incoming.get(key)
+            if event is None and pair not in attempts:
+                continue
+            before = (row.occurred_at, row.count, row.result_id)
+            if event is not None:
+                row.occurred_at = min(row.occurred_at, event.occurred_at)
+                row.count = max(row.count, event.count)
+                row.result_id = row.result_id or event.result_id
+            if pair in attempts:
+                row.result_id = results.get(pair, row.result_id)
+            if (row.occurred_at, row.count, row.result_id) != before:
+                changed[key] = row
+        ViolationEvent.objects.bulk_update(list(changed.values()), ['occurred_at', 'count', 'result'])
+    return len(incoming.keys() | changed.keys())
+
+
+def _merge(merged, quiz_id, user_id, event_type, occurred_at, count, result_id):
+    key = (quiz_id, user_id, event_type)
+    event = merged.get(key)
+    if event is None:
+        merged[key] = ViolationEvent(
+            quiz_id=quiz_id, user_id=user_id, event_type=event_type,
+            occurred_at=occurred_at, count=count, result_id=result_id,
+        )
+        return
+    event.occurred_at = min(event.occurred_at, occurred_at)
+    event.count = max(event.count, count)
+    event.result_id = event.result_id or result_id
+
+
+REPORT_GROUPS = {
+    'quiz': ('quiz_id', 'quiz__title'),
+    'student': ('user_id', 'user__username', 'user__department'),
+    'department': ('user__department',),
+}
+
+
+def violation_report(events, group='quiz', min_total=None):
+    """
+    Aggregate `events` by quiz, student or department: total violations,
+    attempts involved, per-type totals and the latest occurrence.
+    """
+    rows = (
+        events.order_by()
+        .values(*REPORT_GROUPS[group])
+        .annotate(
+            total=Sum('count'),
+            # In-progress attempts have no Result yet, so count (quiz, student) pairs
+            attempts=Count(Concat('quiz_id', Value(':'), 'user_id', output_field=CharField()), distinct=True),
+            tab_switches=Sum('count', filter=Q(event_type='tab_switch'), default=0),
+            screenshots=Sum('count', filter=Q(event_type='screenshot_attempt'), default=0),
+            last_seen=Max('occurred_at'),
+        )
+    )
+    if min_total:
+        rows = rows.filter(total__gt=min_total)
+    return rows.order_by('-total')
@@ -0,0 +1,22 @@
+"""
+Gunicorn settings for metrics across workers (see college_exam_portal.metrics).
+
+Start with PROMETHEUS_MULTIPROC_DIR pointing at a directory gunicorn can
+write to; it is emptied when gunicorn starts.
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges (requests in flight)
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -27,6 +27,12 @@ class MaterialForm(forms.ModelForm):
         return f
 
 class NewsForm(forms.ModelForm):
+    email_everyone = forms.BooleanField(
+        required=False,
+        label='Email this announcement to all users',
+        help_text='Sent in the background to every active, verified account.',
+    )
+
     class Meta:
         model = News
         fields = ['title', 'content', 'is_public']
@@ -1,3 +1,82 @@
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from users.models import CustomUser, OutboxMessage
+from users.testing import QueryBudgetMixin, seed_dataset
+
+from . import urls
+from .models import News, StudyMaterial
+
+# (URL name, who is logged in, most queries allowed, method)
+QUERY_BUDGETS = [
+    ('material_list', 'student', 3, 'get'),
+    ('material_upload', 'faculty', 2, 'get'),
+    ('material_edit', 'faculty', 4, 'get'),
+    ('material_delete', 'faculty', 4, 'get'),
+    ('news_list', 'student', 3, 'get'),
+    ('news_create', 'hod', 2, 'get'),
+]
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every materials page stays within its query budget on a large dataset."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hod = seed_dataset()
+        cls.faculty = CustomUser.objects.get(username='faculty0')
+        cls.student = CustomUser.objects.get(username='student0')
+        cls.material = StudyMaterial.objects.filter(uploaded_by=cls.faculty).first()
+
+    def url(self, name):
+        if name in ('material_edit', 'material_delete'):
+            return reverse(f'materials:{name}', args=[self.material.pk])
+        return reverse(f'materials:{name}')
+
+    def test_query_budgets(self):
+        for name, who, budget, method in QUERY_BUDGETS:
+            with self.subTest(url=name, user=who):
+                cache.clear()
+                self.client.force_login(getattr(self, who))
+                self.assertQueryBudget(budget, self.url(name), method)
+
+    def test_every_url_has_a_budget(self):
+        self.assertCoversUrls(urls.urlpatterns, [name for name, *_ in QUERY_BUDGETS])
+
+
+class NewsEmailTests(TestCase):
+    """An announcement can be emailed to every active, verified user through the outbox."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hod = CustomUser.objects.create(username='hod', email='hod@example.com', role='HOD', is_email_verified=True)
+        CustomUser.objects.bulk_create(
+            [CustomUser(username=f'student{i}', email=f'student{i}@example.com', is_email_verified=True)
+             for i in range(1200)]
+            + [CustomUser(username='pending', email='pending@example.com', is_active=False)]
+        )
+
+    def post(self, **data):
+        self.client.force_login(self.hod)
+        return self.client.post(reverse('materials:news_create'), {'title': 'Exams moved', 'content': 'To Monday.',
+                                                                    'is_public': 'on', **data})
+
+    def test_queues_one_email_per_recipient(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post(email_everyone='on')
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "users_outboxmessage"')]
+        self.assertLess(len(inserts), 20)  # batched, however many rows the backend takes per statement
+        self.assertEqual(OutboxMessage.objects.count(), 1200)
+        self.assertFalse(OutboxMessage.objects.filter(to__in=['hod@example.com', 'pending@example.com']).exists())
+        message = OutboxMessage.objects.first()
+        self.assertEqual(message.subject, 'Announcement: Exams moved')
+        self.assertEqual(message.body, 'Exams moved\n\nTo Monday.\n\nhttp://testserver/materials/news/')
+        self.assertIn('http://testserver/materials/news/', message.html_body)
+
+    def test_not_emailed_unless_asked(self):
+        self.post()
+        self.assertTrue(News.objects.filter(title='Exams moved').exists())
+        self.assertFalse(OutboxMessage.objects.exists())
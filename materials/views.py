@@ -4,6 +4,11 @@ from django.contrib import messages
 from .models import StudyMaterial, News
 from .forms import MaterialForm, NewsForm
 from django.conf import settings
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.urls import reverse
+from users.models import CustomUser
+from users.outbox import QUEUE_CHUNK_SIZE, queue_bulk
 import uuid
 import logging
 
@@ -40,7 +45,7 @@ def get_supabase_client():
 
 @login_required
 def material_list(request):
-    materials = StudyMaterial.objects.all()
+    materials = StudyMaterial.objects.select_related('uploaded_by')
     return render(request, 'materials/material_list.html', {'materials': materials})
 
 
@@ -120,7 +125,7 @@ def material_upload(request):
 
 @login_required
 def news_list(request):
-    news = News.objects.all().order_by('-created_at')
+    news = News.objects.select_related('created_by').order_by('-created_at')
     return render(request, 'materials/news_list.html', {'news_list': news})
 
 
@@ -134,13 +139,30 @@ def news_create(request):
         if form.is_valid():
             news = form.save(commit=False)
             news.created_by = request.user
-            news.save()
+            with transaction.atomic():
+                news.save()
+                if form.cleaned_data['email_everyone']:
+                    queued = _queue_news_email(news, request.build_absolute_uri(reverse('materials:news_list')))
+                    messages.success(request, f'Announcement posted; emailing {queued} user(s) in the background.')
             return redirect('materials:news_list')
     else:
         form = NewsForm()
     return render(request, 'materials/news_create.html', {'form': form})
 
 
+def _queue_news_email(news, news_url):
+    """Queue the announcement to every active, verified user but its author. Returns how many were queued."""
+    html_body = render_to_string('materials/news_email.html', {'news': news, 'news_url': news_url})
+    recipients = (
+        CustomUser.objects.filter(is_active=True, is_email_verified=True)
+        .exclude(pk=news.created_by_id).exclude(email='')
+        .values_list('email', flat=True)
+        .iterator(chunk_size=QUEUE_CHUNK_SIZE)
+    )
+    body = f'{news.title}\n\n{news.content}\n\n{news_url}'
+    return queue_bulk(recipients, f'Announcement: {news.title}', html_body, body=body)
+
+
 @login_required
 def material_edit(request, pk):
     material = get_object_or_404(StudyMaterial, pk=pk)
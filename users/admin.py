@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from django.utils import timezone
+from .models import CustomUser, OutboxMessage
+from .user_cache import forget_users
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'role', 'department', 'is_email_verified', 'is_active')
@@ -13,8 +15,26 @@ class CustomUserAdmin(UserAdmin):
     
     def verify_email_action(self, request, queryset):
         """Admin action to verify email for selected users"""
-        updated = queryset.update(is_email_verified=True, is_active=True)
+        user_ids = list(queryset.values_list('pk', flat=True))
+        updated = CustomUser.objects.filter(pk__in=user_ids).update(is_email_verified=True, is_active=True)
+        forget_users(user_ids)
         self.message_user(request, f'{updated} users have been verified.')
     verify_email_action.short_description = "Verify email for selected users"
 
 admin.site.register(CustomUser, CustomUserAdmin)
+
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('to', 'subject', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('to', 'subject')
+    readonly_fields = ('attempts', 'claimed_at', 'last_error', 'created_at')
+    actions = ['retry_action']
+
+    def retry_action(self, request, queryset):
+        """Admin action to send selected messages again, starting a fresh series of attempts"""
+        updated = queryset.update(status='queued', attempts=0, next_attempt_at=timezone.now(), claimed_at=None)
+        self.message_user(request, f'{updated} emails queued again.')
+    retry_action.short_description = "Retry selected emails now"
+
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
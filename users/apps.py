@@ -6,3 +6,6 @@ class UsersConfig(AppConfig):
     name = 'users'
     # Give this app a unique label to avoid collisions with any other 'users' app
     label = 'users'
+
+    def ready(self):
+        from . import dashboard, user_cache  # noqa: F401  connect the cache invalidation receivers
@@ -1,29 +1,63 @@
-from django.contrib.auth.backends import BaseBackend
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import F, Q, Value
+from django.db.models.functions import Lower
+
+from .hashing import hashing_slot
+from .user_cache import user_cache
 
 User = get_user_model()
 
-class EmailOrUsernameModelBackend(BaseBackend):
+
+def identity_key(value):
+    """`value` lowercased by the database, the way the LOWER() indexes on CustomUser see it."""
+    return Lower(Value(value))
+
+
+def identity_lookup(identity):
+    """
+    Users whose username or email is `identity`, ignoring case.
+
+    Matches LOWER(username) and LOWER(email) so that the functional unique
+    indexes on CustomUser are used; iexact compiles to UPPER() or LIKE, which
+    cannot use them and scans the whole table. The identity is lowercased by
+    the database too: SQLite's LOWER() only folds ASCII, so Python's lower()
+    would miss "Émile" typed exactly.
+    """
+    return User.objects.annotate(username_key=Lower('username'), identity_key=identity_key(identity)).alias(
+        email_key=Lower('email'),
+    ).filter(Q(username_key=F('identity_key')) | Q(email_key=F('identity_key')))
+
+
+def find_by_identity(identity):
+    """The user logging in as `identity`, or None. If one user's username is another's email, the username wins."""
+    matches = list(identity_lookup(identity)[:2])
+    return next((user for user in matches if user.username_key == user.identity_key), matches[0] if matches else None)
+
+
+class EmailOrUsernameModelBackend(ModelBackend):
     """
     Custom authentication backend that allows users to login with either username or email
+
+    Password hashing waits for a slot in users.hashing and raises HashingBusy
+    when none frees up in time. get_user() is served from users.user_cache
+    when the cache is shared between workers.
     """
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None or password is None:
             return None
         
-        try:
-            # Try to find user by username or email
-            user = User.objects.get(
-                Q(username__iexact=username) | Q(email__iexact=username)
-            )
-        except User.DoesNotExist:
-            # Run the default password hasher once to reduce the timing
-            # difference between an existing and a non-existing user
-            User().set_password(password)
-            return None
-        
-        if user.check_password(password) and self.user_can_authenticate(user):
+        user = find_by_identity(username)
+        with hashing_slot():
+            if user is None:
+                # Run the default password hasher once to reduce the timing
+                # difference between an existing and a non-existing user
+                User().set_password(password)
+                return None
+            # Rehashes with the preferred hasher (settings.PASSWORD_HASHERS) when it matches
+            valid = user.check_password(password)
+        if valid and self.user_can_authenticate(user):
             return user
         return None
     
@@ -36,8 +70,14 @@ class EmailOrUsernameModelBackend(BaseBackend):
         return is_active or is_active is None
     
     def get_user(self, user_id):
+        if settings.CACHE_IS_SHARED:
+            user = user_cache.get(user_id, self._load_user)
+        else:
+            user = self._load_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    def _load_user(self, user_id):
         try:
-            user = User.objects.get(pk=user_id)
+            return User.objects.get(pk=user_id)
         except User.DoesNotExist:
             return None
-        return user if self.user_can_authenticate(user) else None
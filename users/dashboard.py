@@ -0,0 +1,227 @@
+"""
+Cached dashboard blocks.
+
+Blocks every dashboard of a role shows the same (announcements, counts, the
+latest quizzes and materials, recent results) are cached once, under
+"users:dashboard:<block>". A faculty member's own quizzes, results and
+materials and a student's results are cached per user. A dashboard served
+from the cache runs no queries of its own, except for the student's attempt
+status on the latest quizzes, which comes from exams.attempts.
+
+Blocks are dropped by the receivers below when the rows they show change:
+post_save / post_delete of users, quizzes, results, news and materials, and
+exams.signals for the grading and question-stat writes that bypass them.
+Changes that can touch any number of per-user blocks (a quiz renamed or
+deleted, a user deleted) bump a generation number that is part of every
+per-user key instead of finding the blocks one by one. DASHBOARD_TIMEOUT
+bounds how long a block missed by a racing write can be shown.
+
+The receivers only reach the cache of the process they run in. Results are
+written by the grading worker, and accounts, quizzes and news by whichever
+web worker served the request, so with a per-process cache (CACHE_IS_SHARED
+off) the counts, results and per-user blocks are queried on every load,
+and the other shared blocks are kept for LOCAL_DASHBOARD_TIMEOUT only.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from exams.attempts import attach_attempts
+from exams.models import Quiz, Result
+from exams.signals import question_stats_changed, results_changed
+from materials.models import News, StudyMaterial
+
+from .models import CustomUser
+
+DASHBOARD_TIMEOUT = 600
+LOCAL_DASHBOARD_TIMEOUT = 30
+PREFIX = 'users:dashboard'
+GENERATION_KEY = f'{PREFIX}:generation'
+
+# Only what the templates show: cached results must not carry answer sheets or password hashes
+RESULT_FIELDS = ('score', 'passed', 'completed_at', 'user_id', 'quiz_id', 'user__username', 'quiz__title')
+
+
+def _counts():
+    counts = CustomUser.objects.aggregate(
+        faculty_count=Count('pk', filter=Q(role='FACULTY')),
+        student_count=Count('pk', filter=Q(role='STUDENT')),
+    )
+    counts['quiz_count'] = Quiz.objects.count()
+    return counts
+
+
+SHARED_BLOCKS = {
+    'announcements': lambda: list(News.objects.order_by('-created_at')[:10]),
+    'counts': _counts,
+    'recent_results': lambda: list(
+        Result.objects.select_related('user', 'quiz').only(*RESULT_FIELDS).order_by('-completed_at')[:10]
+    ),
+    'latest_quizzes': lambda: list(Quiz.objects.order_by('-created_at')[:10]),
+    'latest_materials': lambda: list(StudyMaterial.objects.order_by('-created_at')[:10]),
+}
+
+# Written from other processes too: only cached when every process sees the invalidation
+LIVE_BLOCKS = {'counts', 'recent_results'}
+
+ROLE_BLOCKS = {
+    'HOD': ('counts', 'recent_results', 'announcements'),
+    'FACULTY': ('announcements',),
+    'STUDENT': ('latest_quizzes', 'latest_materials', 'announcements'),
+}
+
+
+def _faculty_block(user):
+    return {
+        'created_quizzes': list(user.created_quizzes.order_by('-created_at')[:10]),
+        'student_results': list(
+            Result.objects.filter(quiz__creator=user).select_related('user', 'quiz')
+            .only(*RESULT_FIELDS).order_by('-completed_at')[:20]
+        ),
+        'materials': list(StudyMaterial.objects.filter(uploaded_by=user).order_by('-created_at')[:10]),
+    }
+
+
+def _student_block(user):
+    return {
+        'results': list(
+            Result.objects.filter(user=user).select_related('quiz')
+            .only('score', 'passed', 'completed_at', 'user_id', 'quiz_id', 'quiz__title').order_by('-completed_at')[:10]
+        ),
+    }
+
+
+USER_BLOCKS = {'FACULTY': _faculty_block, 'STUDENT': _student_block}
+
+
+def _user_key(generation, role, user_id):
+    return f'{PREFIX}:{role.lower()}:{generation}:{user_id}'
+
+
+def dashboard_context(user):
+    """Template context for the user's role dashboard, built from cached blocks."""
+    role = (user.role or '').upper()
+    shared = settings.CACHE_IS_SHARED
+    names = ROLE_BLOCKS.get(role, ())
+    blocks = {name: SHARED_BLOCKS[name]() for name in names if not shared and name in LIVE_BLOCKS}
+    keys = {f'{PREFIX}:{name}': name for name in names if name not in blocks}
+    own_cached = shared and role in USER_BLOCKS
+    found = cache.get_many([*keys, GENERATION_KEY] if own_cached else list(keys))
+
+    blocks.update({name: found[key] for key, name in keys.items() if key in found})
+    missing = {key: SHARED_BLOCKS[name]() for key, name in keys.items() if key not in found}
+    if missing:
+        cache.set_many(missing, DASHBOARD_TIMEOUT if shared else LOCAL_DASHBOARD_TIMEOUT)
+        blocks.update({keys[key]: value for key, value in missing.items()})
+
+    own = {}
+    if own_cached:
+        generation = found.get(GENERATION_KEY)
+        if generation is None:
+            generation = _generation()
+        key = _user_key(generation, role, user.pk)
+        own = cache.get(key)
+        if own is None:
+            own = USER_BLOCKS[role](user)
+            cache.set(key, own, DASHBOARD_TIMEOUT)
+    elif role in USER_BLOCKS:
+        own = USER_BLOCKS[role](user)
+
+    context = {'user': user, 'announcements': blocks.get('announcements', [])}
+    if role == 'HOD':
+        context.update(blocks['counts'])
+        context['recent_results'] = blocks['recent_results']
+    elif role == 'FACULTY':
+        context.update(own)
+    elif role == 'STUDENT':
+        context.update({
+            'upcoming_quizzes': attach_attempts(user, blocks['latest_quizzes']),
+            'materials': blocks['latest_materials'],
+            'user_results': own['results'],
+        })
+    return context
+
+
+def _generation():
+    # Start from the clock so a generation lost from the cache never reuses an old number
+    cache.add(GENERATION_KEY, int(time.time()), None)
+    return cache.get(GENERATION_KEY)
+
+
+def forget_shared(*names):
+    cache.delete_many([f'{PREFIX}:{name}' for name in names])
+
+
+def forget_users(role, user_ids):
+    generation = _generation()
+    cache.delete_many([_user_key(generation, role, user_id) for user_id in user_ids if user_id is not None])
+
+
+def forget_all_users():
+    """Drop every per-user block at once."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        _generation()
+
+
+@receiver([post_save, post_delete], sender=News)
+def _news_changed(sender, **kwargs):
+    forget_shared('announcements')
+
+
+@receiver([post_save, post_delete], sender=StudyMaterial)
+def _material_changed(sender, instance, **kwargs):
+    forget_shared('latest_materials')
+    forget_users('FACULTY', [instance.uploaded_by_id])
+
+
+@receiver([post_save, post_delete], sender=Quiz)
+def _quiz_changed(sender, instance, created=False, **kwargs):
+    forget_shared('counts', 'latest_quizzes', 'recent_results')
+    if created:
+        forget_users('FACULTY', [instance.creator_id])
+    else:
+        # A renamed or deleted quiz shows up in the results of every student who took it
+        forget_all_users()
+
+
+@receiver(question_stats_changed)
+def _question_stats_changed(sender, **kwargs):
+    forget_shared('latest_quizzes')
+
+
+@receiver(post_save, sender=CustomUser)
+def _user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Logging in saves last_login only, which no dashboard shows
+    if created or update_fields is None or {'role', 'username'} & set(update_fields):
+        forget_shared('counts', 'recent_results')
+        if not created:
+            # Usernames also appear in faculty members' result lists
+            forget_all_users()
+
+
+@receiver(post_delete, sender=CustomUser)
+def _user_deleted(sender, instance, **kwargs):
+    forget_shared('counts', 'recent_results')
+    forget_all_users()
+
+
+# Result deletions only happen by cascading from a quiz or a user, whose
+# receivers above already cover them. Listening to post_delete as well would
+# make those cascades load every result instead of deleting them in bulk.
+@receiver(post_save, sender=Result)
+def _result_saved(sender, instance, **kwargs):
+    _results_changed(sender, quiz_ids={instance.quiz_id}, user_ids={instance.user_id})
+
+
+@receiver(results_changed)
+def _results_changed(sender, quiz_ids, user_ids, **kwargs):
+    forget_shared('recent_results')
+    forget_users('STUDENT', user_ids)
+    creators = Quiz.objects.filter(pk__in=quiz_ids).values_list('creator_id', flat=True).distinct()
+    forget_users('FACULTY', creators)
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, PasswordChangeForm
 from .models import CustomUser
+from .roster import FORMAT_CHOICES as ROSTER_FORMATS, detect_format as detect_roster_format
 
 class CustomUserCreationForm(UserCreationForm):
     email = forms.EmailField(required=True, widget=forms.EmailInput(attrs={'class': 'form-control'}))
@@ -45,3 +46,24 @@ class CustomPasswordChangeForm(PasswordChangeForm):
         self.fields['old_password'].widget.attrs.update({'placeholder': 'Enter current password'})
         self.fields['new_password1'].widget.attrs.update({'placeholder': 'Enter new password'})
         self.fields['new_password2'].widget.attrs.update({'placeholder': 'Confirm new password'})
+
+class RosterImportForm(forms.Form):
+    """Upload of a student roster; the format is guessed from the file name when not given."""
+    file = forms.FileField(widget=forms.ClearableFileInput(attrs={'class': 'form-control'}))
+    file_format = forms.ChoiceField(
+        choices=[('', 'Detect from file name')] + ROSTER_FORMATS, required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    department = forms.CharField(
+        max_length=100, required=False, help_text='For rows without a department column',
+        widget=forms.TextInput(attrs={'class': 'form-control'}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = cleaned_data.get('file')
+        if upload and not cleaned_data.get('file_format'):
+            cleaned_data['file_format'] = detect_roster_format(upload.name)
+            if not cleaned_data['file_format']:
+                self.add_error('file_format', 'Could not tell the format from the file name; please choose one.')
+        return cleaned_data
@@ -0,0 +1,113 @@
+"""
+Admission control for password hashing.
+
+A password check costs tens to hundreds of milliseconds of CPU, and the
+memory-hard hashers also take memory (16 MB per scrypt hash with Django's
+defaults). When a whole cohort logs in just before an exam, running every
+check at once would leave no CPU for any other page. Authentication therefore
+hashes inside hashing_slot(): at most PASSWORD_HASHING_SLOTS hashes run at
+once in a process, up to PASSWORD_HASHING_QUEUE more wait up to
+PASSWORD_HASHING_WAIT_SECONDS for a slot, and anything beyond that raises
+HashingBusy straight away. The login view, and HashingBusyMiddleware for
+every other view (the admin login, password changes), turn it into a 503
+with Retry-After, so the browser comes back when the queue has drained.
+
+Slots are per process. Threads of one process share them (runserver, gunicorn
+--threads); with sync gunicorn workers every worker has its own.
+"""
+import math
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class HashingBusy(Exception):
+    """No hashing slot came free in time; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Password hashing is saturated, retry after {retry_after} s')
+        self.retry_after = retry_after
+
+
+class HashingGate:
+    """A semaphore of hashing slots with a bounded, time-limited queue in front of it."""
+
+    def __init__(self, slots, queue, wait):
+        self.slots = slots
+        self.queue = queue
+        self.wait = wait
+        self._semaphore = threading.BoundedSemaphore(slots)
+        self._lock = threading.Lock()
+        self.queued = 0
+
+    @contextmanager
+    def slot(self):
+        if not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                if self.queued >= self.queue:
+                    raise HashingBusy(self.retry_after)
+                self.queued += 1
+            try:
+                acquired = self._semaphore.acquire(timeout=self.wait)
+            finally:
+                with self._lock:
+                    self.queued -= 1
+            if not acquired:
+                raise HashingBusy(self.retry_after)
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    @property
+    def retry_after(self):
+        return max(1, math.ceil(self.wait))
+
+
+_gate = None
+_gate_lock = threading.Lock()
+
+
+def get_gate():
+    global _gate
+    with _gate_lock:
+        if _gate is None:
+            _gate = HashingGate(
+                settings.PASSWORD_HASHING_SLOTS,
+                settings.PASSWORD_HASHING_QUEUE,
+                settings.PASSWORD_HASHING_WAIT_SECONDS,
+            )
+        return _gate
+
+
+def hashing_slot():
+    """Context manager holding one hashing slot; raises HashingBusy when saturated."""
+    return get_gate().slot()
+
+
+@receiver(setting_changed)
+def _reset_gate(setting, **kwargs):
+    global _gate
+    if setting.startswith('PASSWORD_HASHING_'):
+        with _gate_lock:
+            _gate = None
+
+
+def hash_initial_passwords(passwords, work_factor):
+    """
+    Hash roster passwords with scrypt at a reduced work factor and one lane
+    (Django's default of five lanes are computed one after another).
+
+    Runs in the process pool of users.roster, so it must not need the app
+    registry. The preferred hasher's must_update() flags these hashes, and
+    they are rehashed at full cost the first time each student logs in.
+    """
+    from django.contrib.auth.hashers import ScryptPasswordHasher
+
+    hasher = ScryptPasswordHasher()
+    hasher.work_factor = work_factor
+    hasher.parallelism = 1
+    return [hasher.encode(password, hasher.salt()) for password in passwords]
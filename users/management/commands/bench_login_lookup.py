@@ -0,0 +1,74 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from users.backends import User, find_by_identity, identity_lookup
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the login identity lookup as the user table grows, against the old iexact query "
+        "(changes are rolled back)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000,500000',
+                            help='Comma-separated user counts to measure at')
+        parser.add_argument('--lookups', type=int, default=300, help='Lookups timed per size and query')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--no-compare', action='store_true', help='Skip timing the old iexact query')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers')
+        rng = random.Random(0)
+
+        with transaction.atomic():
+            self.stdout.write(f'{"users":>9}{"p50 ms":>9}{"p95 ms":>9}' + ('' if options['no_compare'] else
+                              f'{"iexact p50":>12}{"iexact p95":>12}'))
+            created = 0
+            for size in sizes:
+                while created < size:
+                    count = min(options['chunk_size'], size - created)
+                    User.objects.bulk_create([
+                        User(username=f'bench-login-{created + i}', email=f'Bench-Login-{created + i}@Example.com',
+                             password='!')
+                        for i in range(count)
+                    ])
+                    created += count
+                if connection.vendor in ('postgresql', 'sqlite'):
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'ANALYZE {User._meta.db_table}')
+
+                identities = [
+                    rng.choice([f'BENCH-login-{n}', f'bench-login-{n}@example.COM'])
+                    for n in (rng.randrange(size) for _ in range(options['lookups']))
+                ]
+                row = f'{size:>9}' + self._timings(find_by_identity, identities)
+                if not options['no_compare']:
+                    row += self._timings(self._iexact, identities, width=12)
+                self.stdout.write(row)
+
+            self.stdout.write('\nQuery plan:\n' + identity_lookup(identities[0]).explain())
+            transaction.set_rollback(True)
+
+    def _timings(self, lookup, identities, width=9):
+        seconds = []
+        for identity in identities:
+            started = time.perf_counter()
+            if lookup(identity) is None:
+                raise CommandError(f'{identity} was not found')
+            seconds.append(time.perf_counter() - started)
+        p50, p95 = np.percentile(np.array(seconds) * 1000, [50, 95])
+        return f'{p50:>{width}.3f}{p95:>{width}.3f}'
+
+    def _iexact(self, identity):
+        # The query the backend used to run
+        return User.objects.filter(Q(username__iexact=identity) | Q(email__iexact=identity)).first()
+
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.roster import READERS, detect_format, import_roster
+
+
+class Command(BaseCommand):
+    help = "Create inactive student accounts from a CSV or XLSX roster and queue their verification emails."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help='Default: from the file extension')
+        parser.add_argument('--department', default='', help='For rows without a department column')
+        parser.add_argument('--base-url', default='',
+                            help='Site address for the verification links, e.g. https://exams.example.edu; '
+                                 'without it no emails are queued')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or detect_format(options['path'])
+        if not file_format:
+            raise CommandError('Could not tell the format from the file name; pass --format')
+        started = time.perf_counter()
+        last = {}
+
+        def progress(stage, done, total):
+            # One line when a stage starts and one when it is complete
+            if last.get('stage') != stage or done == total:
+                self.stdout.write(f"{time.perf_counter() - started:7.1f} s  {stage} {done}" + (f'/{total}' if total else ''))
+            last['stage'] = stage
+
+        try:
+            with open(options['path'], 'rb') as binary:
+                report = import_roster(binary, file_format, options['department'], options['base_url'], progress)
+        except OSError as error:
+            raise CommandError(error)
+
+        for line, message in report.errors:
+            self.stderr.write(f'line {line}: {message}')
+        if report.error_count:
+            raise CommandError(f'Nothing was imported: {report.error_count} problem(s) in {report.rows} rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {report.created} students and queued {report.emails_queued} verification emails '
+            f'in {time.perf_counter() - started:.1f} s'
+        ))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from users.outbox import process_outbox
+
+
+class Command(BaseCommand):
+    help = "Send queued emails in batches, one mail connection per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages claimed and sent per connection')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to sleep when nothing is due')
+        parser.add_argument('--once', action='store_true', help='Send everything due now and exit')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        try:
+            while True:
+                close_old_connections()
+                sent, failed = process_outbox(options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f'Sent {sent} email(s), {failed} failed.')
+                    if sent:
+                        continue
+                if options['once']:
+                    break
+                # Nothing due, or the mail server is refusing everything: wait before the next round
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping.')
+        finally:
+            connection.close()
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} email(s); {total_failed} failure(s).'))
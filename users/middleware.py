@@ -1,7 +1,20 @@
+import logging
+import sys
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib import messages
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect
+
+from .hashing import HashingBusy
+
+logger = logging.getLogger(__name__)
+query_logger = logging.getLogger('users.queries')
 
 class AccessDeniedMiddleware:
     """
@@ -43,3 +56,123 @@ class AccessDeniedMiddleware:
             return redirect('users:access_denied')
         
         return None
+
+
+class HashingBusyMiddleware:
+    """
+    Answer 503 with Retry-After when password hashing is saturated (see
+    users.hashing), wherever a password is checked: the admin login, password
+    changes, or any other view that authenticates.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, HashingBusy):
+            return None
+        logger.warning('Password check shed on %s', request.path, extra={'event': 'hashing', 'outcome': 'busy'})
+        response = HttpResponse(
+            'Too many people are logging in right now. Please try again in a few seconds.\n',
+            status=503, content_type='text/plain',
+        )
+        response['Retry-After'] = str(exception.retry_after)
+        return response
+
+
+class QueryProfilingMiddleware:
+    """
+    Opt-in (QUERY_PROFILING = True) per-request SQL profile.
+
+    Counts the queries a request runs and their total database time, and
+    reports both in a Server-Timing header and a log line. Statements that
+    run more than once in a request (the usual sign of an N+1 loop) are
+    logged as warnings, with the template line or project code that issued
+    them.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.duplicate_threshold = getattr(settings, 'QUERY_PROFILING_DUPLICATES', 2)
+        self.project_root = str(settings.BASE_DIR)
+
+    def __call__(self, request):
+        profile = QueryProfile(self.project_root)
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            response = self.get_response(request)
+        elapsed = (time.perf_counter() - started) * 1000
+
+        duplicates = profile.duplicates(self.duplicate_threshold)
+        timing = [
+            f'db;dur={profile.duration:.1f};desc="{len(profile.queries)} queries"',
+            f'app;dur={elapsed:.1f}',
+        ]
+        if duplicates:
+            timing.append(f'dup;desc="{sum(count for _, count, _ in duplicates)} repeated queries"')
+        response['Server-Timing'] = ', '.join(filter(None, [response.get('Server-Timing')] + timing))
+
+        query_logger.info(
+            '%s %s %s: %d queries, %.1f ms in the database, %.1f ms total, %d repeated statements',
+            request.method, request.path, response.status_code, len(profile.queries), profile.duration, elapsed,
+            len(duplicates),
+        )
+        for sql, count, origins in duplicates:
+            query_logger.warning('%s ran %d times in %s %s, from %s', sql[:300], count, request.method,
+                                 request.path, ', '.join(sorted(origins)))
+        return response
+
+
+class QueryProfile:
+    """execute_wrapper recording each statement, its time and where it came from."""
+
+    def __init__(self, project_root):
+        self.project_root = project_root
+        self.queries = []  # (sql, params, milliseconds, origin)
+
+    @property
+    def duration(self):
+        return sum(query[2] for query in self.queries)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, params, (time.perf_counter() - started) * 1000, self.origin()))
+
+    def origin(self):
+        """The template line rendering, or else the innermost project code, that issued the query."""
+        code_frame = None
+        frame = sys._getframe(2)
+        while frame is not None:
+            if frame.f_code.co_name == 'render_annotated':
+                # Innermost template node being rendered; its origin is the (possibly included) template
+                node = frame.f_locals.get('self')
+                origin = getattr(node, 'origin', None)
+                if origin is not None:
+                    return f'{origin.template_name or origin.name}:{node.token.lineno}'
+            filename = frame.f_code.co_filename
+            if code_frame is None and filename.startswith(self.project_root) and 'site-packages' not in filename:
+                code_frame = f'{filename[len(self.project_root) + 1:]}:{frame.f_lineno} ({frame.f_code.co_name})'
+            frame = frame.f_back
+        return code_frame or 'unknown'
+
+    def duplicates(self, threshold=2):
+        """[(sql, times run, origins)] for statements run at least `threshold` times, most repeated first."""
+        seen = {}
+        for sql, _, _, origin in self.queries:
+            count, origins = seen.get(sql, (0, set()))
+            origins.add(origin)
+            seen[sql] = (count + 1, origins)
+        return sorted(
+            ((sql, count, origins) for sql, (count, origins) in seen.items() if count >= threshold),
+            key=lambda row: -row[1],
+        )
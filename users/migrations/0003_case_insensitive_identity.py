@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:34
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+MAX_REPORTED = 50
+
+
+def check_case_duplicates(apps, schema_editor):
+    """Stop with a readable list if existing users differ only in letter case, which the constraints reject."""
+    User = apps.get_model('users', 'CustomUser')
+    clashes = []
+    for field in ('username', 'email'):
+        keys = (
+            User.objects.annotate(key=Lower(field)).values('key')
+            .annotate(n=Count('id')).filter(n__gt=1).order_by('key').values_list('key', flat=True)
+        )
+        for key in keys[:MAX_REPORTED]:
+            values = User.objects.annotate(key=Lower(field)).filter(key=key).order_by('id').values_list(field, flat=True)
+            clashes.append(f"{field}: {', '.join(values)}")
+    if clashes:
+        raise RuntimeError(
+            'These users differ only in letter case, so case-insensitive uniqueness cannot be enforced. '
+            'Rename or merge them, then run migrate again:\n  ' + '\n  '.join(clashes)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0002_customuser_address_customuser_bio_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_case_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='customuser',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('username'), name='users_customuser_username_lower_uniq', violation_error_message='A user with that username already exists.'),
+        ),
+        migrations.AddConstraint(
+            model_name='customuser',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='users_customuser_email_lower_uniq', violation_error_message='A user with that email already exists.'),
+        ),
+    ]
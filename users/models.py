@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 import uuid
 
 class CustomUser(AbstractUser):
@@ -35,5 +37,59 @@ class CustomUser(AbstractUser):
         verbose_name='user permissions',
     )
     
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # Logins match either column case-insensitively; these back that lookup with an index
+            models.UniqueConstraint(
+                Lower('username'), name='users_customuser_username_lower_uniq',
+                violation_error_message='A user with that username already exists.',
+            ),
+            models.UniqueConstraint(
+                Lower('email'), name='users_customuser_email_lower_uniq',
+                violation_error_message='A user with that email already exists.',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.username} - {self.role}"
+
+
+class OutboxMessage(models.Model):
+    """An email waiting to be sent by the send_outbox worker (see users.outbox)."""
+    STATUSES = (
+        ('queued', 'Queued'),
+        ('dead', 'Dead-lettered'),
+    )
+
+    to = models.EmailField(max_length=254)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
+
+
+class RosterImportJob(models.Model):
+    """Progress of a background roster import, for the status page (see users.roster)."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey('CustomUser', on_delete=models.CASCADE, related_name='roster_jobs')
+    stage = models.CharField(max_length=20, default='queued')
+    done = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    report = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Roster import {self.id} ({self.stage})"
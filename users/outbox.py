@@ -0,0 +1,168 @@
+"""
+Email outbox.
+
+Views never talk to the mail server. They add OutboxMessage rows, in the
+same transaction as whatever the email is about, and return. The
+send_outbox worker claims due messages in batches with a lease, sends each
+batch over one mail connection, deletes what was sent, and schedules a retry
+for what failed: after EMAIL_OUTBOX_RETRY_SECONDS, doubling with every
+attempt up to EMAIL_OUTBOX_MAX_RETRY_SECONDS. A message that fails
+EMAIL_OUTBOX_MAX_ATTEMPTS times is dead-lettered. It stays in the table with
+its last error and can be requeued from the admin. Only a message's own
+send errors count as attempts: when the mail server cannot be reached, the
+messages not tried are put back for EMAIL_OUTBOX_RETRY_SECONDS as they were,
+so an outage never dead-letters the queue.
+
+One row is stored per recipient, so an announcement to thousands of users
+is a chunked bulk insert, and one bad address cannot hold up the others.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+CLAIM_LEASE = timedelta(minutes=5)
+QUEUE_CHUNK_SIZE = 1000
+
+
+def queue_email(to, subject, html_body, body=None, from_email=''):
+    """Queue one email; the plain-text body defaults to the HTML with its tags stripped."""
+    return OutboxMessage.objects.create(
+        to=to, subject=subject, html_body=html_body, body=body if body is not None else strip_tags(html_body),
+        from_email=from_email,
+    )
+
+
+def queue_bulk(recipients, subject, html_body, body=None, from_email=''):
+    """Queue the same email to every address in `recipients`, inserting in chunks. Returns how many were queued."""
+    body = body if body is not None else strip_tags(html_body)
+    queued, chunk = 0, []
+    for to in recipients:
+        chunk.append(OutboxMessage(to=to, subject=subject, html_body=html_body, body=body, from_email=from_email))
+        if len(chunk) == QUEUE_CHUNK_SIZE:
+            OutboxMessage.objects.bulk_create(chunk)
+            queued += len(chunk)
+            chunk = []
+    OutboxMessage.objects.bulk_create(chunk)
+    return queued + len(chunk)
+
+
+def verification_email(user, base_url, subject="Verify your email - College Exam Portal"):
+    """An unsaved OutboxMessage with the user's verification link under `base_url`."""
+    html_body = render_to_string('users/verify_email.html', {
+        'username': user.username,
+        'verify_url': base_url.rstrip('/') + reverse('users:verify_email', args=[str(user.email_verification_token)]),
+    })
+    return OutboxMessage(to=user.email, subject=subject, html_body=html_body, body=strip_tags(html_body))
+
+
+def _claimable(now):
+    """Due messages nobody holds a lease on (never claimed, or the claimer died)."""
+    return OutboxMessage.objects.filter(status='queued', next_attempt_at__lte=now).filter(
+        Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - CLAIM_LEASE)
+    )
+
+
+def claim_batch(limit):
+    """Lease up to `limit` due messages to the caller."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            _claimable(now)
+            .select_for_update(skip_locked=True)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        OutboxMessage.objects.filter(id__in=ids).update(claimed_at=now)
+    return list(OutboxMessage.objects.filter(id__in=ids, claimed_at=now))
+
+
+def _email(message):
+    email = EmailMultiAlternatives(
+        subject=message.subject,
+        body=message.body,
+        from_email=message.from_email or getattr(settings, 'DEFAULT_FROM_EMAIL', settings.EMAIL_HOST_USER),
+        to=[message.to],
+    )
+    if message.html_body:
+        email.attach_alternative(message.html_body, "text/html")
+    return email
+
+
+def retry_delay(attempts):
+    """Seconds before attempt number `attempts` + 1."""
+    return min(settings.EMAIL_OUTBOX_RETRY_SECONDS * 2 ** (attempts - 1), settings.EMAIL_OUTBOX_MAX_RETRY_SECONDS)
+
+
+def send_batch(messages):
+    """Send claimed messages over one connection. Returns (sent, not sent)."""
+    if not messages:
+        return 0, 0
+    sent, failed, deferred = [], [], []
+    mail = get_connection()
+    try:
+        mail.open()
+    except Exception as error:
+        # Nothing can go out this round, through no fault of the messages
+        logger.warning('Could not connect to the mail server: %s', error)
+        deferred = [(message, error) for message in messages]
+    else:
+        try:
+            for message in messages:
+                try:
+                    mail.send_messages([_email(message)])
+                except Exception as error:
+                    failed.append((message, error))
+                    # The connection may not have survived; start a clean one for the rest
+                    mail.close()
+                    mail.open()
+                else:
+                    sent.append(message.id)
+        except Exception as error:
+            # Reconnecting failed: the messages not tried yet wait without using up an attempt
+            logger.warning('Could not reconnect to the mail server: %s', error)
+            tried = set(sent) | {message.id for message, _ in failed}
+            deferred = [(message, error) for message in messages if message.id not in tried]
+        finally:
+            mail.close()
+
+    now = timezone.now()
+    for message, error in failed:
+        message.attempts += 1
+        message.claimed_at = None
+        message.last_error = f'{type(error).__name__}: {error}'[:2000]
+        if message.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            message.status = 'dead'
+            logger.error('Dead-lettered email to %s after %d attempts: %s', message.to, message.attempts,
+                         message.last_error)
+        else:
+            message.next_attempt_at = now + timedelta(seconds=retry_delay(message.attempts))
+    for message, error in deferred:
+        message.claimed_at = None
+        message.last_error = f'{type(error).__name__}: {error}'[:2000]
+        message.next_attempt_at = now + timedelta(seconds=settings.EMAIL_OUTBOX_RETRY_SECONDS)
+    with transaction.atomic():
+        OutboxMessage.objects.filter(id__in=sent).delete()
+        OutboxMessage.objects.bulk_update(
+            [message for message, _ in failed + deferred],
+            ['attempts', 'claimed_at', 'last_error', 'status', 'next_attempt_at'],
+        )
+    return len(sent), len(failed) + len(deferred)
+
+
+def process_outbox(batch_size=100):
+    """Claim and send one batch. Returns (sent, failed)."""
+    return send_batch(claim_batch(batch_size))
@@ -0,0 +1,387 @@
+"""
+Student accounts from roster files.
+
+A roster is a CSV or XLSX file with a header row naming the columns
+username, email and password, and optionally first_name, last_name and
+department. Rows are read as a stream and validated like the registration
+form would. Usernames and emails already taken, in any case, are found with
+one query for the whole file. If any row has a problem nothing is created
+and every problem is reported with its line.
+
+A valid roster is hashed in a pool of processes (ROSTER_HASH_WORKERS) with
+a cheaper scrypt work factor that is upgraded on each student's first login
+(see users.hashing). The accounts are inserted with chunked bulk_create in
+one transaction, together with their verification emails in the outbox (see
+users.outbox). As with registration, accounts stay inactive until the student
+follows the link.
+
+Web imports run in a background thread. Their progress is kept in a
+RosterImportJob row, so the status page can be answered by any worker
+process. Progress reported while the accounts are saved becomes visible when
+their transaction commits. A job that has not moved for JOB_TIMEOUT is
+reported as failed: the process running it has died.
+"""
+import csv
+import io
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from datetime import timedelta
+from itertools import repeat
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .backends import identity_key
+from .dashboard import forget_shared
+from .hashing import hash_initial_passwords
+from .models import CustomUser, OutboxMessage, RosterImportJob
+from .outbox import verification_email
+
+logger = logging.getLogger(__name__)
+
+FORMAT_CHOICES = [('csv', 'CSV'), ('xlsx', 'Excel (XLSX)')]
+EXTENSIONS = {'.csv': 'csv', '.xlsx': 'xlsx'}
+COLUMNS = ('username', 'email', 'password', 'first_name', 'last_name', 'department')
+REQUIRED_COLUMNS = COLUMNS[:3]
+
+MAX_REPORTED_ERRORS = 50
+INSERT_CHUNK_SIZE = 1000
+HASH_CHUNK_SIZE = 200
+# Identities per IN (...) list; two lists stay under SQLite's 32766 parameters
+LOOKUP_CHUNK_SIZE = 15000
+JOB_TIMEOUT = timedelta(hours=1)
+# Finished jobs are deleted when a new import starts this long afterwards
+JOB_RETENTION = timedelta(days=7)
+
+SPREADSHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+RELATIONSHIP_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+
+@dataclass
+class RosterReport:
+    rows: int = 0
+    created: int = 0
+    emails_queued: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)  # (line, message), first MAX_REPORTED_ERRORS
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def detect_format(filename):
+    """Guess the format from a file name, or None."""
+    match = re.search(r'\.\w+$', filename or '')
+    return EXTENSIONS.get(match.group(0).lower()) if match else None
+
+
+def _no_progress(stage, done, total):
+    pass
+
+
+def import_roster(binary, file_format, department='', base_url='', progress=_no_progress):
+    """
+    Create inactive student accounts from the roster in the binary stream
+    and queue each student a verification link under `base_url`. Returns a
+    RosterReport; nothing is created unless every row is valid.
+    """
+    report = RosterReport()
+    students = _validate(_records(READERS[file_format](binary)), department, report, progress)
+    if report.error_count or not students:
+        return report
+
+    passwords = [student.password for student in students]
+    for student, encoded in zip(students, _hash(passwords, progress)):
+        student.password = encoded
+
+    try:
+        with transaction.atomic():
+            for start in range(0, len(students), INSERT_CHUNK_SIZE):
+                chunk = students[start:start + INSERT_CHUNK_SIZE]
+                CustomUser.objects.bulk_create(chunk)
+                if base_url:
+                    OutboxMessage.objects.bulk_create([verification_email(student, base_url) for student in chunk])
+                    report.emails_queued += len(chunk)
+                progress('saving', min(start + INSERT_CHUNK_SIZE, len(students)), len(students))
+    except IntegrityError:
+        # Someone registered one of these usernames or emails after validation
+        report.add_error(0, 'A username or email in the roster was taken while importing; nothing was created. '
+                            'Please import the file again.')
+        report.emails_queued = 0
+        return report
+    report.created = len(students)
+    # bulk_create sends no post_save, which the dashboard counts listen to
+    forget_shared('counts')
+    return report
+
+
+def _validate(records, department, report, progress):
+    """Build unsaved students from the records, reporting every problem. Passwords are still plain."""
+    students = []
+    usernames, emails = {}, {}  # lowercased -> (line, as typed)
+    for line, record in records:
+        if isinstance(record, str):
+            report.add_error(line, record)
+            continue
+        report.rows += 1
+        student = CustomUser(
+            username=record.get('username', ''),
+            email=record.get('email', ''),
+            first_name=record.get('first_name', ''),
+            last_name=record.get('last_name', ''),
+            department=record.get('department') or department,
+            role='STUDENT',
+            is_active=False,
+            is_email_verified=False,
+        )
+        problems = []
+        try:
+            student.clean_fields(exclude=['password'])
+            student.clean()
+        except ValidationError as error:
+            problems.extend(
+                f"{name}: {' '.join(messages)}" for name, messages in error.message_dict.items()
+            )
+        password = record.get('password', '')
+        if not password:
+            problems.append('password: This field cannot be blank.')
+        else:
+            try:
+                validate_password(password, student)
+            except ValidationError as error:
+                problems.append(f"password: {' '.join(error.messages)}")
+        for name, seen in (('username', usernames), ('email', emails)):
+            key = getattr(student, name).lower()
+            if key and key in seen:
+                problems.append(f'{name}: {getattr(student, name)} is also on line {seen[key][0]}.')
+            elif key:
+                seen[key] = line, getattr(student, name)
+        if problems:
+            report.add_error(line, '; '.join(problems))
+            continue
+        student.password = password
+        students.append(student)
+        if report.rows % 1000 == 0:
+            progress('validating', report.rows, 0)
+
+    taken = _taken([typed for _, typed in usernames.values()], [typed for _, typed in emails.values()])
+    for username, email in taken:
+        if username.lower() in usernames:
+            report.add_error(usernames[username.lower()][0], f'username: {username} already has an account.')
+        if email.lower() in emails:
+            report.add_error(emails[email.lower()][0], f'email: {email} already has an account.')
+    if report.errors:
+        report.errors.sort(key=lambda error: error[0])
+    return students
+
+
+def _taken(usernames, emails):
+    """Existing (username, email) pairs matching any of the identities, ignoring case as the unique indexes do."""
+    taken = []
+    for start in range(0, max(len(usernames), len(emails)), LOOKUP_CHUNK_SIZE):
+        end = start + LOOKUP_CHUNK_SIZE
+        taken.extend(
+            CustomUser.objects.alias(username_key=Lower('username'), email_key=Lower('email'))
+            .filter(Q(username_key__in=[identity_key(username) for username in usernames[start:end]])
+                    | Q(email_key__in=[identity_key(email) for email in emails[start:end]]))
+            .values_list('username', 'email')
+        )
+    return taken
+
+
+def _hash(passwords, progress):
+    work_factor = settings.ROSTER_PASSWORD_WORK_FACTOR
+    chunks = [passwords[start:start + HASH_CHUNK_SIZE] for start in range(0, len(passwords), HASH_CHUNK_SIZE)]
+    workers = min(settings.ROSTER_HASH_WORKERS, len(chunks))
+    hashed = []
+    with ExitStack() as stack:
+        if workers > 0:
+            # spawn, not fork: web imports run in a thread of a threaded server process
+            pool = stack.enter_context(
+                ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            )
+            results = pool.map(hash_initial_passwords, chunks, repeat(work_factor))
+        else:
+            results = map(hash_initial_passwords, chunks, repeat(work_factor))
+        for result in results:
+            hashed.extend(result)
+            progress('hashing', len(hashed), len(passwords))
+    return hashed
+
+
+# Readers: each takes a binary stream and yields (line number, list of cell strings or an error message),
+# or (1, None) when the file is not in the format at all
+
+def _read_csv(binary):
+    reader = csv.reader(io.TextIOWrapper(binary, encoding='utf-8-sig', errors='replace', newline=''))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _read_xlsx(binary):
+    try:
+        workbook = zipfile.ZipFile(binary)
+        shared = _shared_strings(workbook)
+        sheet = workbook.open(_first_sheet(workbook))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError):
+        yield 1, None
+        return
+    with workbook, sheet:
+        line = 0
+        try:
+            for _, element in ElementTree.iterparse(sheet):
+                if element.tag != SPREADSHEET_NS + 'row':
+                    continue
+                line = int(element.get('r')) if (element.get('r') or '').isdigit() else line + 1
+                try:
+                    yield line, _row_values(element, shared)
+                except (AttributeError, IndexError, ValueError):
+                    # A cell pointing past the shared strings, or a number that is not one
+                    yield line, 'This row has a damaged cell and could not be read.'
+                element.clear()
+        except (zipfile.BadZipFile, ElementTree.ParseError):
+            yield line + 1, 'The sheet is damaged from this row on and could not be read.'
+
+
+def _row_values(row, shared):
+    cells = {}
+    for position, cell in enumerate(row.iter(SPREADSHEET_NS + 'c')):
+        column = _column_index(cell.get('r')) if cell.get('r') else position
+        cells[column] = _cell_text(cell, shared)
+    return [cells.get(i, '') for i in range(max(cells, default=-1) + 1)]
+
+
+def _shared_strings(workbook):
+    if 'xl/sharedStrings.xml' not in workbook.namelist():
+        return []
+    strings = []
+    with workbook.open('xl/sharedStrings.xml') as handle:
+        for _, element in ElementTree.iterparse(handle):
+            if element.tag == SPREADSHEET_NS + 'si':
+                strings.append(''.join(text.text or '' for text in element.iter(SPREADSHEET_NS + 't')))
+                element.clear()
+    return strings
+
+
+def _first_sheet(workbook):
+    try:
+        sheets = ElementTree.fromstring(workbook.read('xl/workbook.xml')).find(SPREADSHEET_NS + 'sheets')
+        relation = sheets[0].get(RELATIONSHIP_NS + 'id')
+        for link in ElementTree.fromstring(workbook.read('xl/_rels/workbook.xml.rels')):
+            if link.get('Id') == relation:
+                target = link.get('Target').lstrip('/')
+                return target if target.startswith('xl/') else f'xl/{target}'
+    except (KeyError, IndexError, ElementTree.ParseError):
+        pass
+    return 'xl/worksheets/sheet1.xml'
+
+
+def _column_index(reference):
+    index = 0
+    for letter in re.match(r'[A-Z]+', reference).group(0):
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def _cell_text(cell, shared):
+    kind = cell.get('t')
+    if kind == 'inlineStr':
+        return ''.join(text.text or '' for text in cell.iter(SPREADSHEET_NS + 't'))
+    value = cell.find(SPREADSHEET_NS + 'v')
+    if value is None or value.text is None:
+        return ''
+    if kind == 's':
+        return shared[int(value.text)]
+    if kind in (None, 'n'):
+        # Roll numbers typed as numbers come back as "2023001" or "2023001.0"
+        number = float(value.text)
+        return str(int(number)) if number.is_integer() else value.text
+    return value.text
+
+
+READERS = {'csv': _read_csv, 'xlsx': _read_xlsx}
+
+
+def _records(rows):
+    """Map rows to {column: value} after the header row; yields (line, record or error message)."""
+    header = None
+    for line, values in rows:
+        if values is None:
+            yield line, 'The file could not be read in this format.'
+            return
+        if isinstance(values, str):
+            # A row the reader could not make out; without the header nothing after it can be
+            yield line, values
+            if header is None:
+                return
+            continue
+        values = [str(value).strip() for value in values]
+        if not any(values):
+            continue
+        if header is None:
+            header = [re.sub(r'\s+', '_', value.lower()) for value in values]
+            missing = [name for name in REQUIRED_COLUMNS if name not in header]
+            if missing:
+                yield line, f"Missing column(s): {', '.join(missing)}"
+                return
+            continue
+        yield line, {name: value for name, value in zip(header, values) if name in COLUMNS}
+
+
+# Background imports for the web view
+
+def roster_job(job_id):
+    """The state of a background import: stage, done, total, user_id and, once finished, the report. None if unknown."""
+    try:
+        job = RosterImportJob.objects.filter(pk=job_id).values('stage', 'done', 'total', 'user_id', 'report',
+                                                              'updated_at').first()
+    except ValidationError:
+        return None
+    if job and job['stage'] not in ('done', 'failed') and job['updated_at'] < timezone.now() - JOB_TIMEOUT:
+        job['stage'] = 'failed'
+    return job
+
+
+def start_roster_import(path, file_format, department, base_url, user_id):
+    """Import the roster file at `path` in a background thread; the file is deleted afterwards. Returns the job id."""
+    RosterImportJob.objects.filter(updated_at__lt=timezone.now() - JOB_RETENTION).delete()
+    job = RosterImportJob.objects.create(user_id=user_id)
+    threading.Thread(
+        target=_run_job, args=(job.pk, path, file_format, department, base_url), daemon=True,
+    ).start()
+    return job.pk
+
+
+def _update_job(job_id, **fields):
+    RosterImportJob.objects.filter(pk=job_id).update(updated_at=timezone.now(), **fields)
+
+
+def _run_job(job_id, path, file_format, department, base_url):
+    def progress(stage, done, total):
+        _update_job(job_id, stage=stage, done=done, total=total)
+
+    try:
+        with open(path, 'rb') as binary:
+            report = import_roster(binary, file_format, department, base_url, progress)
+        _update_job(job_id, stage='done', report=asdict(report))
+    except Exception:
+        logger.exception('Roster import failed')
+        _update_job(job_id, stage='failed')
+    finally:
+        os.unlink(path)
+        connection.close()
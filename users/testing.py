@@ -0,0 +1,107 @@
+"""
+Helpers for the per-view query budget tests in users, exams and materials.
+
+seed_dataset() fills the test database with a realistic amount of data, so
+that a view that runs a query per row shows up as a budget failure rather
+than passing on an empty table. QueryBudgetMixin.assertQueryBudget()
+requests a URL and fails with the repeated statements and where they came
+from (see users.middleware.QueryProfile).
+"""
+import random
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from exams.answer_sheets import pack_answers
+from exams.models import Question, Quiz, Result, ViolationEvent
+from materials.models import News, StudyMaterial
+
+from .middleware import QueryProfile
+from .models import CustomUser
+
+
+def seed_dataset(students=300, faculty=10, quizzes=40, questions=20, attempts=60, materials=60, news=60):
+    """Create users of every role, quizzes with questions and results, materials and news. Returns the HOD."""
+    rng = random.Random(0)
+    hod = CustomUser.objects.create(
+        username='hod', email='hod@example.com', role='HOD', department='Computer Science', is_email_verified=True,
+    )
+    teachers = CustomUser.objects.bulk_create([
+        CustomUser(username=f'faculty{i}', email=f'faculty{i}@example.com', role='FACULTY',
+                   department='Computer Science', is_email_verified=True)
+        for i in range(faculty)
+    ])
+    learners = CustomUser.objects.bulk_create([
+        CustomUser(username=f'student{i}', email=f'student{i}@example.com', role='STUDENT',
+                   department=rng.choice(['Computer Science', 'Mathematics', 'Physics']), is_email_verified=True)
+        for i in range(students)
+    ])
+    for user in [hod] + teachers + learners:
+        user.set_unusable_password()
+    CustomUser.objects.bulk_update([hod] + teachers + learners, ['password'])
+
+    exams = Quiz.objects.bulk_create([
+        Quiz(title=f'Quiz {i}', description='Seeded', duration=30, passing_score=50, creator=teachers[i % faculty])
+        for i in range(quizzes)
+    ])
+    for quiz in exams:
+        quiz.assigned_faculty.add(quiz.creator)
+    Question.objects.bulk_create([
+        Question(quiz=quiz, text=f'Question {n}', option_1='a', option_2='b', option_3='c', option_4='d',
+                 correct_answer=n % 4 + 1, marks=1, tags='seeded')
+        for quiz in exams for n in range(questions)
+    ])
+    results = []
+    for quiz in exams:
+        for student in rng.sample(learners, min(attempts, students)):
+            score = rng.randint(0, 100)
+            results.append(Result(
+                user=student, quiz=quiz, score=score, passed=score >= 50,
+                answers=pack_answers([rng.randint(0, 4) for _ in range(questions)]), quiz_version=quiz.version,
+            ))
+    Result.objects.bulk_create(results)
+    ViolationEvent.objects.bulk_create([
+        ViolationEvent(quiz=result.quiz, user=result.user, result=result, event_type='tab_switch',
+                       occurred_at=result.completed_at, count=rng.randint(1, 3))
+        for result in Result.objects.select_related('quiz', 'user')[:len(results) // 10]
+    ])
+    StudyMaterial.objects.bulk_create([
+        StudyMaterial(title=f'Material {i}', description='Seeded', subject='General',
+                      external_link='https://example.com/', uploaded_by=teachers[i % faculty])
+        for i in range(materials)
+    ])
+    News.objects.bulk_create([
+        News(title=f'News {i}', content='Seeded', created_by=rng.choice([hod] + teachers)) for i in range(news)
+    ])
+    return hod
+
+
+class QueryBudgetMixin:
+    """For TestCase subclasses: assert how many queries one request may run."""
+
+    def assertQueryBudget(self, budget, url, method='get', data=None, status_codes=(200, 302)):
+        profile = QueryProfile(str(settings.BASE_DIR))
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            response = getattr(self.client, method)(url, data)
+            if response.streaming:
+                # Streaming responses run their queries as the body is read
+                b''.join(response.streaming_content)
+        self.assertIn(response.status_code, status_codes, f'{method.upper()} {url}')
+        if len(profile.queries) > budget:
+            repeated = '\n'.join(
+                f'  {count}x from {", ".join(sorted(origins))}: {sql[:200]}'
+                for sql, count, origins in profile.duplicates()
+            )
+            self.fail(
+                f'{method.upper()} {url} ran {len(profile.queries)} queries, budget {budget}'
+                + (f'\nRepeated statements:\n{repeated}' if repeated else '')
+            )
+        return response
+
+    def assertCoversUrls(self, urlpatterns, names):
+        """Every named URL of an app must have a budget."""
+        missing = {pattern.name for pattern in urlpatterns if pattern.name} - set(names)
+        self.assertFalse(missing, f'URLs without a query budget: {", ".join(sorted(missing))}')
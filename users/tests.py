@@ -1,3 +1,580 @@
-from django.test import TestCase
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+import io
+import smtplib
+from importlib import import_module
+import zipfile
+from datetime import timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.apps import apps
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import urls
+from exams.models import Quiz, Result
+from materials.models import News
+
+from .backends import find_by_identity
+from .hashing import HashingBusy, get_gate, hashing_slot
+from .models import CustomUser, OutboxMessage, RosterImportJob
+from .outbox import process_outbox, queue_email
+from .roster import _update_job, import_roster
+from .user_cache import UserCache, forget_users, user_cache
+from .testing import QueryBudgetMixin, seed_dataset
+
+# (URL name, who is logged in, most queries allowed, method)
+QUERY_BUDGETS = [
+    ('home', None, 0, 'get'),
+    ('register', None, 0, 'get'),
+    ('login', None, 0, 'get'),
+    ('access_denied', None, 0, 'get'),
+    ('verify_email', None, 2, 'get'),
+    ('dashboard', 'hod', 6, 'get'),
+    ('dashboard', 'faculty', 6, 'get'),
+    ('dashboard', 'student', 7, 'get'),
+    ('profile', 'student', 2, 'get'),
+    ('edit_profile', 'student', 2, 'get'),
+    ('change_password', 'student', 2, 'get'),
+    ('delete_profile_picture', 'student', 2, 'get'),
+    ('create_faculty', 'hod', 2, 'get'),
+    ('roster_import', 'hod', 2, 'get'),
+    ('roster_import_status', 'hod', 2, 'get'),
+    ('user_list', 'hod', 6, 'get'),
+    ('edit_user', 'hod', 3, 'get'),
+    ('delete_user', 'hod', 3, 'get'),
+    ('toggle_user_status', 'hod', 4, 'get'),
+    ('logout', 'student', 4, 'get'),
+]
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every users page stays within its query budget on a large dataset."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hod = seed_dataset()
+        cls.faculty = CustomUser.objects.get(username='faculty0')
+        cls.student = CustomUser.objects.get(username='student0')
+        cls.other_student = CustomUser.objects.get(username='student1')
+
+    def url(self, name):
+        if name == 'verify_email':
+            return reverse('users:verify_email', args=[self.other_student.email_verification_token])
+        if name == 'roster_import_status':
+            return reverse('users:roster_import_status', args=['finished-long-ago'])
+        if name in ('edit_user', 'delete_user', 'toggle_user_status'):
+            return reverse(f'users:{name}', args=[self.other_student.pk])
+        return reverse(f'users:{name}')
+
+    def test_query_budgets(self):
+        for name, who, budget, method in QUERY_BUDGETS:
+            with self.subTest(url=name, user=who):
+                cache.clear()
+                self.client.logout()
+                if who:
+                    self.client.force_login(getattr(self, who))
+                self.assertQueryBudget(budget, self.url(name), method)
+
+    def test_every_url_has_a_budget(self):
+        self.assertCoversUrls(urls.urlpatterns, [name for name, *_ in QUERY_BUDGETS])
+
+
+class DashboardCacheTests(QueryBudgetMixin, TestCase):
+    """Warm dashboards only load the session (and a student's attempts); writes show up on the next load."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hod = seed_dataset()
+        cls.faculty = CustomUser.objects.get(username='faculty0')
+        cls.student = CustomUser.objects.get(username='student0')
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(CACHE_IS_SHARED=True)
+    def test_warm_dashboards(self):
+        for who, budget in (('hod', 1), ('faculty', 1), ('student', 2)):  # student: results of attempted quizzes
+            with self.subTest(user=who):
+                self.client.force_login(getattr(self, who))
+                self.client.get(reverse('users:dashboard'))
+                self.assertQueryBudget(budget, reverse('users:dashboard'))
+
+    def test_news_invalidates_announcements(self):
+        self.client.force_login(self.student)
+        self.client.get(reverse('users:dashboard'))
+        News.objects.create(title='Exam hall changed', content='Room 4', created_by=self.hod)
+        self.assertContains(self.client.get(reverse('users:dashboard')), 'Exam hall changed')
+
+    def test_new_result_invalidates_student_and_creator(self):
+        quiz = self.faculty.created_quizzes.exclude(result__user=self.student).first()
+        for user in (self.student, self.faculty):
+            self.client.force_login(user)
+            self.client.get(reverse('users:dashboard'))
+        Result.objects.create(user=self.student, quiz=quiz, score=100, passed=True, answers=b'')
+
+        self.client.force_login(self.student)
+        own = self.client.get(reverse('users:dashboard')).context['user_results']
+        self.assertEqual(own[0].quiz_id, quiz.pk)
+        self.client.force_login(self.faculty)
+        results = self.client.get(reverse('users:dashboard')).context['student_results']
+        self.assertEqual((results[0].user_id, results[0].quiz_id), (self.student.pk, quiz.pk))
+
+
+    @override_settings(CACHE_IS_SHARED=False)
+    def test_results_from_another_process_show_without_a_shared_cache(self):
+        quiz = self.faculty.created_quizzes.exclude(result__user=self.student).first()
+        Quiz.objects.filter(pk=quiz.pk).update(created_at=timezone.now())  # among the student's latest quizzes
+        cache.clear()
+        for user in (self.student, self.faculty, self.hod):
+            self.client.force_login(user)
+            self.client.get(reverse('users:dashboard'))
+        # As the grading worker writes them: no signal reaches this process's cache
+        result, = Result.objects.bulk_create([Result(user=self.student, quiz=quiz, score=100, passed=True, answers=b'')])
+
+        self.client.force_login(self.student)
+        response = self.client.get(reverse('users:dashboard'))
+        self.assertEqual(response.context['user_results'][0].quiz_id, quiz.pk)
+        self.assertEqual(
+            next(shown for shown in response.context['upcoming_quizzes'] if shown.pk == quiz.pk).user_results, result,
+        )
+        self.client.force_login(self.faculty)
+        self.assertEqual(self.client.get(reverse('users:dashboard')).context['student_results'][0].quiz_id, quiz.pk)
+        self.client.force_login(self.hod)
+        self.assertEqual(self.client.get(reverse('users:dashboard')).context['recent_results'][0].quiz_id, quiz.pk)
+
+
+class IdentityLookupTests(TestCase):
+    """Logins match username or email in any case, in one indexed query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username='Asha', email='Asha.Rao@Example.com', password='exam-day-1', is_email_verified=True,
+        )
+
+    def test_username_or_email_in_any_case(self):
+        for identity in ('asha', 'ASHA', 'asha.rao@example.com', 'ASHA.RAO@EXAMPLE.COM'):
+            with self.subTest(identity=identity), self.assertNumQueries(1):
+                self.assertEqual(authenticate(username=identity, password='exam-day-1'), self.user)
+
+    def test_username_wins_over_another_users_email(self):
+        other = CustomUser.objects.create_user(username='asha.rao@example.com', email='other@example.com',
+                                               password='exam-day-2')
+        self.assertEqual(authenticate(username='Asha.Rao@example.com', password='exam-day-2'), other)
+
+    def test_non_ascii_identities_typed_exactly(self):
+        # SQLite's LOWER() leaves non-ASCII letters alone, so both sides must be lowered by the database
+        emile = CustomUser.objects.create_user(username='Émile', email='ZOË@Example.com', password='exam-day-3')
+        for identity in ('Émile', 'ZOË@Example.com', 'ZOË@EXAMPLE.COM'):
+            with self.subTest(identity=identity):
+                self.assertEqual(find_by_identity(identity), emile)
+                self.assertEqual(authenticate(username=identity, password='exam-day-3'), emile)
+
+    def test_username_wins_with_non_ascii_identities(self):
+        CustomUser.objects.create_user(username='zoë', email='Émile@example.com', password='!')
+        other = CustomUser.objects.create_user(username='Émile@example.com', email='zoe@example.com', password='!')
+        self.assertEqual(find_by_identity('Émile@Example.com'), other)
+
+    def test_case_variants_are_duplicates(self):
+        duplicate = CustomUser(username='ASHA', email='asha.RAO@example.com', password='!')
+        with self.assertRaises(ValidationError) as raised:
+            duplicate.full_clean()
+        self.assertEqual(
+            sorted(raised.exception.messages),
+            ['A user with that email already exists.', 'A user with that username already exists.'],
+        )
+
+    def test_migration_reports_existing_case_duplicates(self):
+        migration = import_module('users.migrations.0003_case_insensitive_identity')
+        migration.check_case_duplicates(apps, None)  # nothing to report
+        with connection.cursor() as cursor:
+            # Recreate a database from before the constraint (rolled back with the test)
+            cursor.execute('DROP INDEX users_customuser_username_lower_uniq')
+        CustomUser.objects.create(username='ASHA', email='asha2@example.com', password='!')
+        with self.assertRaisesMessage(RuntimeError, 'username: Asha, ASHA'):
+            migration.check_case_duplicates(apps, None)
+
+
+class PasswordHashingTests(TestCase):
+    """Logins hash inside a bounded number of slots and are shed with 503 when they run out."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            username='ravi', email='ravi@example.com', is_email_verified=True,
+            password=make_password('exam-day-1', hasher='pbkdf2_sha256'),
+        )
+
+    def login(self):
+        # Every login outcome is logged; capture it instead of printing it
+        with self.assertLogs('users.views', 'INFO'):
+            return self.client.post(reverse('users:login'), {'username': 'ravi', 'password': 'exam-day-1'})
+
+    @override_settings(PASSWORD_HASHING_SLOTS=1, PASSWORD_HASHING_QUEUE=0)
+    def test_full_gate_sheds_login(self):
+        with hashing_slot(), self.assertLogs('django.request', 'ERROR'):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertEqual(self.login().status_code, 302)
+
+    @override_settings(PASSWORD_HASHING_SLOTS=1, PASSWORD_HASHING_QUEUE=0)
+    def test_full_gate_sheds_admin_login(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(is_staff=True, is_superuser=True)
+        with hashing_slot(), self.assertLogs('django.request', 'ERROR'), self.assertLogs('users.middleware', 'WARNING'):
+            response = self.client.post(reverse('admin:login'), {'username': 'ravi', 'password': 'exam-day-1'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        response = self.client.post(reverse('admin:login'), {'username': 'ravi', 'password': 'exam-day-1'})
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(PASSWORD_HASHING_SLOTS=1, PASSWORD_HASHING_QUEUE=1, PASSWORD_HASHING_WAIT_SECONDS=0.05)
+    def test_queued_login_gives_up_after_the_wait(self):
+        with hashing_slot():
+            with self.assertRaises(HashingBusy):
+                authenticate(username='ravi', password='exam-day-1')
+        self.assertEqual(get_gate().queued, 0)
+
+    def test_login_rehashes_with_the_preferred_hasher(self):
+        self.assertEqual(self.login().status_code, 302)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+        self.assertTrue(self.user.check_password('exam-day-1'))
+
+
+@override_settings(CACHE_IS_SHARED=True)
+class UserCacheTests(TestCase):
+    """request.user comes from the per-process cache until the user changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hod = CustomUser.objects.create(username='hod', email='hod@example.com', role='HOD')
+        cls.student = CustomUser.objects.create(username='meera', email='meera@example.com', is_email_verified=True)
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.client.force_login(self.student)
+
+    def test_warm_request_skips_the_users_table(self):
+        self.client.get(reverse('users:profile'))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('users:profile')).status_code, 200)
+        self.assertFalse([query for query in queries if 'users_customuser' in query['sql']])
+
+    def test_deactivation_logs_the_user_out(self):
+        self.client.get(reverse('users:profile'))
+        hod = Client()
+        hod.force_login(self.hod)
+        with self.captureOnCommitCallbacks(execute=True):
+            hod.get(reverse('users:toggle_user_status', args=[self.student.pk]))
+        self.assertFalse(self.client.get(reverse('users:profile')).wsgi_request.user.is_authenticated)
+
+    def test_role_edit_is_seen_on_the_next_request(self):
+        self.client.get(reverse('users:profile'))
+        CustomUser.objects.filter(pk=self.student.pk).update(role='FACULTY')
+        self.assertEqual(self.client.get(reverse('users:profile')).wsgi_request.user.role, 'STUDENT')
+        self.student.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.save()
+        self.assertEqual(self.client.get(reverse('users:profile')).wsgi_request.user.role, 'FACULTY')
+
+    def test_tokens_are_dropped_only_after_commit(self):
+        self.client.get(reverse('users:profile'))
+        with self.captureOnCommitCallbacks() as callbacks:
+            CustomUser.objects.filter(pk=self.student.pk).update(role='FACULTY')
+            forget_users([self.student.pk])
+            # Not committed yet: other processes would still read the old row
+            self.assertEqual(self.client.get(reverse('users:profile')).wsgi_request.user.role, 'STUDENT')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(reverse('users:profile')).wsgi_request.user.role, 'FACULTY')
+
+    @override_settings(CACHE_IS_SHARED=False)
+    def test_per_process_cache_is_not_used(self):
+        self.client.get(reverse('users:profile'))
+        CustomUser.objects.filter(pk=self.student.pk).update(is_active=False)
+        self.assertFalse(self.client.get(reverse('users:profile')).wsgi_request.user.is_authenticated)
+
+    def test_in_place_changes_do_not_leak_into_the_cache(self):
+        first = user_cache.get(self.student.pk, lambda pk: CustomUser.objects.get(pk=pk))
+        first.role = 'HOD'
+        self.assertEqual(user_cache.get(self.student.pk, lambda pk: None).role, 'STUDENT')
+
+    def test_least_recently_used_is_evicted(self):
+        users = UserCache(size=2)
+        loads = []
+
+        def load(pk):
+            loads.append(pk)
+            return CustomUser(pk=pk)
+
+        for pk in (1, 2, 1, 3, 1, 2):
+            users.get(pk, load)
+        self.assertEqual(loads, [1, 2, 3, 2])
+
+
+def roster_csv(*rows, header='username,email,password,first_name,department'):
+    return io.BytesIO('\n'.join((header,) + rows).encode())
+
+
+def roster_xlsx(rows):
+    """A minimal workbook the way spreadsheet programs write it: shared strings and numeric cells."""
+    strings = sorted({value for row in rows for value in row if isinstance(value, str)})
+    cells = ''.join(
+        f'<row r="{number}">' + ''.join(
+            f'<c r="{chr(65 + column)}{number}" t="s"><v>{strings.index(value)}</v></c>' if isinstance(value, str)
+            else f'<c r="{chr(65 + column)}{number}"><v>{value}</v></c>'
+            for column, value in enumerate(row)
+        ) + '</row>'
+        for number, row in enumerate(rows, 1)
+    )
+    namespace = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    binary = io.BytesIO()
+    with zipfile.ZipFile(binary, 'w') as workbook:
+        workbook.writestr('xl/sharedStrings.xml', f'<sst {namespace}>'
+                          + ''.join(f'<si><t>{value}</t></si>' for value in strings) + '</sst>')
+        workbook.writestr('xl/worksheets/sheet1.xml', f'<worksheet {namespace}><sheetData>{cells}</sheetData></worksheet>')
+    binary.seek(0)
+    return binary
+
+
+@override_settings(ROSTER_HASH_WORKERS=0, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class RosterImportTests(TestCase):
+    """Roster files become inactive student accounts, or nothing at all."""
+
+    @classmethod
+    def setUpTestData(cls):
+        CustomUser.objects.create(username='Kiran', email='kiran@example.com')
+
+    def test_creates_inactive_students_and_emails_them(self):
+        roster = roster_csv('anu,anu@example.com,Blue-Lotus-42,Anu,', 'bala,Bala@Example.com,Red-Cedar-77,Bala,Physics')
+        with self.assertNumQueries(5):  # taken identities, savepoint, insert students, insert emails, release
+            report = import_roster(roster, 'csv', department='Mathematics', base_url='https://exams.example.edu/')
+
+        self.assertEqual((report.created, report.emails_queued, report.error_count), (2, 2, 0))
+        self.assertEqual(mail.outbox, [])
+        process_outbox()
+        anu, bala = CustomUser.objects.filter(username__in=['anu', 'bala']).order_by('username')
+        self.assertEqual((anu.department, bala.department, bala.email), ('Mathematics', 'Physics', 'Bala@example.com'))
+        self.assertFalse(anu.is_active or anu.is_email_verified)
+        self.assertTrue(anu.password.startswith('scrypt$2048$'))
+        self.assertEqual([message.to for message in mail.outbox], [['anu@example.com'], ['Bala@example.com']])
+        self.assertIn(f'https://exams.example.edu/verify-email/{anu.email_verification_token}/', mail.outbox[0].body)
+
+    def test_first_login_rehashes_at_full_cost(self):
+        import_roster(roster_csv('anu,anu@example.com,Blue-Lotus-42,Anu,'), 'csv')
+        CustomUser.objects.filter(username='anu').update(is_active=True, is_email_verified=True)
+        with self.assertLogs('users.views', 'INFO'):
+            self.client.post(reverse('users:login'), {'username': 'anu', 'password': 'Blue-Lotus-42'})
+        self.assertTrue(CustomUser.objects.get(username='anu').password.startswith('scrypt$16384$'))
+
+    def test_reports_every_problem_and_creates_nothing(self):
+        report = import_roster(roster_csv(
+            'anu,anu@example.com,Blue-Lotus-42,,',
+            'ANU,anu2@example.com,Red-Cedar-77,,',
+            'kiran,kiran2@example.com,Red-Cedar-77,,',
+            'dev,not-an-email,Red-Cedar-77,,',
+            'esha,esha@example.com,12345678,,',
+        ), 'csv')
+        self.assertEqual(report.created, 0)
+        self.assertEqual([line for line, _ in report.errors], [3, 4, 5, 6])
+        self.assertIn('also on line 2', report.errors[0][1])
+        self.assertIn('Kiran already has an account', report.errors[1][1])
+        self.assertIn('email: Enter a valid email address.', report.errors[2][1])
+        self.assertIn('password:', report.errors[3][1])
+        self.assertFalse(CustomUser.objects.filter(username='anu').exists())
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_non_ascii_account_already_taken(self):
+        # Reported as a row error, not as a clash on insert that importing again cannot get past
+        CustomUser.objects.create(username='Émile', email='emile@example.com')
+        report = import_roster(roster_csv('Émile,emile2@example.com,Blue-Lotus-42,,'), 'csv')
+        self.assertEqual(report.errors, [(2, 'username: Émile already has an account.')])
+
+    def test_missing_columns(self):
+        report = import_roster(roster_csv('anu,anu@example.com', header='username,email'), 'csv')
+        self.assertEqual(report.errors, [(1, 'Missing column(s): password')])
+
+    def test_xlsx(self):
+        report = import_roster(roster_xlsx([
+            ['Username', 'Email', 'Password', 'Roll Number'],
+            [2026001, 'a2026001@example.com', 'Blue-Lotus-42', 17],
+        ]), 'xlsx')
+        self.assertEqual((report.created, report.error_count), (1, 0))
+        self.assertTrue(CustomUser.objects.filter(username='2026001').exists())
+
+    def test_damaged_xlsx_cell_is_a_row_error(self):
+        roster = roster_xlsx([
+            ['Username', 'Email', 'Password'],
+            ['anu', 'anu@example.com', 'Blue-Lotus-42'],
+            ['bala', 'bala@example.com', 'Red-Cedar-77'],
+        ])
+        damaged = io.BytesIO()
+        with zipfile.ZipFile(roster) as source, zipfile.ZipFile(damaged, 'w') as target:
+            for name in source.namelist():
+                content = source.read(name)
+                if name == 'xl/worksheets/sheet1.xml':
+                    # Line 3's username points past the shared strings
+                    content = content.replace(b'<c r="A3" t="s"><v>', b'<c r="A3" t="s"><v>99')
+                target.writestr(name, content)
+        damaged.seek(0)
+        report = import_roster(damaged, 'xlsx')
+        self.assertEqual(report.errors, [(3, 'This row has a damaged cell and could not be read.')])
+        self.assertFalse(CustomUser.objects.filter(username='anu').exists())
+
+    def test_job_progress_survives_a_cache_clear(self):
+        hod = CustomUser.objects.create_user(username='hod', password='Blue-Lotus-42', role='HOD')
+        job = RosterImportJob.objects.create(user=hod)
+        _update_job(job.pk, stage='hashing', done=200, total=450)
+        cache.clear()
+        self.client.force_login(hod)
+        response = self.client.get(reverse('users:roster_import_status', args=[job.pk]))
+        self.assertContains(response, 'Setting passwords: 200 of 450')
+
+        RosterImportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=2))
+        response = self.client.get(reverse('users:roster_import_status', args=[job.pk]))
+        self.assertContains(response, 'The import stopped unexpectedly')
+
+    @override_settings(ROSTER_HASH_WORKERS=2)
+    def test_hashes_in_a_process_pool(self):
+        rows = [f'student{i},student{i}@example.com,Blue-Lotus-{i:03d},,' for i in range(450)]
+        self.assertEqual(import_roster(roster_csv(*rows), 'csv').created, 450)
+        self.assertTrue(CustomUser.objects.get(username='student449').check_password('Blue-Lotus-449'))
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """The test outbox, counting connections and refusing the addresses in `refused`."""
+    opened = 0
+    refused = set()
+    unreachable = False
+
+    def open(self):
+        if FlakyEmailBackend.unreachable:
+            raise ConnectionRefusedError('Connection refused')
+        FlakyEmailBackend.opened += 1
+
+    def send_messages(self, messages):
+        for message in messages:
+            if set(message.to) & self.refused:
+                raise smtplib.SMTPRecipientsRefused({message.to[0]: (550, b'No such user')})
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='users.tests.FlakyEmailBackend', EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+                   EMAIL_OUTBOX_RETRY_SECONDS=60, EMAIL_OUTBOX_MAX_RETRY_SECONDS=3600)
+class OutboxTests(TestCase):
+    """Queued email is sent in batches over one connection, retried with backoff and dead-lettered."""
+
+    def setUp(self):
+        FlakyEmailBackend.opened = 0
+        FlakyEmailBackend.refused = set()
+        FlakyEmailBackend.unreachable = False
+
+    def queue(self, *addresses):
+        for address in addresses:
+            queue_email(address, 'Exam schedule', '<p>Monday 9am</p>')
+
+    def make_due(self):
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+
+    def test_sends_a_batch_over_one_connection(self):
+        self.queue('a@example.com', 'b@example.com', 'c@example.com')
+        self.assertEqual(process_outbox(), (3, 0))
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+        self.assertEqual([message.to for message in mail.outbox],
+                         [['a@example.com'], ['b@example.com'], ['c@example.com']])
+        self.assertEqual(mail.outbox[0].body, 'Monday 9am')
+        self.assertEqual(mail.outbox[0].alternatives[0].content, '<p>Monday 9am</p>')
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_failure_is_retried_with_exponential_backoff(self):
+        FlakyEmailBackend.refused = {'bad@example.com'}
+        self.queue('a@example.com', 'bad@example.com', 'c@example.com')
+        started = timezone.now()
+        self.assertEqual(process_outbox(), (2, 1))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(FlakyEmailBackend.opened, 2)  # reconnected after the failure
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.to, message.attempts, message.status), ('bad@example.com', 1, 'queued'))
+        self.assertIn('SMTPRecipientsRefused', message.last_error)
+        self.assertAlmostEqual((message.next_attempt_at - started).total_seconds(), 60, delta=5)
+        self.assertEqual(process_outbox(), (0, 0))  # not due yet
+
+        self.make_due()
+        started = timezone.now()
+        self.assertEqual(process_outbox(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 2)
+        self.assertAlmostEqual((message.next_attempt_at - started).total_seconds(), 120, delta=5)
+
+        FlakyEmailBackend.refused = set()
+        self.make_due()
+        self.assertEqual(process_outbox(), (1, 0))
+        self.assertEqual(mail.outbox[-1].to, ['bad@example.com'])
+
+    def test_dead_letters_after_the_last_attempt(self):
+        FlakyEmailBackend.refused = {'bad@example.com'}
+        self.queue('bad@example.com')
+        for _ in range(2):
+            process_outbox()
+            self.make_due()
+        with self.assertLogs('users.outbox', 'ERROR'):
+            process_outbox()
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), ('dead', 3))
+        self.make_due()
+        self.assertEqual(process_outbox(), (0, 0))
+
+    def test_unreachable_server_reschedules_the_batch(self):
+        FlakyEmailBackend.unreachable = True
+        self.queue('a@example.com', 'b@example.com')
+        with self.assertLogs('users.outbox', 'WARNING'):
+            self.assertEqual(process_outbox(), (0, 2))
+        self.assertEqual(list(OutboxMessage.objects.values_list('attempts', flat=True)), [0, 0])
+        self.assertIn('ConnectionRefusedError', OutboxMessage.objects.first().last_error)
+
+        FlakyEmailBackend.unreachable = False
+        self.make_due()
+        self.assertEqual(process_outbox(), (2, 0))
+
+    def test_an_outage_never_dead_letters(self):
+        FlakyEmailBackend.unreachable = True
+        self.queue('a@example.com')
+        with self.assertLogs('users.outbox', 'WARNING') as logs:
+            for _ in range(5):
+                process_outbox()
+                self.make_due()
+        self.assertNotIn('ERROR', ' '.join(logs.output))
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), ('queued', 0))
+
+    def test_expired_claims_are_taken_over(self):
+        self.queue('a@example.com')
+        OutboxMessage.objects.update(claimed_at=timezone.now())
+        self.assertEqual(process_outbox(), (0, 0))  # another worker holds it
+        OutboxMessage.objects.update(claimed_at=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(process_outbox(), (1, 0))
+
+    def test_register_queues_the_verification_email(self):
+        response = self.client.post(reverse('users:register'), {
+            'username': 'nila', 'email': 'nila@example.com', 'password1': 'Blue-Lotus-42',
+            'password2': 'Blue-Lotus-42', 'role': 'STUDENT', 'department': 'Physics',
+        })
+        self.assertRedirects(response, reverse('users:login'), fetch_redirect_response=False)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(FlakyEmailBackend.opened, 0)
+
+        call_command('send_outbox', '--once', stdout=io.StringIO())
+        nila = CustomUser.objects.get(username='nila')
+        self.assertEqual(mail.outbox[0].to, ['nila@example.com'])
+        self.assertIn(f'http://testserver/verify-email/{nila.email_verification_token}/', mail.outbox[0].body)
@@ -20,6 +20,8 @@ urlpatterns = [
 
     # HOD management URLs
     path('create-faculty/', views.create_faculty, name='create_faculty'),
+    path('users/import/', views.roster_import, name='roster_import'),
+    path('users/import/<str:job_id>/', views.roster_import_status, name='roster_import_status'),
     path('users/', views.user_list, name='user_list'),
     path('users/<int:user_id>/edit/', views.edit_user, name='edit_user'),
     path('users/<int:user_id>/delete/', views.delete_user, name='delete_user'),
@@ -0,0 +1,95 @@
+"""
+Per-process cache of the logged-in user.
+
+AuthenticationMiddleware loads request.user through the backend's get_user()
+on every request. When the cache is shared between workers
+(settings.CACHE_IS_SHARED), the backend serves it from a bounded LRU of user
+objects in each process instead of the users table. Every user has a version
+token in the shared cache ("users:version:<id>"). A cached object is only
+used while its token is still current, so an invalidation in one process
+reaches every worker. The common path is one cache read and no query.
+Without a shared cache a token dropped in one process would not reach the
+others, which could keep a deactivated user logged in there, so every
+request loads the user from the database instead.
+
+Tokens are dropped by post_save / post_delete of CustomUser, which covers
+password changes, role edits, activation and profile updates, and by
+forget_users() after queryset updates, which send no signals. They are
+dropped once the change is committed, so no process can reload the old row
+under the new token. A missing token is replaced by a new random one, so an
+evicted or expired token can only cause a reload, never a stale hit.
+"""
+import copy
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CustomUser
+
+
+def _version_key(user_id):
+    return f'users:version:{user_id}'
+
+
+def current_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def forget_users(user_ids):
+    """Make every process reload these users on their next request, once the current transaction commits."""
+    keys = [_version_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class UserCache:
+    """A thread-safe LRU of user objects, each stored with the version token it was loaded under."""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, load):
+        """The user with this id, from the cache or from load(user_id); None if there is none."""
+        version = current_version(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(user_id)
+                user = entry[1]
+            else:
+                user = None
+        if user is None:
+            user = load(user_id)
+            if user is None:
+                return None
+            with self._lock:
+                self._entries[user_id] = (version, user)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        # Views change request.user in place (forms, profile edits); keep the cached object clean
+        return copy.copy(user)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(settings.USER_CACHE_SIZE)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def _user_changed(sender, instance, **kwargs):
+    forget_users([instance.pk])
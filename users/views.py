@@ -3,21 +3,24 @@ from django.contrib import messages
 from django.contrib.auth import login, logout, authenticate, update_session_auth_hash
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
-from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponseRedirect
 
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+from django.db import transaction
 
-from .forms import CustomUserCreationForm, UserProfileForm, CustomPasswordChangeForm
+from .forms import CustomUserCreationForm, UserProfileForm, CustomPasswordChangeForm, RosterImportForm
 from .models import CustomUser
-from exams.models import Result, Quiz
-from materials.models import News
+from .dashboard import dashboard_context
+from .hashing import HashingBusy
+from .outbox import verification_email
+from .roster import roster_job, start_roster_import
 
+import logging
+import tempfile
 import uuid
 
+logger = logging.getLogger(__name__)
+
 
 
 def home(request):
@@ -38,35 +41,12 @@ def register(request):
             user = form.save(commit=False)
             user.is_active = False  # Deactivate until email is verified
             # email_verification_token should be auto-set by model default
-            user.save()
-
-            # Send verification email
-            try:
-                verify_url = request.build_absolute_uri(
-                    reverse('users:verify_email', args=[str(user.email_verification_token)])
-                )
-
-                subject = "Verify your email - College Exam Portal"
-                # Render modern HTML template
-                html_content = render_to_string('users/verify_email.html', {
-                    'username': user.username,
-                    'verify_url': verify_url,
-                })
-                text_content = strip_tags(html_content)  # Plain text fallback
-
-                email = EmailMultiAlternatives(
-                    subject=subject,
-                    body=text_content,
-                    from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', settings.EMAIL_HOST_USER),
-                    to=[user.email],
-                )
-                email.attach_alternative(html_content, "text/html")
-                email.send()
-
-                messages.success(request, 'Registration successful 🎉. Please check your email to verify your account.')
-            except Exception as e:
-                messages.warning(request, f'Registered, but failed to send verification email: {e}')
+            with transaction.atomic():
+                user.save()
+                # Sent by the send_outbox worker, so a slow mail server cannot hold up the request
+                verification_email(user, request.build_absolute_uri('/')).save()
 
+            messages.success(request, 'Registration successful 🎉. Please check your email to verify your account.')
             return redirect('users:login')
     else:
         form = CustomUserCreationForm()
@@ -87,36 +67,29 @@ def login_view(request):
         username = request.POST.get('username')
         password = request.POST.get('password')
         
-        # Debug: Check if credentials are received
-        print(f"Login attempt - Username/Email: {username}, Password received: {bool(password)}")
-        
-        # Check if user exists by username or email
         try:
-            from django.db.models import Q
-            user_exists = CustomUser.objects.filter(
-                Q(username__iexact=username) | Q(email__iexact=username)
-            ).first()
-            if user_exists:
-                print(f"User found: {user_exists.username}, Email: {user_exists.email}, Active: {user_exists.is_active}, Email verified: {user_exists.is_email_verified}")
-            else:
-                print("No user found with this username/email")
-        except Exception as e:
-            print(f"Error checking user: {e}")
-        
-        user = authenticate(request, username=username, password=password)
-        
+            user = authenticate(request, username=username, password=password)
+        except HashingBusy as busy:
+            # Shed the login quickly instead of tying up a worker behind the queue
+            logger.warning('Login shed', extra={'event': 'login', 'outcome': 'busy'})
+            messages.error(request, 'Too many people are logging in right now. Please try again in a few seconds.')
+            response = render(request, 'users/login.html', status=503)
+            response['Retry-After'] = str(busy.retry_after)
+            return response
+
         if user is not None:
-            print(f"User authenticated: {user.username}, Active: {user.is_active}, Email verified: {user.is_email_verified}")
-            
             # Check if user is active and email is verified
             if not user.is_active:
+                logger.info('Login refused', extra={'event': 'login', 'outcome': 'inactive', 'user_id': user.pk})
                 messages.error(request, 'Your account is not active. Please verify your email.')
                 return render(request, 'users/login.html')
             elif not user.is_email_verified:
+                logger.info('Login refused', extra={'event': 'login', 'outcome': 'unverified', 'user_id': user.pk})
                 messages.error(request, 'Please verify your email before logging in.')
                 return render(request, 'users/login.html')
             else:
                 login(request, user)
+                logger.info('Login', extra={'event': 'login', 'outcome': 'success', 'user_id': user.pk})
                 messages.success(request, f'Welcome back, {user.username}!')
                 
                 # Handle next parameter for redirect after login
@@ -128,7 +101,7 @@ def login_view(request):
                 
                 return redirect('users:dashboard')
         else:
-            print("Authentication failed")
+            logger.info('Login failed', extra={'event': 'login', 'outcome': 'failed', 'login': username})
             messages.error(request, 'Invalid username/email or password.')
 
     return render(request, 'users/login.html')
@@ -182,47 +155,8 @@ def dashboard(request):
     """
     Display dashboard based on user role.
     """
-    role = (request.user.role or '').upper()
-    print(f"Dashboard access - User: {request.user.username}, Role: {role}")
-    
     template_name = f'users/dashboard_{request.user.role.lower()}.html'
-    context = {'user': request.user}
-
-    if role == 'HOD':
-        context.update({
-            'faculty_count': CustomUser.objects.filter(role='FACULTY').count(),
-            'student_count': CustomUser.objects.filter(role='STUDENT').count(),
-            'quiz_count': Quiz.objects.count(),
-            'recent_results': Result.objects.order_by('-completed_at')[:10],
-            'announcements': News.objects.order_by('-created_at')[:10],
-        })
-    elif role == 'FACULTY':
-        from materials.models import StudyMaterial
-        context.update({
-            'created_quizzes': request.user.created_quizzes.order_by('-created_at')[:10],
-            'student_results': Result.objects.filter(quiz__creator=request.user).order_by('-completed_at')[:20],
-            'materials': StudyMaterial.objects.filter(uploaded_by=request.user).order_by('-created_at')[:10],
-            'announcements': News.objects.order_by('-created_at')[:10],
-        })
-    elif role == 'STUDENT':
-        from materials.models import StudyMaterial
-        
-        # Get upcoming quizzes with completion status
-        upcoming_quizzes = Quiz.objects.order_by('-created_at')[:10]
-        for quiz in upcoming_quizzes:
-            try:
-                quiz.user_results = Result.objects.get(user=request.user, quiz=quiz)
-            except Result.DoesNotExist:
-                quiz.user_results = None
-        
-        context.update({
-            'upcoming_quizzes': upcoming_quizzes,
-            'materials': StudyMaterial.objects.order_by('-created_at')[:10],
-            'user_results': Result.objects.filter(user=request.user).order_by('-completed_at')[:10],
-            'announcements': News.objects.order_by('-created_at')[:10],
-        })
-
-    return render(request, template_name, context)
+    return render(request, template_name, dashboard_context(request.user))
 
 
 
@@ -243,34 +177,13 @@ def create_faculty(request):
             user.role = 'FACULTY'
             user.is_active = False  # Faculty will activate after email verification
             user.is_email_verified = False  
-            user.save()
-
-            # Send verification email
-            try:
-                verify_url = request.build_absolute_uri(
-                    reverse('users:verify_email', args=[str(user.email_verification_token)])
-                )
-
-                subject = "Faculty Account - Verify your email"
-                html_content = render_to_string('users/verify_email.html', {
-                    'username': user.username,
-                    'verify_url': verify_url,
-                })
-                text_content = strip_tags(html_content)
-
-                email = EmailMultiAlternatives(
-                    subject=subject,
-                    body=text_content,
-                    from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', settings.EMAIL_HOST_USER),
-                    to=[user.email],
-                )
-                email.attach_alternative(html_content, "text/html")
-                email.send()
-
-                messages.success(request, 'Faculty account created. Verification email sent ✅.')
-            except Exception as e:
-                messages.warning(request, f'Faculty created but failed to send email: {e}')
+            with transaction.atomic():
+                user.save()
+                verification_email(
+                    user, request.build_absolute_uri('/'), subject="Faculty Account - Verify your email",
+                ).save()
 
+            messages.success(request, 'Faculty account created. Verification email queued ✅.')
             return redirect('users:user_list')
     else:
         form = CustomUserCreationForm(initial={'role': 'FACULTY'})
@@ -395,6 +308,50 @@ def user_list(request):
     
     return render(request, 'users/user_list.html', context)
 
+@login_required
+def roster_import(request):
+    """
+    Allow HOD to create student accounts from a CSV or XLSX roster.
+    """
+    if request.user.role != 'HOD':
+        messages.error(request, 'Unauthorized access.')
+        return redirect('users:access_denied')
+
+    if request.method == 'POST':
+        form = RosterImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            # The import outlives the request, and with it the uploaded file
+            with tempfile.NamedTemporaryFile(suffix='.roster', delete=False) as copy:
+                for chunk in upload.chunks():
+                    copy.write(chunk)
+            job_id = start_roster_import(
+                copy.name, form.cleaned_data['file_format'], form.cleaned_data['department'],
+                request.build_absolute_uri('/'), request.user.pk,
+            )
+            return redirect('users:roster_import_status', job_id=job_id)
+    else:
+        form = RosterImportForm()
+
+    return render(request, 'users/roster_import.html', {'form': form})
+
+
+@login_required
+def roster_import_status(request, job_id):
+    """
+    Progress and outcome of a roster import.
+    """
+    if request.user.role != 'HOD':
+        messages.error(request, 'Unauthorized access.')
+        return redirect('users:access_denied')
+
+    job = roster_job(job_id)
+    if job is None or job['user_id'] != request.user.pk:
+        messages.error(request, 'That import has finished too long ago or does not exist.')
+        return redirect('users:roster_import')
+    return render(request, 'users/roster_import_status.html', {'job': job, 'report': job.get('report')})
+
+
 @login_required
 def profile(request):
     """Display user profile"""